@@ -0,0 +1,79 @@
+import argparse
+import sys
+import os
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from pcnrec.utils.io import load_config, load_parquet, load_pickle
+from pcnrec.utils.logging import setup_logger
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.data.interaction_index import InteractionIndex
+
+logger = setup_logger("bench_candidate_scoring")
+
+def legacy_topk(model, seen_items, user_ids, num_items, top_k):
+    """
+    The original per-user path: one model.predict call per user with a repeated user-id array.
+    """
+    all_items = np.arange(num_items)
+    out = []
+    for user_id in user_ids:
+        user_ids_repeated = np.full(len(all_items), user_id, dtype=np.int32)
+        scores = model.predict(user_ids_repeated, all_items, num_threads=1)
+        if user_id in seen_items:
+            scores[list(seen_items[user_id])] = -np.inf
+        top = np.argpartition(scores, -top_k)[-top_k:]
+        out.append(top[np.argsort(-scores[top])])
+    return np.array(out)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--run_id", required=True)
+    parser.add_argument("--max_users", type=int, default=500, help="Users to score on each path")
+    parser.add_argument("--batch_size", type=int, default=1000)
+    parser.add_argument("--num_threads", type=int, default=None, help="Default: candidates.num_threads")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    output_dir = os.path.join(config['dataset']['output_dir'], args.run_id)
+    data_dir = os.path.join(output_dir, "data")
+
+    train_df = load_parquet(os.path.join(data_dir, "interactions_train.parquet"))
+    model = load_pickle(os.path.join(output_dir, "models", "lightfm.pkl"))
+
+    num_threads = args.num_threads or config['candidates'].get('num_threads', 1)
+    top_k = config['candidates']['top_k']
+
+    scorer = EmbeddingScorer.from_lightfm(model, num_threads=num_threads)
+    num_items = scorer.num_items
+    users = np.arange(min(args.max_users, scorer.num_users))
+
+    # Legacy path
+    seen_items = train_df.groupby('user_idx')['item_idx'].apply(set).to_dict()
+    t0 = time.perf_counter()
+    legacy = legacy_topk(model, seen_items, users, num_items, top_k)
+    legacy_s = time.perf_counter() - t0
+
+    # Batched GEMM path
+    t0 = time.perf_counter()
+    seen = InteractionIndex.from_frame(train_df, num_items=num_items)
+    batched = []
+    for start in range(0, len(users), args.batch_size):
+        top_items, _ = scorer.topk(users[start:start + args.batch_size], top_k, seen=seen)
+        batched.append(top_items)
+    batched = np.concatenate(batched)
+    batched_s = time.perf_counter() - t0
+
+    # Rankings agree up to float32 ties
+    agree = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(legacy, batched)])
+
+    logger.info(f"Users: {len(users)}, items: {num_items}, top_k: {top_k}, threads: {num_threads}")
+    logger.info(f"model.predict loop: {len(users) / legacy_s:,.0f} users/sec ({legacy_s:.2f}s)")
+    logger.info(f"Batched GEMM:       {len(users) / batched_s:,.0f} users/sec ({batched_s:.2f}s)")
+    logger.info(f"Speedup: {legacy_s / batched_s:.1f}x, top-{top_k} overlap: {agree:.4f}")
+
+if __name__ == "__main__":
+    main()
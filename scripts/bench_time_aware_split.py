@@ -0,0 +1,83 @@
+import argparse
+import sys
+import os
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from pcnrec.utils.logging import setup_logger
+from pcnrec.data.splits import time_aware_split
+
+logger = setup_logger("bench_time_aware_split")
+
+def legacy_time_aware_split(df, test_ratio):
+    """
+    The original per-user loop: groupby, slice each group, concat the slices.
+    """
+    df = df.sort_values(['user_idx', 'timestamp'])
+    
+    train_list = []
+    test_list = []
+    
+    for uid, group in df.groupby('user_idx'):
+        n = len(group)
+        n_test = int(n * test_ratio)
+        if n_test < 1 and n > 1:
+            n_test = 1
+        
+        if n_test >= n:
+             n_test = n - 1
+             
+        split_idx = n - n_test
+        
+        train_list.append(group.iloc[:split_idx])
+        test_list.append(group.iloc[split_idx:])
+        
+    return pd.concat(train_list), pd.concat(test_list)
+
+def synthetic_ratings(n_rows, seed=42):
+    """
+    MovieLens-shaped interactions: ~165 ratings per user on average, skewed
+    user activity and item popularity, coarse timestamps (so ties occur).
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(1, n_rows // 165)
+    n_items = max(1, n_rows // 400)
+    return pd.DataFrame({
+        'user_idx': (rng.pareto(1.2, n_rows) * n_users / 20).astype(np.int64) % n_users,
+        'item_idx': (rng.pareto(1.0, n_rows) * n_items / 50).astype(np.int64) % n_items,
+        'rating': rng.integers(1, 6, n_rows).astype(np.float32),
+        'timestamp': rng.integers(0, 10**6, n_rows)
+    })
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="1000000,25000000", help="Comma-separated dataset sizes")
+    parser.add_argument("--test_ratio", type=float, default=0.2)
+    parser.add_argument("--legacy_max_rows", type=int, default=25000000, help="Skip the legacy loop above this size")
+    args = parser.parse_args()
+
+    for n_rows in [int(r) for r in args.rows.split(",")]:
+        df = synthetic_ratings(n_rows)
+        n_users = df['user_idx'].nunique()
+
+        t0 = time.perf_counter()
+        train_df, test_df = time_aware_split(df, args.test_ratio)
+        vec_s = time.perf_counter() - t0
+        logger.info(f"{n_rows:,} rows, {n_users:,} users: vectorized {vec_s:.2f}s")
+
+        if n_rows > args.legacy_max_rows:
+            continue
+
+        t0 = time.perf_counter()
+        legacy_train, legacy_test = legacy_time_aware_split(df, args.test_ratio)
+        legacy_s = time.perf_counter() - t0
+
+        same = legacy_train.equals(train_df) and legacy_test.equals(test_df) \
+            and legacy_train.index.equals(train_df.index) and legacy_test.index.equals(test_df.index)
+        logger.info(f"{n_rows:,} rows: legacy loop {legacy_s:.2f}s, speedup {legacy_s / vec_s:.1f}x, identical: {same}")
+
+if __name__ == "__main__":
+    main()
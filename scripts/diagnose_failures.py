@@ -9,6 +9,8 @@ from collections import Counter
 sys.path.append(os.path.join(os.getcwd(), 'src'))
 from pcnrec.utils.io import load_config, load_parquet
 from pcnrec.analysis.feasibility import check_feasibility
+from pcnrec.candidates.io import load_candidates
+from pcnrec.data.catalog import ItemCatalog
 
 def main():
     parser = argparse.ArgumentParser()
@@ -35,9 +37,10 @@ def main():
                 
     # Load candidates for ground-truth feasibility check
     print(f"Loading candidates from {cand_path}...")
-    cands_df = load_parquet(cand_path)
     # Ensure items metadata for verification re-check if needed
     items_df = load_parquet(items_path)
+    cands_df = load_candidates(cand_path, items_df)
+    catalog = ItemCatalog.from_items_df(items_df)
     if 'item_idx' in items_df.columns:
         items_df = items_df.set_index('item_idx')
 
@@ -58,7 +61,7 @@ def main():
         
         # 1. Check Feasibility (Ground Truth)
         u_cands = cands_df[cands_df['user_idx'] == uid]
-        is_feasible_gt, _ = check_feasibility(u_cands, constraints, top_k=window)
+        is_feasible_gt, _ = check_feasibility(u_cands, constraints, top_k=window, catalog=catalog)
         
         if is_feasible_gt:
             total_feasible += 1
@@ -72,7 +75,8 @@ def main():
             
             if not passed:
                 # This is the target group
-                fail_reasons = verifier_res.get('fail_reasons', ["Unknown failure"])
+                # verify_certificate reports its failures under 'reasons'
+                fail_reasons = (verifier_res or {}).get('reasons') or ["Unknown failure"]
                 repair_used = row.get('repair_used', False) # Might not be tracked in jsonl directly, logic check needed
                 
                 # Check if deterministic repair was attempted?
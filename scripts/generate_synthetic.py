@@ -0,0 +1,44 @@
+import argparse
+import sys
+import os
+import time
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from pcnrec.utils.io import load_config, save_yaml
+from pcnrec.utils.logging import setup_logger
+from pcnrec.data.synthetic import generate_dataset, MAX_GENRES
+
+logger = setup_logger("generate_synthetic")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--run_id", required=True)
+    parser.add_argument("--num_users", type=int, default=None, help="Override synthetic.num_users")
+    parser.add_argument("--num_items", type=int, default=None, help="Override synthetic.num_items")
+    parser.add_argument("--no_candidates", action="store_true", help="Only write data/, not candidates/")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    num_genres = config['synthetic'].get('num_genres', 18)
+    if not 1 <= num_genres <= MAX_GENRES:
+        raise ValueError(f"synthetic.num_genres must be between 1 and {MAX_GENRES}, got {num_genres}")
+    output_dir = os.path.join(config['dataset']['output_dir'], args.run_id)
+
+    start = time.time()
+    stats = generate_dataset(
+        config,
+        output_dir,
+        num_users=args.num_users,
+        num_items=args.num_items,
+        candidates=False if args.no_candidates else None
+    )
+    save_yaml(config, os.path.join(output_dir, "data", "config_resolved.yaml"))
+
+    logger.info(f"Users: {stats['num_users']}, items: {stats['num_items']}, "
+                f"train: {stats['train_interactions']}, test: {stats['test_interactions']}")
+    logger.info(f"Done in {time.time() - start:.1f}s. Outputs in {output_dir}")
+
+if __name__ == "__main__":
+    main()
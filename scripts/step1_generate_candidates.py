@@ -1,12 +1,19 @@
 import argparse
 import sys
 import os
+import json
 
 sys.path.append(os.path.join(os.getcwd(), 'src'))
 
-from pcnrec.utils.io import load_config, load_parquet, load_pickle, save_parquet
+from pcnrec.utils.io import load_config, load_parquet, load_pickle
 from pcnrec.utils.logging import setup_logger
-from pcnrec.candidates.generate_candidates import generate_candidates
+from pcnrec.candidates.generate_candidates import write_candidates, build_retriever
+from pcnrec.candidates.ann import evaluate_retriever
+from pcnrec.candidates.parallel import write_candidates_parallel
+from pcnrec.candidates.refresh import load_generation_state, save_generation_state, find_changed_users, refresh_candidates
+from pcnrec.candidates.model_store import load_embeddings, read_header, EMBEDDINGS_DIR
+from pcnrec.data.interaction_index import load_interaction_index
+from pcnrec.runs.artifacts import PipelineStage
 
 logger = setup_logger("step1_generate_candidates")
 
@@ -15,6 +22,9 @@ def main():
     parser.add_argument("--config", default="config/config.yaml")
     parser.add_argument("--run_id", required=True)
     parser.add_argument("--max_users", type=int, default=None, help="Limit users for smoke test")
+    parser.add_argument("--workers", type=int, default=1, help="Processes for sharded generation (exact retrieval)")
+    parser.add_argument("--incremental", action="store_true", help="Only recompute users whose history or embedding changed since the last run")
+    parser.add_argument("--force", action="store_true", help="Recompute even if the artifact cache is up to date")
     args = parser.parse_args()
     
     config = load_config(args.config)
@@ -23,20 +33,32 @@ def main():
     output_dir = os.path.join(config['dataset']['output_dir'], run_id)
     data_dir = os.path.join(output_dir, "data")
     model_path = os.path.join(output_dir, "models", "lightfm.pkl")
+    embeddings_dir = os.path.join(output_dir, "models", EMBEDDINGS_DIR)
     cand_dir = os.path.join(output_dir, "candidates")
     
-    if not os.path.exists(model_path):
+    if read_header(embeddings_dir) is None and not os.path.exists(model_path):
         logger.error(f"Model not found: {model_path}. Run step1_train_candidates.py first.")
         sys.exit(1)
+    
+    # Skip if top_k/retrieval settings and the data/model digests match existing candidates
+    stage = PipelineStage(config, output_dir, 'candidates', extra={'max_users': args.max_users})
+    if not args.force and stage.restore():
+        return
+    # --incremental reads the previous candidates and state, so keep them (as private copies)
+    stage.begin(keep=args.incremental)
         
     logger.info("Loading data and model...")
-    train_df = load_parquet(os.path.join(data_dir, "interactions_train.parquet"))
     items_df = load_parquet(os.path.join(data_dir, "items.parquet"))
     users_df = load_parquet(os.path.join(data_dir, "users.parquet"))
-    model = load_pickle(model_path)
+    if read_header(embeddings_dir) is not None:
+        # Exported arrays are memory-mapped, no unpickling
+        model = load_embeddings(embeddings_dir, num_threads=config['candidates'].get('num_threads', 1))
+    else:
+        model = load_pickle(model_path)
     
     num_users = len(users_df)
     num_items = len(items_df)
+    seen = load_interaction_index(os.path.join(data_dir, "interactions_train.parquet"), num_items=num_items)
     
     if args.max_users:
         logger.info(f"Limiting to first {args.max_users} users.")
@@ -46,18 +68,57 @@ def main():
     
     logger.info(f"Generating top-{top_k} candidates for {num_users} users...")
     
-    candidates_df = generate_candidates(
-        model, 
-        train_df, 
-        num_users, 
-        num_items, 
-        top_k, 
-        items_df=items_df
+    retrieval = config['candidates'].get('retrieval', 'exact')
+    ivf_params = config['candidates'].get('ivf') or {}
+    retriever = build_retriever(
+        model,
+        num_items,
+        num_threads=config['candidates'].get('num_threads', 1),
+        retrieval=retrieval,
+        ivf=ivf_params
     )
     
+    if retrieval != 'exact':
+        # Report how much of the exact top-K the approximate index recovers
+        report = evaluate_retriever(retriever, seen, top_k, n_users=ivf_params.get('recall_sample_users', 1000))
+        logger.info(f"Retrieval report: {report}")
+        os.makedirs(cand_dir, exist_ok=True)
+        with open(os.path.join(cand_dir, "retrieval_report.json"), 'w') as f:
+            json.dump(report, f, indent=2)
+    
     out_path = os.path.join(cand_dir, "candidates_topk.parquet")
-    logger.info(f"Saving candidates to {out_path}")
-    save_parquet(candidates_df, out_path)
+    changed = None
+    if args.incremental:
+        state = load_generation_state(cand_dir) if os.path.exists(out_path) else None
+        if state is None:
+            logger.info("No prior candidates/state found, generating all users.")
+        else:
+            changed = find_changed_users(state, retriever, seen, num_users, top_k, retrieval=retrieval)
+            if changed is None:
+                logger.info("Item embeddings, top_k or retrieval mode changed, generating all users.")
+    
+    if changed is not None:
+        # Splice recomputed users into the existing artifact
+        n_rows = refresh_candidates(out_path, retriever, seen, changed, num_users, top_k)
+    elif args.workers > 1:
+        # Shared-memory embeddings, one parquet part per worker, merged with a manifest
+        manifest = write_candidates_parallel(retriever, seen, num_users, top_k, out_path, args.workers)
+        n_rows = manifest['num_rows']
+    else:
+        # Each user batch is streamed to its own row group
+        n_rows = write_candidates(
+            retriever, 
+            seen, 
+            num_users, 
+            num_items, 
+            top_k, 
+            out_path,
+            num_threads=config['candidates'].get('num_threads', 1)
+        )
+    # Snapshot of inputs for the next --incremental run
+    save_generation_state(cand_dir, retriever, seen, num_users, top_k, retrieval=retrieval)
+    logger.info(f"Saved {n_rows} candidates to {out_path}")
+    stage.commit()
     
     logger.info("Done.")
 
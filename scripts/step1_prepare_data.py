@@ -11,6 +11,9 @@ from pcnrec.utils.logging import setup_logger
 from pcnrec.utils.seed import set_seed
 from pcnrec.data.movielens_download import download_movielens
 from pcnrec.data.movielens_prepare import prepare_data
+from pcnrec.data.interaction_index import InteractionIndex, index_path
+from pcnrec.data.popularity_store import PopularityStore
+from pcnrec.runs.artifacts import PipelineStage
 
 logger = setup_logger("step1_prepare_data")
 
@@ -18,6 +21,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="config/config.yaml", help="Path to config")
     parser.add_argument("--run_id", default=None, help="Run ID (default: timestamp)")
+    parser.add_argument("--force", action="store_true", help="Recompute even if the artifact cache is up to date")
     args = parser.parse_args()
     
     config = load_config(args.config)
@@ -37,10 +41,25 @@ def main():
     logger.info(f"Starting Run: {run_id}")
     logger.info(f"Outputs will be in: {output_dir}")
     
+    # Skip if dataset + popularity settings match an existing artifact
+    stage = PipelineStage(config, output_dir, 'data')
+    if not args.force and stage.restore():
+        save_yaml(config, os.path.join(data_out_dir, "config_resolved.yaml"))
+        logger.info(f"Data ready at: {data_out_dir}")
+        return
+    stage.begin()
+    
     # 1. Download
     raw_dir = config['dataset']['data_dir']
     variant = config['dataset']['variant']
-    downloaded_path = download_movielens(variant, raw_dir)
+    downloaded_path = download_movielens(
+        variant,
+        raw_dir,
+        archive_path=config['dataset'].get('archive_path'),
+        mirror_dir=config['dataset'].get('mirror_dir'),
+        archive_sha256=config['dataset'].get('archive_sha256'),
+        verify=config['dataset'].get('verify_checksums', False)
+    )
     
     # 2. Prepare
     train_df, test_df, users, items, stats = prepare_data(config, downloaded_path)
@@ -49,14 +68,22 @@ def main():
     logger.info("Saving outputs...")
     save_parquet(train_df, os.path.join(data_out_dir, "interactions_train.parquet"))
     save_parquet(test_df, os.path.join(data_out_dir, "interactions_test.parquet"))
+    # CSR indexes next to the parquet files (seen-item masking, ground-truth lookups)
+    for name, split_df in [("interactions_train", train_df), ("interactions_test", test_df)]:
+        index = InteractionIndex.from_frame(split_df, num_users=stats['num_users'], num_items=stats['num_items'])
+        index.save(index_path(os.path.join(data_out_dir, f"{name}.parquet")))
     save_parquet(users, os.path.join(data_out_dir, "users.parquet"))
     save_parquet(items, os.path.join(data_out_dir, "items.parquet"))
+    # Incremental popularity state for scripts/update_popularity.py
+    PopularityStore.from_interactions(config, train_df, num_items=stats['num_items'], items_df=items).save(
+        os.path.join(data_out_dir, "popularity_store.npz"))
     save_yaml(config, os.path.join(data_out_dir, "config_resolved.yaml"))
     
     # Save stats as json
     import json
     with open(os.path.join(data_out_dir, "stats.json"), 'w') as f:
         json.dump(stats, f, indent=2)
+    stage.commit()
         
     logger.info("Done.")
     logger.info(f"Data ready at: {data_out_dir}")
@@ -7,6 +7,7 @@ sys.path.append(os.path.join(os.getcwd(), 'src'))
 from pcnrec.utils.io import load_config, load_parquet, save_parquet
 from pcnrec.utils.logging import setup_logger
 from pcnrec.baselines.mmr import run_mmr_for_users
+from pcnrec.runs.artifacts import PipelineStage
 
 logger = setup_logger("step1_run_mmr_baseline")
 
@@ -14,6 +15,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="config/config.yaml")
     parser.add_argument("--run_id", required=True)
+    parser.add_argument("--force", action="store_true", help="Recompute even if the artifact cache is up to date")
     args = parser.parse_args()
     
     config = load_config(args.config)
@@ -27,6 +29,11 @@ def main():
     if not os.path.exists(cand_path):
         logger.error(f"Candidates not found: {cand_path}.")
         sys.exit(1)
+    
+    stage = PipelineStage(config, output_dir, 'mmr')
+    if not args.force and stage.restore():
+        return
+    stage.begin()
         
     logger.info("Loading candidates and items...")
     candidates_df = load_parquet(cand_path)
@@ -41,6 +48,7 @@ def main():
     out_path = os.path.join(baseline_dir, "mmr_topn.parquet")
     logger.info(f"Saving reranked lists to {out_path}")
     save_parquet(reranked_df, out_path)
+    stage.commit()
     
     logger.info("Done.")
 
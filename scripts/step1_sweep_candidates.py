@@ -0,0 +1,74 @@
+import argparse
+import sys
+import os
+import json
+import shutil
+import datetime
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from pcnrec.utils.io import load_config, load_parquet, load_pickle, ensure_dir
+from pcnrec.utils.logging import setup_logger
+from pcnrec.candidates.sweep import run_sweep
+from pcnrec.candidates.model_store import export_embeddings, EMBEDDINGS_DIR
+from pcnrec.runs.artifacts import detach
+
+logger = setup_logger("step1_sweep_candidates")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--run_id", required=True, help="Run ID of the data to use")
+    parser.add_argument("--workers", type=int, default=None, help="Override candidates.sweep.workers")
+    parser.add_argument("--n_trials", type=int, default=None, help="Override candidates.sweep.n_trials (random search)")
+    parser.add_argument("--promote", action="store_true", help="Copy the best model to models/lightfm.pkl")
+    args = parser.parse_args()
+    
+    config = load_config(args.config)
+    run_id = args.run_id
+    
+    output_dir = os.path.join(config['dataset']['output_dir'], run_id)
+    data_dir = os.path.join(output_dir, "data")
+    model_dir = os.path.join(output_dir, "models")
+    sweep_dir = os.path.join(output_dir, "sweeps", datetime.datetime.now().strftime("%Y%m%d_%H%M%S"))
+    
+    if not os.path.exists(data_dir):
+        logger.error(f"Data directory not found: {data_dir}. Run step1_prepare_data.py first.")
+        sys.exit(1)
+    
+    sweep_cfg = dict(config['candidates']['sweep'])
+    sweep_cfg['top_k'] = config['candidates']['top_k']
+    sweep_cfg.setdefault('windows', [config['pcn']['candidate_window']])
+    if args.workers:
+        sweep_cfg['workers'] = args.workers
+    if args.n_trials:
+        sweep_cfg['n_trials'] = args.n_trials
+    
+    logger.info("Loading data...")
+    cols = ['user_idx', 'item_idx']
+    train_df = load_parquet(os.path.join(data_dir, "interactions_train.parquet"), columns=cols)
+    test_df = load_parquet(os.path.join(data_dir, "interactions_test.parquet"), columns=cols)
+    num_users = len(load_parquet(os.path.join(data_dir, "users.parquet")))
+    num_items = len(load_parquet(os.path.join(data_dir, "items.parquet")))
+    
+    ensure_dir(sweep_dir)
+    leaderboard, summary = run_sweep(train_df, test_df, num_users, num_items, sweep_cfg, sweep_dir)
+    
+    with open(os.path.join(sweep_dir, "summary.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+    
+    print(leaderboard.drop(columns=['model_path'], errors='ignore').head(10).to_string(index=False))
+    logger.info(f"Summary: {summary}")
+    
+    if args.promote and 'best_model' in summary:
+        # models/ may be hardlinked into the artifact store; write private copies
+        detach([model_dir])
+        shutil.copy(summary['best_model'], os.path.join(model_dir, "lightfm.pkl"))
+        params = dict(config['candidates'], **summary['best_params'])
+        export_embeddings(load_pickle(summary['best_model']), os.path.join(model_dir, EMBEDDINGS_DIR), params=params)
+        logger.info(f"Promoted best model to {os.path.join(model_dir, 'lightfm.pkl')}")
+    
+    logger.info(f"Sweep results in {sweep_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ from pcnrec.utils.io import load_config, load_parquet, save_pickle, ensure_dir
 from pcnrec.utils.logging import setup_logger
 from pcnrec.utils.seed import set_seed
 from pcnrec.candidates.train_lightfm import train_model
+from pcnrec.candidates.model_store import export_embeddings, EMBEDDINGS_DIR
+from pcnrec.runs.artifacts import PipelineStage
 
 logger = setup_logger("step1_train_candidates")
 
@@ -16,6 +18,7 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="config/config.yaml")
     parser.add_argument("--run_id", required=True, help="Run ID of the data to use")
+    parser.add_argument("--force", action="store_true", help="Recompute even if the artifact cache is up to date")
     args = parser.parse_args()
     
     # Load config from the run directory to ensure consistency? 
@@ -33,6 +36,12 @@ def main():
     if not os.path.exists(data_dir):
         logger.error(f"Data directory not found: {data_dir}. Run step1_prepare_data.py first.")
         sys.exit(1)
+    
+    # Skip if the training settings and train interactions match an existing model
+    stage = PipelineStage(config, output_dir, 'model')
+    if not args.force and stage.restore():
+        return
+    stage.begin()
         
     set_seed(config['candidates']['seed'])
     
@@ -45,10 +54,13 @@ def main():
     num_items = len(items_df)
     
     logger.info(f"Training LightFM model (users={num_users}, items={num_items})...")
-    model = train_model(config, train_df, num_users, num_items)
+    model = train_model(config, train_df, num_users, num_items, checkpoint_dir=os.path.join(model_dir, "checkpoints"))
     
     logger.info(f"Saving model to {model_dir}")
     save_pickle(model, os.path.join(model_dir, "lightfm.pkl"))
+    # Memory-mappable arrays for candidate generation and serving
+    export_embeddings(model, os.path.join(model_dir, EMBEDDINGS_DIR), params=config['candidates'])
+    stage.commit()
     
     logger.info("Done.")
 
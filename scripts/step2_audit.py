@@ -0,0 +1,121 @@
+import argparse
+import sys
+import os
+import json
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from pcnrec.utils.io import load_config
+from pcnrec.utils.logging import setup_logger
+from pcnrec.data.catalog import ItemCatalog
+from pcnrec.verify.auditor import audit_run, run_constraints, results_path
+from pcnrec.runs.audit import AuditLog, check_logs, check_signatures, signing_key, key_id, verify_inclusion
+
+logger = setup_logger("step2_audit")
+
+def read_manifest(run_dir):
+    path = os.path.join(run_dir, "run_manifest.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def check_integrity(run_dir, method, config, proof_user=None):
+    """
+    Merkle roots, row leaves and certificate signatures of a run that keeps an
+    audit log (pcnrec runs; baselines are not logged or signed). None otherwise.
+    """
+    manifest = read_manifest(run_dir)
+    audit = manifest.get('audit') or {}
+    logs = audit.get('logs') or {}
+    if not logs:
+        logger.info(f"{method}: no audit log (only pcnrec runs are logged and signed)")
+        return None
+
+    report = {"logs": check_logs(run_dir, logs)}
+    for name, entry in report['logs'].items():
+        if entry['ok']:
+            logger.info(f"{method}: audit log {name} OK ({entry['size']} rows)")
+        else:
+            logger.warning(f"{method}: audit log {name} FAILED: root_ok={entry['root_ok']}, "
+                           f"mismatched rows {entry['mismatched']}, rows missing from results {entry['missing']}")
+
+    key = signing_key(config)
+    if audit.get('signature') == "hmac-sha256" and (key is None or key_id(key) != audit.get('key_id')):
+        logger.warning(f"{method}: certificates are HMAC-signed but the configured key is missing or differs "
+                       f"(key_id {audit.get('key_id')}); signatures not checked")
+        report['signatures'] = None
+    else:
+        run_id = manifest.get('run_id') or config['run'].get('run_id')
+        report['signatures'] = check_signatures(run_dir, run_id, run_constraints(run_dir, config), key)
+        sig = report['signatures']
+        log = logger.warning if sig['invalid'] else logger.info
+        log(f"{method}: signatures {sig['valid']} valid, {sig['invalid']} invalid, {sig['unsigned']} unsigned"
+            + (f" (invalid users {sig['invalid_users']})" if sig['invalid'] else ""))
+
+    if proof_user is not None:
+        for name, entry in logs.items():
+            proof = AuditLog(run_dir, name).proof(proof_user)
+            if proof is None:
+                continue
+            proof['root'] = entry['root']
+            proof['valid'] = verify_inclusion(bytes.fromhex(proof['leaf']), proof['index'], proof['size'], proof['proof'], entry['root'])
+            logger.info(f"{method}: inclusion proof of user {proof_user} in {name}: {json.dumps(proof)}")
+            report['proof'] = proof
+            break
+        else:
+            logger.warning(f"{method}: user {proof_user} is not in any audit log")
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-verify every selection of one or more runs against items.parquet and the candidate windows.")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--run_id", required=True)
+    parser.add_argument("--methods", default="mf_topn,mmr,constrained_greedy,single_llm,pcnrec")
+    parser.add_argument("--window", type=int, default=None, help="Candidate window for rows without stored candidates_shown (default: pcn.candidate_window)")
+    parser.add_argument("--block_mb", type=float, default=16, help="JSONL block size per chunk (bounds memory)")
+    parser.add_argument("--proof", type=int, default=None, metavar="USER_ID", help="Print and check the Merkle inclusion proof of this user's row in each logged run")
+    args = parser.parse_args()
+    
+    config = load_config(args.config)
+    output_dir = os.path.join(config['dataset']['output_dir'], args.run_id)
+    items_path = os.path.join(output_dir, "data", "items.parquet")
+    cand_path = os.path.join(output_dir, "candidates", "candidates_topk.parquet")
+    window = args.window or config['pcn']['candidate_window']
+    
+    catalog = ItemCatalog.load(items_path)
+    if not os.path.exists(cand_path):
+        logger.warning(f"Candidates not found ({cand_path}); rows without stored windows skip the window check")
+        cand_path = None
+    
+    summaries = {}
+    for method in args.methods.split(','):
+        run_dir = os.path.join(output_dir, "runs", method)
+        if results_path(run_dir) is None:
+            logger.info(f"Skipping {method} (no results)")
+            continue
+        summary = audit_run(run_dir, catalog, run_constraints(run_dir, config),
+                            candidates_path=cand_path, window=window, block_mb=args.block_mb)
+        summaries[method] = summary
+        stored = summary['stored_pass_rate']
+        logger.info(
+            f"{method}: {summary['rows']} rows, pass rate {summary['pass_rate']:.4f}"
+            + (f" (stored {stored:.4f}, {summary['stored_disagreements']} disagreements)" if stored is not None else "")
+            + f", {summary['rows_per_s'] or 0:,.0f} rows/s"
+        )
+        failing = {k: v for k, v in summary['reason_counts'].items() if v}
+        if failing:
+            logger.info(f"{method}: failing rows by reason {failing}")
+        integrity = check_integrity(run_dir, method, config, args.proof)
+        if integrity is not None:
+            summary['integrity'] = integrity
+    
+    analysis_dir = os.path.join(output_dir, "analysis")
+    os.makedirs(analysis_dir, exist_ok=True)
+    path = os.path.join(analysis_dir, "audit_summary.json")
+    with open(path, 'w') as f:
+        json.dump(summaries, f, indent=2)
+    logger.info(f"Saved {path}")
+
+if __name__ == "__main__":
+    main()
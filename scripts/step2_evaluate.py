@@ -9,22 +9,43 @@ sys.path.append(os.path.join(os.getcwd(), 'src'))
 from pcnrec.utils.io import load_config, load_parquet
 from pcnrec.eval.evaluate_runs import evaluate_run
 from pcnrec.analysis.feasibility import check_feasibility
+from pcnrec.candidates.io import load_candidates, read_candidate_users, parse_shard, shard_bounds
+from pcnrec.data.interaction_index import load_interaction_index
+from pcnrec.data.catalog import ItemCatalog
+from pcnrec.verify.cache import configure_cache
+from pcnrec.verify.auditor import audit_run, run_constraints, verdicts_current, load_verdicts
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--config", default="config/config.yaml")
     parser.add_argument("--run_id", required=True)
     parser.add_argument("--methods", default="mf_topn,mmr,constrained_greedy,single_llm,pcnrec")
+    parser.add_argument("--shard", type=str, default=None, help="Format: index/total, e.g., 0/4. Evaluate only this shard's users")
+    parser.add_argument("--no_audit", action="store_true", help="Use the verifier flags stored in results.jsonl instead of re-verifying every run")
     args = parser.parse_args()
     
     config = load_config(args.config)
     run_id = args.run_id
+    verify_cache = configure_cache(config)
     
     output_dir = os.path.join(config['dataset']['output_dir'], run_id)
     candidates_path = os.path.join(output_dir, "candidates", "candidates_topk.parquet")
     items_path = os.path.join(output_dir, "data", "items.parquet")
     test_path = os.path.join(output_dir, "data", "interactions_test.parquet")
     analysis_dir = os.path.join(output_dir, "analysis")
+    
+    # Sharding: same user split as the run scripts; only this shard's row groups are read
+    user_range = None
+    shard_users = None
+    if args.shard:
+        shard_idx, shard_total = parse_shard(args.shard)
+        all_users = list(read_candidate_users(candidates_path))
+        start_idx, end_idx = shard_bounds(len(all_users), shard_idx, shard_total)
+        shard_list = all_users[start_idx:end_idx]
+        shard_users = set(shard_list)
+        user_range = (shard_list[0], shard_list[-1] + 1) if shard_list else (0, 0)
+        analysis_dir = os.path.join(analysis_dir, f"shard_{shard_idx}_of_{shard_total}")
+        print(f"Shard {shard_idx+1}/{shard_total}: {len(shard_list)} users")
     os.makedirs(analysis_dir, exist_ok=True)
     
     print(f"Loading data from {output_dir}...")
@@ -33,7 +54,9 @@ def main():
     # Items df usually indexed by item_idx
     
     test_df = load_parquet(test_path)
-    cands_df = load_parquet(candidates_path)
+    # CSR ground-truth index, built once and shared by every evaluate_run call
+    test_index = load_interaction_index(test_path, df=test_df)
+    cands_df = load_candidates(candidates_path, items_df, user_range=user_range)
     if 'user_idx' in cands_df.columns:
         cands_df = cands_df.rename(columns={'user_idx': 'user_id'})
         
@@ -44,9 +67,10 @@ def main():
     feasible_users = set()
     total_users = 0
     
+    catalog = ItemCatalog.from_items_df(items_df)
     user_groups = cands_df.groupby('user_id')
     for uid, group in user_groups:
-        is_feasible, _ = check_feasibility(group, constraints, top_k=cand_window)
+        is_feasible, _ = check_feasibility(group, constraints, top_k=cand_window, catalog=catalog)
         if is_feasible:
             feasible_users.add(uid)
         total_users += 1
@@ -56,8 +80,27 @@ def main():
     
     methods = args.methods.split(',')
     
+    # Pass flags come from re-verifying every selection (verify.auditor), so
+    # baselines without a stored verifier result are scored like the LLM runs.
+    # A shard audits only its own users, into its analysis dir
+    audit_passes = {}
+    for method in methods:
+        run_dir = os.path.join(output_dir, "runs", method)
+        if args.no_audit or not os.path.exists(run_dir):
+            continue
+        audit_dir = os.path.join(analysis_dir, "audit", method) if args.shard else None
+        if not verdicts_current(run_dir, output_dir=audit_dir):
+            summary = audit_run(run_dir, catalog, run_constraints(run_dir, config),
+                                candidates_path=candidates_path, window=cand_window,
+                                output_dir=audit_dir, user_range=user_range)
+            print(f"Audited {method}: pass rate {summary['pass_rate']:.4f} over {summary['rows']} rows")
+        verdicts = load_verdicts(run_dir, columns=['user_id', 'pass'], output_dir=audit_dir)
+        audit_passes[method] = dict(zip(verdicts['user_id'].tolist(), verdicts['pass'].tolist()))
+    
     all_summaries = []
     feas_summaries = []
+    # Per-user feasible-subset frames, reused for the significance tests
+    feas_dfs = {}
     
     for method in methods:
         run_dir = os.path.join(output_dir, "runs", method)
@@ -68,15 +111,19 @@ def main():
         print(f"Evaluating {method}...")
         
         # 1. All Users
-        summary_all, _ = evaluate_run(run_dir, test_df, items_df, subset_users=None)
+        summary_all, _ = evaluate_run(run_dir, test_index, items_df, subset_users=shard_users, catalog=catalog, constraints=constraints, audit_pass=audit_passes.get(method))
         if not summary_all: continue
         summary_all['method'] = method
         all_summaries.append(summary_all)
         
         # 2. Feasible Only
-        summary_feas, _ = evaluate_run(run_dir, test_df, items_df, subset_users=feasible_users)
+        summary_feas, df_feas_m = evaluate_run(run_dir, test_index, items_df, subset_users=feasible_users, catalog=catalog, constraints=constraints, audit_pass=audit_passes.get(method))
         summary_feas['method'] = method
         feas_summaries.append(summary_feas)
+        feas_dfs[method] = df_feas_m
+        
+    verify_cache.flush()
+    print(f"Verification cache: {verify_cache.stats()}")
         
     # Save All
     df_all = pd.DataFrame(all_summaries)
@@ -109,37 +156,8 @@ def main():
     
     stats_results = {}
     
-    # Needs: dict of method -> user_id -> metric
-    # We have df_feas which has rows for each method.
-    # We need to pivot or re-organize.
-    
-    # Let's extract per-user metrics for feasible users
-    # run dictionaries: method -> {uid: metric}
-    
-    methods_dfs = {} 
-    # Re-read or just accumulate during loop?
-    # We didn't save per-user details in memory except in summary loop, but discarded.
-    # Let's re-read specifically for stats or Modify loop to return DF.
-    # evaluate_run returns (summary, df_m). df_m has 'user_id'.
-    
-    # Re-run evaluate_run for specific methods to get DFs if needed, OR store them above.
+    # Paired tests on the per-user feasible-subset frames (feas_dfs) from the loop above
     
-    # Let's refactor loop above to store DFs
-    
-    # ... Refactor main loop ...
-    
-    # Store DFs for significance
-    feas_dfs = {}
-    
-    for method in methods:
-        run_dir = os.path.join(output_dir, "runs", method)
-        if not os.path.exists(run_dir):
-            continue
-            
-        # Feasible Only
-        summary_feas, df_feas_m = evaluate_run(run_dir, test_df, items_df, subset_users=feasible_users)
-        feas_dfs[method] = df_feas_m
-        
     # Primary Comparison 1: PCN-Rec vs Single-LLM (Feasible)
     if 'pcnrec' in feas_dfs and 'single_llm' in feas_dfs:
         df_pcn = feas_dfs['pcnrec'].set_index('user_id')
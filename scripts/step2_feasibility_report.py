@@ -9,6 +9,8 @@ sys.path.append(os.path.join(os.getcwd(), 'src'))
 
 from pcnrec.utils.io import load_config
 from pcnrec.analysis.feasibility import check_feasibility
+from pcnrec.candidates.io import load_candidates
+from pcnrec.data.catalog import ItemCatalog
 from pcnrec.utils.logging import setup_logger
 
 logger = setup_logger("feasibility_report")
@@ -30,8 +32,10 @@ def main():
         logger.error(f"Candidates not found at {cand_path}")
         return
 
-    cands_df = pd.read_parquet(cand_path)
-    # cands_df already has 'genres' and 'popularity_bin' from generation step
+    # Attach 'genres' and 'popularity_bin' from items.parquet
+    items_df = pd.read_parquet(items_path)
+    cands_df = load_candidates(cand_path, items_df)
+    catalog = ItemCatalog.from_items_df(items_df)
     joined_df = cands_df
     
     # Rename item_idx to item_id for consistency if needed, but logic uses columns directly
@@ -56,13 +60,13 @@ def main():
             u_cands = joined_df[joined_df['user_id'] == uid]
             
             # check feasibility at window w
-            is_feasible, details = check_feasibility(u_cands, constraints, top_k=w)
+            is_feasible, details = check_feasibility(u_cands, constraints, top_k=w, catalog=catalog)
             
             if is_feasible:
                 feasible_count += 1
             else:
                 for r in details['fail_reasons']:
-                    reasons_counts[r] += 1
+                    reasons_counts[r] = reasons_counts.get(r, 0) + 1
                     
         res = {
             'window': w,
@@ -11,8 +11,12 @@ from pcnrec.utils.logging import setup_logger
 from pcnrec.utils.seed import set_seed
 from pcnrec.llm.gemini_client import GeminiClient
 from pcnrec.agents.negotiation import run_negotiation
-from pcnrec.runs.io import append_result_row, read_results, save_manifest
+from pcnrec.runs.io import append_result_row, read_results, save_manifest, update_manifest
+from pcnrec.runs.audit import AuditLog, signing_key, key_id
+from pcnrec.verify.cache import configure_cache
 from pcnrec.runs.manifest import create_manifest
+from pcnrec.candidates.io import load_candidates, read_candidate_users, parse_shard, shard_bounds
+from pcnrec.data.catalog import ItemCatalog
 
 logger = setup_logger("step2_run_pcnrec")
 
@@ -30,6 +34,8 @@ def main():
     config = load_config(args.config)
     run_id = args.run_id
     config['run']['run_id'] = run_id
+    # Verification results are memoized across rounds, repairs and runs
+    verify_cache = configure_cache(config)
     
     # Overrides for ablations
     if args.no_verifier:
@@ -49,8 +55,6 @@ def main():
         logger.error(f"Candidates not found: {cand_path}")
         sys.exit(1)
         
-    candidates_df = load_parquet(cand_path)
-    
     # Initialize
     set_seed(42)
     gemini = GeminiClient(config)
@@ -62,6 +66,8 @@ def main():
     # Ensure index
     if items_df.index.name != 'item_idx' and 'item_idx' in items_df.columns:
         items_df = items_df.set_index('item_idx') # Optimize lookup
+    # Bins/genres as arrays, built once and shared by every user's verification
+    catalog = ItemCatalog.from_items_df(items_df)
     
     # Manifest
     if not os.path.exists(run_output_dir):
@@ -77,24 +83,34 @@ def main():
     logger.info(f"Already done: {len(done_users)} users.")
     
     # Filter users
-    all_users = sorted(candidates_df['user_idx'].unique())
+    all_users = list(read_candidate_users(cand_path))
     if args.max_users:
         all_users = all_users[:args.max_users]
         
     # Sharding
     if args.shard:
-        shard_idx, shard_total = map(int, args.shard.split('/'))
-        chunk_size = len(all_users) // shard_total + 1
-        start_idx = shard_idx * chunk_size
-        end_idx = min((shard_idx + 1) * chunk_size, len(all_users))
+        shard_idx, shard_total = parse_shard(args.shard)
+        start_idx, end_idx = shard_bounds(len(all_users), shard_idx, shard_total)
         all_users = all_users[start_idx:end_idx]
         logger.info(f"Shard {shard_idx+1}/{shard_total}: Processing {len(all_users)} users ({start_idx} to {end_idx})")
         
 
         
+    # Push the shard's user range down so only its row groups are read
+    user_range = (all_users[0], all_users[-1] + 1) if all_users else (0, 0)
+    candidates_df = load_candidates(cand_path, items_df, user_range=user_range)
+        
     users_to_process = [u for u in all_users if u not in done_users]
     logger.info(f"Processing {len(users_to_process)} users for pcnrec...")
     
+    # Merkle log of this shard's rows; rows written before the log existed are added first
+    audit_name = f"shard_{shard_idx}_of_{shard_total}" if args.shard else "all"
+    audit_log = AuditLog(run_output_dir, audit_name)
+    shard_users = set(all_users)
+    synced = audit_log.sync(r for r in existing if r['user_id'] in shard_users)
+    if synced:
+        logger.info(f"Added {synced} existing rows to audit log {audit_name}")
+    
     for uid in tqdm(users_to_process):
         user_cands = candidates_df[candidates_df['user_idx'] == uid].copy()
         
@@ -106,7 +122,7 @@ def main():
         # Let's handle it by wrapping verification in negotiation. 
         # I'll update negotiation.py to check config['pcn'].get('require_verifier_pass', True)
         
-        result = run_negotiation(uid, user_cands, items_df, config, gemini)
+        result = run_negotiation(uid, user_cands, catalog, config, gemini)
         end_t = time.time()
         
         row = {
@@ -117,7 +133,7 @@ def main():
         
         if result['result'] in ['success', 'fail_max_rounds']:
             row['selected_item_ids'] = result['selected_item_ids']
-            row['certificate'] = result['certificate'].dict()
+            row['certificate'] = result['certificate'].model_dump()
             row['verifier'] = result['verifier_result']
             row['status'] = result['result']
             
@@ -134,6 +150,19 @@ def main():
             row['selected_item_ids'] = []
             
         append_result_row(run_output_dir, row)
+        audit_log.append(row)
+    
+    # Root goes to the manifest: any row can then be checked with an inclusion proof
+    key = signing_key(config)
+    audit_summary = audit_log.summary()
+    update_manifest(run_output_dir, {"audit": {
+        "signature": "hmac-sha256" if key is not None else "sha256",
+        "key_id": key_id(key),
+        "logs": {audit_name: audit_summary}
+    }})
+    logger.info(f"Audit log {audit_name}: {audit_summary['size']} rows, root {audit_summary['root']}")
+    verify_cache.flush()
+    logger.info(f"Verification cache: {verify_cache.stats()}")
         
     logger.info(f"Done. Results in {run_output_dir}")
 
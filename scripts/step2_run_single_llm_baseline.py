@@ -13,6 +13,7 @@ from pcnrec.llm.gemini_client import GeminiClient
 from pcnrec.agents.single_llm_rerank import run_single_llm
 from pcnrec.runs.io import append_result_row, read_results, save_manifest
 from pcnrec.runs.manifest import create_manifest
+from pcnrec.candidates.io import load_candidates, read_candidate_users, parse_shard, shard_bounds
 
 logger = setup_logger("step2_run_single_llm")
 
@@ -37,8 +38,6 @@ def main():
         logger.error(f"Candidates not found: {cand_path}")
         sys.exit(1)
         
-    candidates_df = load_parquet(cand_path)
-    
     # Load items and train for profile
     data_dir = os.path.join(output_dir, "data")
     items_path = os.path.join(data_dir, "items.parquet")
@@ -70,24 +69,27 @@ def main():
     logger.info(f"Already done: {len(done_users)} users.")
     
     # Filter users
-    all_users = sorted(candidates_df['user_idx'].unique())
+    all_users = list(read_candidate_users(cand_path))
     if args.max_users:
         all_users = all_users[:args.max_users]
         
     # Sharding
     if args.shard:
-        shard_idx, shard_total = map(int, args.shard.split('/'))
-        chunk_size = len(all_users) // shard_total + 1
-        start_idx = shard_idx * chunk_size
-        end_idx = min((shard_idx + 1) * chunk_size, len(all_users))
+        shard_idx, shard_total = parse_shard(args.shard)
+        start_idx, end_idx = shard_bounds(len(all_users), shard_idx, shard_total)
         all_users = all_users[start_idx:end_idx]
         logger.info(f"Shard {shard_idx+1}/{shard_total}: Processing {len(all_users)} users")
         
+    # Push the shard's user range down so only its row groups are read
+    user_range = (all_users[0], all_users[-1] + 1) if all_users else (0, 0)
+    candidates_df = load_candidates(cand_path, items_df, user_range=user_range)
+        
     users_to_process = [u for u in all_users if u not in done_users]
     logger.info(f"Processing {len(users_to_process)} users...")
     
     # Import profile util
-    from pcnrec.utils.profiling import get_user_profile
+    from pcnrec.utils.profiling import get_user_profile, build_profile_index
+    profile_index = build_profile_index(train_df, num_items=len(items_df))
     
     for uid in tqdm(users_to_process):
         user_cands = candidates_df[candidates_df['user_idx'] == uid].copy()
@@ -96,7 +98,7 @@ def main():
         # They should be in candidates_df
         
         # Profile
-        profile_str = get_user_profile(uid, train_df, items_df)
+        profile_str = get_user_profile(uid, train_df, items_df, profile_index=profile_index)
         
         start_t = time.time()
         result = run_single_llm(uid, user_cands, config, gemini, user_profile=profile_str)
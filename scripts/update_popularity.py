@@ -0,0 +1,58 @@
+import argparse
+import sys
+import os
+import json
+
+sys.path.append(os.path.join(os.getcwd(), 'src'))
+
+from pcnrec.utils.io import load_config, load_parquet, save_parquet
+from pcnrec.utils.logging import setup_logger
+from pcnrec.data.popularity_store import PopularityStore, changes_summary
+from pcnrec.runs.artifacts import detach
+
+logger = setup_logger("update_popularity")
+
+STORE_FILE = "popularity_store.npz"
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold a new batch of interactions into the run's popularity bins")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--run_id", required=True)
+    parser.add_argument("--interactions", required=True, help="Parquet with item_idx and timestamp (internal ids)")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    data_dir = os.path.join(config['dataset']['output_dir'], args.run_id, "data")
+    store_path = os.path.join(data_dir, STORE_FILE)
+    items_path = os.path.join(data_dir, "items.parquet")
+
+    if os.path.exists(store_path):
+        store = PopularityStore.load(store_path)
+    else:
+        # Runs prepared before the store existed: seed it from the train split
+        logger.info("No popularity store yet; seeding from interactions_train.parquet")
+        items_df = load_parquet(items_path, columns=['internal_id', 'popularity_bin'])
+        train_df = load_parquet(os.path.join(data_dir, "interactions_train.parquet"), columns=['item_idx', 'timestamp'])
+        store = PopularityStore.from_interactions(config, train_df, num_items=len(items_df), items_df=items_df)
+
+    batch = load_parquet(args.interactions, columns=['item_idx', 'timestamp'])
+    logger.info(f"Applying {len(batch)} interactions...")
+    report = store.update(batch['item_idx'].to_numpy(), batch['timestamp'].to_numpy())
+    summary = changes_summary(report, store.bin_names)
+    logger.info(f"{summary['changed_items']} items changed bin: {summary['transitions']}")
+
+    # data/ may be hardlinked into the artifact store; write private copies
+    detach([data_dir])
+    store.save(store_path)
+    save_parquet(store.apply_to_items(load_parquet(items_path)), items_path)
+
+    # Changed ids let candidate refresh / ItemCatalog.update_bins touch only those items
+    summary['changed_item_ids'] = report['changed_items'].tolist()
+    summary['new_bins'] = [store.bin_names[c] for c in report['new_codes']]
+    with open(os.path.join(data_dir, "popularity_changes.json"), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    logger.info(f"Updated {items_path}")
+
+if __name__ == "__main__":
+    main()
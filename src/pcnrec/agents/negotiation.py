@@ -1,5 +1,4 @@
 import json
-import hashlib
 from pcnrec.llm.gemini_client import GeminiClient
 from pcnrec.llm.schemas import ProofCertificate, NegotiationRound, ComputedStats
 from pcnrec.agents.prompts import SYSTEM_PROMPT_USER_ADVOCATE, SYSTEM_PROMPT_PLATFORM_POLICY, SYSTEM_PROMPT_MEDIATOR
@@ -16,14 +15,20 @@ def format_candidates(candidates_df):
 
 from pcnrec.analysis.feasibility import check_feasibility
 from pcnrec.baselines.sanity import solve_constrained_greedy_user
+from pcnrec.data.catalog import as_catalog
+from pcnrec.runs.audit import sign_certificate, signing_key
 
 def run_negotiation(user_id, candidates_df, items_df, config, gemini_client: GeminiClient):
     """
     Runs the PCN negotiation loop with robust gating.
+    items_df may be an ItemCatalog (build it once per run) or the items frame.
     """
+    items_df = as_catalog(items_df)
     top_n = config['pcn']['top_n']
     max_rounds = config['pcn']['max_rounds']
     constraints = config['constraints']
+    run_id = config['run']['run_id']
+    key = signing_key(config)
     
     # Window
     window_size = config['pcn']['candidate_window']
@@ -32,7 +37,7 @@ def run_negotiation(user_id, candidates_df, items_df, config, gemini_client: Gem
     candidates_ids = set(candidates_window['item_idx'].values)
     
     # Feasibility Check
-    is_feasible, feas_details = check_feasibility(candidates_window, constraints, top_k=None) # window already applied
+    is_feasible, feas_details = check_feasibility(candidates_window, constraints, top_k=None, catalog=items_df) # window already applied
     fail_reasons = feas_details.get('fail_reasons', [])
     
     constraints_str = json.dumps(constraints, indent=2)
@@ -66,12 +71,11 @@ def run_negotiation(user_id, candidates_df, items_df, config, gemini_client: Gem
                 system_instruction="You are a JSON-speaking Mediator."
             )
             
-            # Post-processing: Compute signature
-            sig_content = f"{user_id}-{certificate.selected_item_ids}-{constraints}-{config['run']['run_id']}"
-            certificate.signature = hashlib.sha256(sig_content.encode()).hexdigest()
+            # Post-processing: HMAC over the canonical certificate (pcnrec.runs.audit)
+            certificate.signature = sign_certificate(certificate, user_id, run_id, constraints, key)
             
             # Verify
-            verification = verify_certificate(certificate, items_df, candidates_ids)
+            verification = verify_certificate(certificate, items_df, candidates_ids, constraints=constraints)
             
             # Ablation check
             require_pass = config.get('pcn', {}).get('require_verifier_pass', True)
@@ -103,11 +107,12 @@ def run_negotiation(user_id, candidates_df, items_df, config, gemini_client: Gem
                             selected_item_ids=repair_ids,
                             computed_stats_claimed=ComputedStats(head_count=0, tail_count=0, unique_genres=0), # Dummy
                             negotiation_trace=certificate.negotiation_trace, # Keep trace
-                            signature="repaired"
+                            signature=""
                         )
+                        repaired_cert.signature = sign_certificate(repaired_cert, user_id, run_id, constraints, key)
                         
                         # Verify the repair to get accurate stats
-                        repair_vertification = verify_certificate(repaired_cert, items_df, candidates_ids)
+                        repair_vertification = verify_certificate(repaired_cert, items_df, candidates_ids, constraints=constraints)
                         
                         return {
                              "result": "success", 
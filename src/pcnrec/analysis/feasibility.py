@@ -1,12 +1,16 @@
 import pandas as pd
 import numpy as np
-from pcnrec.verify.recompute import compute_head_tail_counts, compute_unique_genres
-from pcnrec.verify.constraints import check_max_head, check_min_tail, check_min_unique_genres
+from pcnrec.verify.constraints import compile_constraints
+from pcnrec.data.catalog import ItemCatalog
 
-def check_feasibility(candidates_df: pd.DataFrame, constraints: dict, top_k: int = None):
+def check_feasibility(candidates_df: pd.DataFrame, constraints: dict, top_k: int = None, catalog: ItemCatalog = None):
     """
     Checks if the constraints can be satisfied using ONLY the provided candidates.
     If top_k is specified, only considers the top k candidates by 'cand_score' (assumed sorted or requiring sort).
+    If catalog is given, bins and genres are looked up by item_idx in its arrays
+    instead of the candidates' 'popularity_bin'/'genres' columns.
+    Constraints are compiled with verify.constraints.compile_constraints, so
+    every registered constraint type contributes its window check.
     
     Returns:
         is_feasible (bool)
@@ -48,56 +52,27 @@ def check_feasibility(candidates_df: pd.DataFrame, constraints: dict, top_k: int
     # Assuming target list size is N=10 (standard)
     target_n = 10
     
-    pop_config = constraints.get('popularity', {})
-    div_config = constraints.get('diversity', {})
+    if catalog is None:
+        # Catalog over the window's own 'popularity_bin'/'genres' columns
+        window_items = df[['item_idx', 'genres', 'popularity_bin']].drop_duplicates('item_idx')
+        catalog = ItemCatalog.from_items_df(window_items.rename(columns={'item_idx': 'internal_id'}))
     
-    max_head = pop_config.get('max_head_in_topn', 10)
-    min_tail = pop_config.get('min_tail_in_topn', 0)
-    min_genres = div_config.get('min_unique_genres_in_topn', 0)
+    # Array lookups: bin counts and OR of genre bitmasks over the window
+    ids = df['item_idx'].to_numpy(dtype=np.int64)
+    counts = catalog.bin_counts(ids)
+    avail_tail = counts.get('tail', 0)
+    avail_head = counts.get('head', 0)
+    avail_unique_genres = catalog.unique_genres(ids)
     
-    # Available resources in window
-    avail_tail = (df['popularity_bin'] == 'tail').sum()
-    avail_head = (df['popularity_bin'] == 'head').sum()
-    avail_torso = (df['popularity_bin'] == 'torso').sum() # total - head - tail
-    
-    # Unique genres in window
-    # genres strings like "Action|Comedy"
-    all_genres = set()
-    for gs in df['genres'].dropna():
-        for g in gs.split('|'):
-            all_genres.add(g)
-    avail_unique_genres = len(all_genres)
-    
-    fail_reasons = []
-    
-    # Check 1: Tail Shortage
-    # We need to pick min_tail items that are tail.
-    if avail_tail < min_tail:
-        fail_reasons.append('tail_shortage')
-    
-    # Check 2: Head Conflict is more subtle. We verify Max Head.
-    # If we MUST pick items, and we run out of non-head items, we might be forced to pick head.
-    # We need N items total.
-    # Non-Head Available = Tail + Torso
-    avail_non_head = avail_tail + avail_torso
-    # If we pick all available non-head, we still need (N - avail_non_head) items.
-    # These MUST come from Head.
-    # So min_head_needed = max(0, N - avail_non_head)
-    # If min_head_needed > max_head, then we are forced to violate max_head.
-    min_head_needed = max(0, target_n - avail_non_head)
-    if min_head_needed > max_head:
-        fail_reasons.append('head_forced_violation')
-        
-    # Check 3: Genre Shortage
-    # Can we pick N items that cover G genres?
-    # This is a set cover problem, hard to solve exactly in general, but usually:
-    # If total unique genres in window < min_genres, it's impossible.
-    if avail_unique_genres < min_genres:
-        fail_reasons.append('genre_shortage_window')
+    # Each compiled constraint checks its own necessary condition on the window:
+    # - bin_min (min_tail_in_topn): enough tail items ('tail_shortage')
+    # - bin_max (max_head_in_topn): N - (available non-head) items are forced
+    #   to come from head ('head_forced_violation')
+    # - min_unique_genres: the window covers enough genres ('genre_shortage_window').
+    #   Set cover is hard in general, but the count is a good lower bound.
+    plan = compile_constraints(constraints, catalog)
+    fail_reasons = plan.window_check(ids, top_n=target_n)
         
-    # A stricter greedy check for genres isn't strictly necessary for "feasibility" 
-    # unless the window is very small, but simple count is a good lower bound.
-    
     is_feasible = len(fail_reasons) == 0
     
     return is_feasible, {
@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
 from pcnrec.utils.logging import setup_logger
+from pcnrec.data.catalog import as_catalog, popcount
 
 logger = setup_logger(__name__)
 
@@ -36,74 +37,52 @@ def mmr_rerank(user_candidates, items_df, lambda_param, top_n):
     """
     Reranks candidates using MMR.
     user_candidates: DataFrame with ['item_idx', 'cand_score']
-    items_df: DataFrame index by 'item_idx' (internal_id) with ['genres', 'popularity_bin']
+    items_df: ItemCatalog, or DataFrame index by 'item_idx' (internal_id) with ['genres', 'popularity_bin']
+
+    Similarity is genre Jaccard (popcount of AND / OR of the genre bitmasks), or
+    same-popularity-bin when either item has no genres. Each candidate's max
+    similarity to the selected set is updated incrementally after every pick.
     """
+    catalog = as_catalog(items_df)
+
     # Sorted by relevance initially
     candidates = user_candidates.sort_values('cand_score', ascending=False).to_dict('records')
-    
+    if not candidates:
+        return []
+
+    ids = np.array([c['item_idx'] for c in candidates], dtype=np.int64)
+    relevance = np.array([c['cand_score'] for c in candidates], dtype=np.float64)
+    masks = catalog.genre_masks[ids]
+    bins = catalog.bin_codes[ids]
+    has_genres = masks != 0
+
+    max_sim = np.zeros(len(ids))
+    available = np.ones(len(ids), dtype=bool)
     selected_items = []
-    
-    # Pre-fetch attributes for speed
-    # We want a dict: item_idx -> attributes
-    # We only care about candidates
-    cand_ids = [c['item_idx'] for c in candidates]
-    cand_items_info = items_df.loc[cand_ids]
-    
-    while len(selected_items) < top_n and len(candidates) > 0:
-        best_score = -np.inf
-        best_item_idx = -1
-        best_item_entry = None
-        
-        # In first iteration, pick max relevance (since similarity penalty logic handles empty S)
-        # Standard MMR: argmax_{i in R} [ lambda * sim(u, i) - (1-lambda) * max_{j in S} sim(i, j) ]
-        # Here relevance is sim(u, i) -> cand_score
-        
-        for item in candidates:
-            relevance = item['cand_score']
-            item_idx = item['item_idx']
-            
-            # calculate max similarity to selected
-            max_sim = 0.0
-            for selected in selected_items:
-                sel_idx = selected['item_idx']
-                
-                # Check if genres exist
-                # items_df might have NaN for genres if dataset lacks it
-                g1 = cand_items_info.at[item_idx, 'genres']
-                g2 = cand_items_info.at[sel_idx, 'genres']
-                
-                if pd.notna(g1) and pd.notna(g2) and g1 != '' and g2 != '':
-                    sim = jaccard_similarity(g1, g2)
-                else:
-                    # Fallback to popularity bin
-                    p1 = cand_items_info.at[item_idx, 'popularity_bin']
-                    p2 = cand_items_info.at[sel_idx, 'popularity_bin']
-                    sim = popularity_similarity(p1, p2)
-                
-                if sim > max_sim:
-                    max_sim = sim
-            
-            mmr_score = lambda_param * relevance - (1 - lambda_param) * max_sim
-            
-            if mmr_score > best_score:
-                best_score = mmr_score
-                best_item_idx = item_idx
-                best_item_entry = item
-                
+
+    # Standard MMR: argmax_{i in R} [ lambda * sim(u, i) - (1-lambda) * max_{j in S} sim(i, j) ]
+    # Here relevance is sim(u, i) -> cand_score
+    while len(selected_items) < top_n and available.any():
+        mmr_scores = lambda_param * relevance - (1 - lambda_param) * max_sim
+        mmr_scores[~available] = -np.inf
+        best = int(np.argmax(mmr_scores))
+
         # Move best item to selected
-        if best_item_entry:
-            selected_entry = best_item_entry.copy()
-            selected_entry['mmr_score'] = best_score
-            selected_entry['base_score'] = best_item_entry['cand_score'] # rename
-            # Add metadata
-            selected_entry['popularity_bin'] = cand_items_info.at[best_item_idx, 'popularity_bin']
-            selected_items.append(selected_entry)
-            
-            # Remove from candidates list
-            candidates = [c for c in candidates if c['item_idx'] != best_item_idx]
-        else:
-            break
-            
+        selected_entry = candidates[best].copy()
+        selected_entry['mmr_score'] = float(mmr_scores[best])
+        selected_entry['base_score'] = candidates[best]['cand_score'] # rename
+        # Add metadata
+        selected_entry['popularity_bin'] = catalog.bin_name(ids[best])
+        selected_items.append(selected_entry)
+        available[ids == ids[best]] = False
+
+        # Similarity of every candidate to the newly selected item
+        union = popcount(masks | masks[best])
+        jaccard = popcount(masks & masks[best]) / np.maximum(union, 1)
+        same_bin = ((bins == bins[best]) & (bins >= 0)).astype(np.float64)
+        sim = np.where(has_genres & has_genres[best], jaccard, same_bin)
+        np.maximum(max_sim, sim, out=max_sim)
+
     return selected_items
 
 def run_mmr_for_users(candidates_df, items_df, lambda_param, top_n):
@@ -112,15 +91,14 @@ def run_mmr_for_users(candidates_df, items_df, lambda_param, top_n):
     """
     logger.info(f"Running MMR with lambda={lambda_param}, top_n={top_n}")
     
-    # Ensure items_df is indexed by internal_id (item_idx)
-    if items_df.index.name != 'internal_id' and 'internal_id' in items_df.columns:
-        items_df = items_df.set_index('internal_id')
+    # Item attributes as arrays, built once for all users
+    catalog = as_catalog(items_df)
     
     results = []
     
     # Group by user
     for user_idx, group in candidates_df.groupby('user_idx'):
-        reranked = mmr_rerank(group, items_df, lambda_param, top_n)
+        reranked = mmr_rerank(group, catalog, lambda_param, top_n)
         for rank, item in enumerate(reranked):
             item['rank'] = rank + 1
             results.append(item)
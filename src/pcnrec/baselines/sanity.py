@@ -1,5 +1,7 @@
 import pandas as pd
 import numpy as np
+from pcnrec.data.catalog import as_catalog
+from pcnrec.verify.constraints import compile_constraints
 
 def run_mf_topn(candidates_df, top_n=10):
     """
@@ -8,86 +10,19 @@ def run_mf_topn(candidates_df, top_n=10):
     # Assuming df sorted by score desc
     return candidates_df.groupby('user_id').head(top_n).groupby('user_id')['item_idx'].apply(list).to_dict()
 
-def run_constrained_greedy(candidates_df, items_df, constraints, top_n=10, window=100):
-    """
-    Determinisitically selects items to satisfy constraints.
-    Returns dict: user_id -> [list of item_ids]
-    """
-    
-    # Pre-process candidates
-    # Ensure sorted
-    df = candidates_df.sort_values(['user_id', 'cand_score'], ascending=[True, False])
-    
-    users = df['user_id'].unique()
-    results = {}
-    
-    pop_config = constraints.get('popularity', {})
-    div_config = constraints.get('diversity', {})
-    
-    max_head = pop_config.get('max_head_in_topn', 10)
-    min_tail = pop_config.get('min_tail_in_topn', 0)
-    min_genres = div_config.get('min_unique_genres_in_topn', 0)
-    
 def solve_constrained_greedy_user(user_cands_df, items_df, constraints, top_n=10):
     """
     Solves for a single user. Returns list of item_ids.
-    """
-    valid_items = []
-    for _, row in user_cands_df.iterrows():
-        iid = row['item_idx']
-        if iid not in items_df.index:
-            continue
-        idata = items_df.loc[iid]
-        
-        pbin = idata.get('popularity_bin', 'torso')
-        gstr = idata.get('genres', "")
-        gset = set(gstr.split('|')) if gstr else set()
-        
-        valid_items.append({
-            'id': iid,
-            'bin': pbin,
-            'genres': gset,
-            'score': row['cand_score']
-        })
-        
-    pop_config = constraints.get('popularity', {})
-    div_config = constraints.get('diversity', {})
-    
-    max_head = pop_config.get('max_head_in_topn', 10)
-    min_tail = pop_config.get('min_tail_in_topn', 0)
-    
-    selected = []
-    curr_head = 0
-    curr_tail = 0
-    
-    for item in valid_items:
-        if len(selected) >= top_n:
-            break
-            
-        slots_rem = top_n - len(selected)
-        tail_needed = max(0, min_tail - curr_tail)
-        
-        is_tail = item['bin'] == 'tail'
-        is_head = item['bin'] == 'head'
-        
-        # Rule 1: Must we take a tail item?
-        if slots_rem <= tail_needed:
-            if is_tail:
-                selected.append(item)
-                curr_tail += 1
-            # Skip non-tail if we are forced to take tail
-            continue 
-        
-        # Rule 2: Max Head limit
-        if is_head and curr_head >= max_head:
-            continue
-            
-        # Otherwise take it
-        selected.append(item)
-        if is_tail: curr_tail += 1
-        if is_head: curr_head += 1
-        
-    return [x['id'] for x in selected]
+    items_df may be an ItemCatalog (preferred) or the items frame.
+    Walks candidates in order: max-type constraints (max_head_in_topn, ...)
+    skip items, and once the remaining slots are needed by unmet min-type
+    constraints (min_tail_in_topn, ...) only items that help them are taken
+    (ConstraintPlan.greedy).
+    """
+    catalog = as_catalog(items_df)
+    ids = user_cands_df['item_idx'].to_numpy(dtype=np.int64)
+    ids = ids[(ids >= 0) & (ids < catalog.num_items)]
+    return compile_constraints(constraints, catalog).greedy(ids, top_n)
 
 def run_constrained_greedy(candidates_df, items_df, constraints, top_n=10, window=100):
     """
@@ -101,9 +36,10 @@ def run_constrained_greedy(candidates_df, items_df, constraints, top_n=10, windo
     
     users = df['user_id'].unique()
     results = {}
+    catalog = as_catalog(items_df)
     
     for uid in users:
         u_cands = df[df['user_id'] == uid].head(window)
-        results[uid] = solve_constrained_greedy_user(u_cands, items_df, constraints, top_n)
+        results[uid] = solve_constrained_greedy_user(u_cands, catalog, constraints, top_n)
         
     return results
@@ -0,0 +1,158 @@
+import time
+import numpy as np
+from pcnrec.candidates.scoring import topk_rows
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+def kmeans(x, n_clusters, n_iter=20, seed=42, max_train_points=None):
+    """
+    Plain Lloyd's k-means in NumPy. Returns (centroids, assignments) for all rows of x.
+    Centroids are fit on a random sample of at most max_train_points rows.
+    """
+    rng = np.random.default_rng(seed)
+    n = x.shape[0]
+    n_clusters = min(n_clusters, n)
+
+    train = x
+    if max_train_points is not None and n > max_train_points:
+        train = x[rng.choice(n, max_train_points, replace=False)]
+
+    centroids = train[rng.choice(train.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assign = _nearest(train, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, train)
+        counts = np.bincount(assign, minlength=n_clusters)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters with random points
+        if empty.any():
+            centroids[empty] = train[rng.choice(train.shape[0], int(empty.sum()), replace=False)]
+
+    return centroids, _nearest(x, centroids)
+
+def _nearest(x, centroids, chunk=65536):
+    """Index of the nearest centroid (L2) for each row of x."""
+    c_norm = (centroids ** 2).sum(axis=1)
+    out = np.empty(x.shape[0], dtype=np.int64)
+    for start in range(0, x.shape[0], chunk):
+        block = x[start:start + chunk]
+        # argmin ||x - c||^2 == argmin (||c||^2 - 2 x.c)
+        out[start:start + chunk] = np.argmin(c_norm[None, :] - 2 * block @ centroids.T, axis=1)
+    return out
+
+class IVFRetriever:
+    """
+    Inverted-file (IVF) approximate top-K over the item embeddings.
+
+    Item vectors are augmented as [v_i, b_i] and user queries as [u, 1], so the
+    inner product equals the LightFM score minus the (rank-neutral) user bias.
+    Items are clustered into n_lists with k-means; each user scores only the
+    items in the n_probe lists whose centroids have the highest inner product
+    with the query. Cost per user is O(n_lists + n_probe / n_lists * num_items).
+
+    Exposes the same topk(user_ids, top_k, seen) interface as EmbeddingScorer.
+    """
+
+    def __init__(self, scorer, n_lists=None, n_probe=8, n_iter=20, seed=42):
+        self.scorer = scorer
+        num_items = scorer.num_items
+        if n_lists is None:
+            n_lists = int(4 * np.sqrt(num_items))
+        self.n_lists = max(1, min(int(n_lists), num_items))
+        self.n_probe = max(1, min(int(n_probe), self.n_lists))
+
+        self.item_vectors = np.hstack([scorer.item_embeddings, scorer.item_biases[:, None]]).astype(np.float32)
+
+        logger.info(f"Building IVF index: {num_items} items, {self.n_lists} lists, n_probe={self.n_probe}")
+        centroids, assign = kmeans(self.item_vectors, self.n_lists, n_iter=n_iter, seed=seed,
+                                   max_train_points=256 * self.n_lists)
+        self.centroids = centroids.astype(np.float32)
+
+        # Inverted lists as CSR: list_items[list_offsets[l]:list_offsets[l + 1]]
+        order = np.argsort(assign, kind='stable')
+        self.list_items = order.astype(np.int32)
+        self.list_offsets = np.zeros(self.n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=self.n_lists), out=self.list_offsets[1:])
+
+    @property
+    def num_users(self):
+        return self.scorer.num_users
+
+    @property
+    def num_items(self):
+        return self.scorer.num_items
+
+    def topk(self, user_ids, top_k, seen=None):
+        """
+        Returns (item_indices, scores), both (B, top_k), sorted by descending score.
+        Users whose probed lists hold fewer than top_k unseen items fall back to exact scoring.
+        """
+        user_ids = np.asarray(user_ids)
+        queries = np.hstack([
+            self.scorer.user_embeddings[user_ids],
+            np.ones((len(user_ids), 1), dtype=np.float32)
+        ])
+        user_biases = self.scorer.user_biases[user_ids]
+
+        probes, _ = topk_rows(queries @ self.centroids.T, self.n_probe)
+
+        top_items = np.empty((len(user_ids), top_k), dtype=np.int64)
+        top_scores = np.empty((len(user_ids), top_k), dtype=np.float32)
+        fallback = []
+
+        for row, user_id in enumerate(user_ids):
+            items = np.concatenate([self.list_items[self.list_offsets[l]:self.list_offsets[l + 1]] for l in probes[row]])
+            scores = self.item_vectors[items] @ queries[row] + user_biases[row]
+            if seen is not None:
+                scores[seen.contains(user_id, items)] = -np.inf
+            if np.isfinite(scores).sum() < top_k:
+                fallback.append(row)
+                continue
+            idx, vals = topk_rows(scores[None, :], top_k)
+            top_items[row] = items[idx[0]]
+            top_scores[row] = vals[0]
+
+        if fallback:
+            exact_items, exact_scores = self.scorer.topk(user_ids[fallback], top_k, seen=seen)
+            top_items[fallback] = exact_items
+            top_scores[fallback] = exact_scores
+
+        return top_items, top_scores
+
+def candidate_recall(approx_items, exact_items):
+    """
+    Mean candidate-recall@K: fraction of each user's exact top-K found by the approximate top-K.
+    Both arguments are (B, K) item-id arrays.
+    """
+    k = exact_items.shape[1]
+    hits = [len(np.intersect1d(a, e, assume_unique=True)) for a, e in zip(approx_items, exact_items)]
+    return float(np.mean(hits) / k) if hits else 0.0
+
+def evaluate_retriever(retriever, seen, top_k, n_users=1000, seed=42):
+    """
+    Compares an approximate retriever with exact scoring on a random user sample.
+    Returns candidate-recall@top_k and users/sec for both paths.
+    """
+    rng = np.random.default_rng(seed)
+    n_users = min(n_users, retriever.num_users)
+    users = np.sort(rng.choice(retriever.num_users, n_users, replace=False))
+
+    t0 = time.perf_counter()
+    approx_items, _ = retriever.topk(users, top_k, seen=seen)
+    approx_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    exact_items, _ = retriever.scorer.topk(users, top_k, seen=seen)
+    exact_s = time.perf_counter() - t0
+
+    return {
+        'n_users': int(n_users),
+        'top_k': int(top_k),
+        'n_lists': retriever.n_lists,
+        'n_probe': retriever.n_probe,
+        f'candidate_recall@{top_k}': candidate_recall(approx_items, exact_items),
+        'approx_users_per_sec': n_users / approx_s if approx_s > 0 else None,
+        'exact_users_per_sec': n_users / exact_s if exact_s > 0 else None
+    }
@@ -1,82 +1,130 @@
 import numpy as np
 import pandas as pd
 from pcnrec.utils.logging import setup_logger
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.candidates.ann import IVFRetriever
+from pcnrec.candidates.io import attach_item_info, CandidateWriter
+from pcnrec.data.interaction_index import InteractionIndex
 from tqdm import tqdm
 
 logger = setup_logger(__name__)
 
+def seen_index(train, num_items):
+    """
+    Returns the CSR index of seen items. train may already be an InteractionIndex
+    or an interactions frame with user_idx/item_idx.
+    """
+    if isinstance(train, InteractionIndex):
+        return train
+    return InteractionIndex.from_frame(train, num_items=num_items)
+
+def _check_top_k(top_k, num_items):
+    top_k = min(top_k, num_items)
+    if top_k > np.iinfo(np.int16).max:
+        raise ValueError(f"top_k={top_k} does not fit the int16 rank column")
+    return top_k
+
+def build_retriever(model, num_items, num_threads=1, retrieval="exact", ivf=None):
+    """
+    Builds the top-K retriever for a model.
+    retrieval="exact" scores every item (EmbeddingScorer); "ivf" uses the approximate
+    IVFRetriever with params from ivf (n_lists, n_probe, n_iter).
+    model may be a LightFM model or an EmbeddingScorer (e.g. from model_store.load_embeddings).
+    Any other object with a topk method (a prebuilt retriever) is returned as is.
+    """
+    if isinstance(model, EmbeddingScorer):
+        scorer = model
+    elif hasattr(model, 'topk'):
+        return model
+    else:
+        scorer = EmbeddingScorer.from_lightfm(model, num_threads=num_threads)
+    if scorer.num_items != num_items:
+        logger.warning(f"Model has {scorer.num_items} items, expected {num_items}")
+
+    if retrieval == "exact":
+        return scorer
+    if retrieval == "ivf":
+        ivf = ivf or {}
+        return IVFRetriever(
+            scorer,
+            n_lists=ivf.get('n_lists'),
+            n_probe=ivf.get('n_probe', 8),
+            n_iter=ivf.get('n_iter', 20),
+            seed=ivf.get('seed', 42)
+        )
+    raise ValueError(f"Unknown retrieval mode: {retrieval}")
+
+def iter_candidate_batches(scorer, seen, user_ids, top_k, batch_size=1000):
+    """
+    Yields (batch_users, top_items, top_scores) for consecutive user batches.
+    top_items/top_scores are (len(batch_users), top_k), sorted by score per row.
+    """
+    user_ids = np.asarray(user_ids, dtype=np.int32)
+    for start in tqdm(range(0, len(user_ids), batch_size)):
+        batch_users = user_ids[start:start + batch_size]
+        top_items, top_scores = scorer.topk(batch_users, top_k, seen=seen)
+        yield batch_users, top_items, top_scores
+
 def generate_candidates(model, train_df, num_users, num_items, top_k, num_threads=1, batch_size=1000, items_df=None):
     """
     Generates top-K candidates for each user.
-    Excludes items seen in train.
+    Excludes items seen in train (train_df may be a frame or a prebuilt InteractionIndex).
+    Scores each user batch as one matrix multiply (see EmbeddingScorer).
+    model may also be a prebuilt retriever from build_retriever (e.g. IVF).
+
+    Output is columnar: user_idx/item_idx int32, cand_score float32, rank int16,
+    filled into preallocated arrays. Item metadata is not
+    joined unless items_df is given; use candidates.io.attach_item_info at read time.
+    For large runs prefer write_candidates, which streams batches to parquet.
     """
     logger.info("Generating candidates...")
-    
-    # Create a set of seen items per user for fast lookup
-    seen_items = train_df.groupby('user_idx')['item_idx'].apply(set).to_dict()
-    
-    all_users = np.arange(num_users)
-    all_items = np.arange(num_items)
-    
-    results = []
-    
+
+    scorer = build_retriever(model, num_items, num_threads)
+    seen = seen_index(train_df, num_items)
+    top_k = _check_top_k(top_k, num_items)
+
+    all_users = np.arange(num_users, dtype=np.int32)
+    n_rows = num_users * top_k
+
+    user_col = np.repeat(all_users, top_k)
+    item_col = np.empty(n_rows, dtype=np.int32)
+    score_col = np.empty(n_rows, dtype=np.float32)
+    rank_col = np.tile(np.arange(1, top_k + 1, dtype=np.int16), num_users)
+
     # Process users in batches to manage memory
-    for start in tqdm(range(0, num_users, batch_size)):
-        end = min(start + batch_size, num_users)
-        batch_users = all_users[start:end]
-        
-        # Predict scores for all items for these users
-        # model.predict takes (user_ids, item_ids)
-        # We need to predict for every user against every item
-        # LightFM predict is efficient if we broadcast? No, it expects equal length arrays.
-        # But for batch generation, we loop or repeat.
-        # LightFM doesn't have a bulk 'predict_rank' easily accessible without dataset object quirks.
-        # Efficient way: user_embedding * item_embedding + biases
-        # But let's stick to model.predict for correctness with LightFM logic (biases etc)
-        
-        # ACTUALLY, model.predict runs for pairs.
-        # To score all items for one user: model.predict(user_id, np.arange(num_items))
-        
-        for user_id in batch_users:
-            # LightFM expects user_ids and item_ids to be same length arrays
-            user_ids_repeated = np.full(len(all_items), user_id, dtype=np.int32)
-            scores = model.predict(user_ids_repeated, all_items, num_threads=1)
-            
-            # Mask seen items
-            if user_id in seen_items:
-                seen = list(seen_items[user_id])
-                scores[seen] = -np.inf
-                
-            # Top K
-            # argpartition is faster than argsort
-            if len(scores) > top_k:
-                top_k_indices = np.argpartition(scores, -top_k)[-top_k:]
-                # Sort the top k
-                top_k_indices = top_k_indices[np.argsort(-scores[top_k_indices])]
-            else:
-                top_k_indices = np.argsort(-scores)
-            
-            top_scores = scores[top_k_indices]
-            
-            for rank, (item_idx, score) in enumerate(zip(top_k_indices, top_scores)):
-                results.append({
-                    'user_idx': user_id,
-                    'item_idx': item_idx,
-                    'cand_score': float(score),
-                    'rank': rank + 1
-                })
-                
-    results_df = pd.DataFrame(results)
-    
-    # Join with item info if provided
+    pos = 0
+    for batch_users, top_items, top_scores in iter_candidate_batches(scorer, seen, all_users, top_k, batch_size):
+        n = top_items.size
+        item_col[pos:pos + n] = top_items.ravel()
+        score_col[pos:pos + n] = top_scores.ravel()
+        pos += n
+
+    results_df = pd.DataFrame({
+        'user_idx': user_col,
+        'item_idx': item_col,
+        'cand_score': score_col,
+        'rank': rank_col
+    })
+
     if items_df is not None:
-        # items_df has 'internal_id' which is 'item_idx'
-        # We need to map item_idx -> popularity_count, popularity_bin, original_id
-        # items_df columns: original_id, internal_id, title, genres, popularity_count, popularity_bin
-        
-        # Create a lookup
-        items_info = items_df.set_index('internal_id')[['original_id', 'title', 'genres', 'popularity_count', 'popularity_bin']]
-        
-        results_df = results_df.join(items_info, on='item_idx')
-        
+        results_df = attach_item_info(results_df, items_df)
+
     return results_df
+
+def write_candidates(model, train_df, num_users, num_items, top_k, out_path, num_threads=1, batch_size=1000):
+    """
+    Generates top-K candidates and streams them to out_path, one parquet row group per user batch.
+    Only one batch is held in memory at a time. Returns the number of rows written.
+    """
+    logger.info(f"Generating candidates (streaming to {out_path})...")
+
+    scorer = build_retriever(model, num_items, num_threads)
+    seen = seen_index(train_df, num_items)
+    top_k = _check_top_k(top_k, num_items)
+
+    all_users = np.arange(num_users, dtype=np.int32)
+    with CandidateWriter(out_path) as writer:
+        for batch_users, top_items, top_scores in iter_candidate_batches(scorer, seen, all_users, top_k, batch_size):
+            writer.write_batch(batch_users, top_items, top_scores)
+
+    return writer.num_rows
@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pcnrec.utils.io import ensure_dir, load_parquet
+
+ITEM_INFO_COLUMNS = ['original_id', 'title', 'genres', 'popularity_count', 'popularity_bin']
+
+CANDIDATE_SCHEMA = pa.schema([
+    ('user_idx', pa.int32()),
+    ('item_idx', pa.int32()),
+    ('cand_score', pa.float32()),
+    ('rank', pa.int16())
+])
+
+def candidate_table(user_ids, top_items, top_scores):
+    """
+    Builds a CANDIDATE_SCHEMA table from a scored batch.
+    user_ids: (B,) ; top_items/top_scores: (B, k) sorted by score per row.
+    """
+    n_users, k = top_items.shape
+    return pa.table({
+        'user_idx': np.repeat(np.asarray(user_ids, dtype=np.int32), k),
+        'item_idx': top_items.astype(np.int32, copy=False).ravel(),
+        'cand_score': top_scores.astype(np.float32, copy=False).ravel(),
+        'rank': np.tile(np.arange(1, k + 1, dtype=np.int16), n_users)
+    }, schema=CANDIDATE_SCHEMA)
+
+class CandidateWriter:
+    """
+    Streams candidate batches to a parquet file, one row group per batch.
+    Batches must arrive in ascending user_idx order so that row-group
+    min/max statistics on user_idx can be used to prune reads by user range.
+    """
+
+    def __init__(self, path):
+        ensure_dir(os.path.dirname(path))
+        self.path = path
+        self.num_rows = 0
+        self._writer = pq.ParquetWriter(path, CANDIDATE_SCHEMA, write_statistics=True)
+
+    def write_batch(self, user_ids, top_items, top_scores):
+        """
+        user_ids: (B,) ; top_items/top_scores: (B, k) sorted by score per row.
+        """
+        self.write_table(candidate_table(user_ids, top_items, top_scores))
+
+    def write_table(self, table):
+        self._writer.write_table(table, row_group_size=max(1, table.num_rows))
+        self.num_rows += table.num_rows
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def attach_item_info(candidates_df, items_df, columns=None):
+    """
+    Joins item metadata onto a compact (user_idx, item_idx, cand_score, rank) candidates frame.
+    Candidates are stored without metadata; this is done at read time, only for the rows read.
+    items_df may be indexed by internal_id or carry it as a column.
+    """
+    columns = columns or ITEM_INFO_COLUMNS
+    missing = [c for c in columns if c not in candidates_df.columns]
+    if not missing:
+        return candidates_df
+
+    if items_df.index.name != 'internal_id' and 'internal_id' in items_df.columns:
+        items_df = items_df.set_index('internal_id')
+    missing = [c for c in missing if c in items_df.columns]
+    items_info = items_df[missing]
+
+    # Few distinct values: keep as a small dictionary instead of one string per row
+    if 'popularity_bin' in items_info.columns:
+        items_info = items_info.astype({'popularity_bin': 'category'})
+
+    return candidates_df.join(items_info, on='item_idx')
+
+def read_candidate_users(path):
+    """
+    Returns the sorted unique user_idx values in a candidates file (reads one column).
+    """
+    users = pq.read_table(path, columns=['user_idx']).column('user_idx').to_numpy()
+    return np.unique(users)
+
+def parse_shard(spec):
+    """'i/n' (the scripts' --shard argument) -> (i, n), shard i of n counted from 0."""
+    shard_idx, shard_total = map(int, spec.split('/'))
+    if not 0 <= shard_idx < shard_total:
+        raise ValueError(f"Invalid shard {spec!r}: expected i/n with 0 <= i < n")
+    return shard_idx, shard_total
+
+def shard_bounds(num_users, shard_idx, shard_total):
+    """
+    (start, end) positions of shard shard_idx in a sorted user list of length
+    num_users. Every sharded script splits users here, so run, evaluation
+    and audit shards cover the same users.
+    """
+    chunk_size = num_users // shard_total + 1
+    start = min(shard_idx * chunk_size, num_users)
+    return start, min((shard_idx + 1) * chunk_size, num_users)
+
+def load_candidates(path, items_df=None, columns=None, user_range=None):
+    """
+    Loads candidates_topk.parquet, attaching item metadata if items_df is given.
+    user_range=(lo, hi) keeps users lo <= user_idx < hi; the predicate is pushed
+    down so only row groups overlapping the range are read.
+    """
+    filters = None
+    if user_range is not None:
+        lo, hi = user_range
+        filters = [('user_idx', '>=', int(lo)), ('user_idx', '<', int(hi))]
+
+    df = load_parquet(path, columns=columns, filters=filters)
+    if items_df is not None:
+        df = attach_item_info(df, items_df)
+    return df
@@ -0,0 +1,82 @@
+import os
+import json
+import hashlib
+import numpy as np
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+EMBEDDINGS_DIR = "lightfm_embeddings"
+HEADER_FILE = "header.json"
+FORMAT_VERSION = 1
+ARRAYS = ['user_embeddings', 'user_biases', 'item_embeddings', 'item_biases']
+
+def config_hash(params):
+    """Short stable hash of a config section (e.g. config['candidates'])."""
+    blob = json.dumps(params, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(blob).hexdigest()[:16]
+
+def export_embeddings(model, out_dir, params=None):
+    """
+    Writes a fitted LightFM model as plain float32 .npy arrays plus header.json:
+        user_embeddings.npy (num_users, dim)   user_biases.npy (num_users,)
+        item_embeddings.npy (num_items, dim)   item_biases.npy (num_items,)
+    model may also be an EmbeddingScorer. params (the candidates config) is
+    recorded as config_hash. Returns the header dict.
+    """
+    scorer = model if isinstance(model, EmbeddingScorer) else EmbeddingScorer.from_lightfm(model)
+    ensure_dir(out_dir)
+    for name in ARRAYS:
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.ascontiguousarray(getattr(scorer, name), dtype=np.float32))
+
+    header = {
+        'format_version': FORMAT_VERSION,
+        'num_users': int(scorer.num_users),
+        'num_items': int(scorer.num_items),
+        'dim': int(scorer.user_embeddings.shape[1]),
+        'dtype': 'float32',
+        'config_hash': config_hash(params) if params is not None else None,
+        'files': {name: f"{name}.npy" for name in ARRAYS}
+    }
+    # Header last: its presence marks a complete export
+    with open(os.path.join(out_dir, HEADER_FILE), 'w') as f:
+        json.dump(header, f, indent=2)
+    return header
+
+def read_header(model_dir):
+    """Returns the parsed header.json, or None if no export exists in model_dir."""
+    path = os.path.join(model_dir, HEADER_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def load_embeddings(model_dir, mmap=True, num_threads=1):
+    """
+    Loads an exported model as an EmbeddingScorer.
+    With mmap=True the arrays are opened with np.load(mmap_mode='r'): nothing is
+    read up front and processes loading the same files share the page cache.
+    """
+    header = read_header(model_dir)
+    if header is None:
+        raise FileNotFoundError(f"No {HEADER_FILE} in {model_dir}")
+    if header.get('format_version') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embeddings format: {header.get('format_version')}")
+
+    arrays = {
+        name: np.load(os.path.join(model_dir, header['files'][name]), mmap_mode='r' if mmap else None)
+        for name in ARRAYS
+    }
+    expected = {
+        'user_embeddings': (header['num_users'], header['dim']),
+        'user_biases': (header['num_users'],),
+        'item_embeddings': (header['num_items'], header['dim']),
+        'item_biases': (header['num_items'],)
+    }
+    for name, shape in expected.items():
+        if arrays[name].shape != shape:
+            raise ValueError(f"{name} has shape {arrays[name].shape}, header says {shape}")
+
+    return EmbeddingScorer(num_threads=num_threads, source=model_dir, **arrays)
@@ -0,0 +1,169 @@
+import os
+import json
+import numpy as np
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.candidates.io import CandidateWriter
+from pcnrec.data.interaction_index import InteractionIndex
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+class SharedArrays:
+    """
+    Copies a dict of NumPy arrays into named shared-memory blocks once.
+    Workers attach with attach_arrays(spec) and get zero-copy views.
+    """
+
+    def __init__(self, arrays):
+        self._blocks = []
+        self.spec = {}
+        for name, arr in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, arr.nbytes))
+            np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+            self._blocks.append(shm)
+            self.spec[name] = (shm.name, arr.shape, arr.dtype.str)
+
+    def close(self):
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _attach(shm_name):
+    # The parent owns (and unlinks) the blocks. Before Python 3.13 there is no
+    # track flag; pool workers share the parent's resource tracker, so the
+    # duplicate registration is harmless.
+    try:
+        return shared_memory.SharedMemory(name=shm_name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=shm_name)
+
+def attach_arrays(spec):
+    """
+    Returns ({name: array view}, handles). Keep handles alive while the views are used.
+    """
+    handles, arrays = [], {}
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = _attach(shm_name)
+        handles.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return arrays, handles
+
+def _write_shard(arrays, num_items, lo, hi, top_k, batch_size, part_path, model_dir=None):
+    from pcnrec.candidates.generate_candidates import iter_candidate_batches
+    from pcnrec.candidates.model_store import load_embeddings
+
+    if model_dir is not None:
+        # Exported model: map the .npy files, pages are shared through the OS cache
+        scorer = load_embeddings(model_dir, mmap=True)
+    else:
+        scorer = EmbeddingScorer(
+            arrays['user_embeddings'], arrays['user_biases'],
+            arrays['item_embeddings'], arrays['item_biases'],
+            num_threads=1
+        )
+    seen = InteractionIndex(arrays['seen_indptr'], arrays['seen_indices'], num_items)
+    users = np.arange(lo, hi, dtype=np.int32)
+    with CandidateWriter(part_path) as writer:
+        for batch_users, top_items, top_scores in iter_candidate_batches(scorer, seen, users, top_k, batch_size):
+            writer.write_batch(batch_users, top_items, top_scores)
+    return writer.num_rows
+
+def _score_shard(spec, num_items, lo, hi, top_k, batch_size, part_path, model_dir=None):
+    """
+    Worker: scores users lo..hi-1 against the shared embeddings and writes one parquet part.
+    """
+    arrays, handles = attach_arrays(spec)
+    try:
+        return _write_shard(arrays, num_items, lo, hi, top_k, batch_size, part_path, model_dir)
+    finally:
+        # Views must be released before the blocks can be closed
+        arrays.clear()
+        for shm in handles:
+            shm.close()
+
+def merge_parts(part_paths, out_path):
+    """
+    Concatenates part files (already in user order) into out_path, row group by row group.
+    """
+    with CandidateWriter(out_path) as writer:
+        for part in part_paths:
+            pf = pq.ParquetFile(part)
+            for rg in range(pf.num_row_groups):
+                writer.write_table(pf.read_row_group(rg))
+    return writer.num_rows
+
+def write_candidates_parallel(scorer, seen, num_users, top_k, out_path, workers, batch_size=1000, keep_parts=False):
+    """
+    Generates candidates with `workers` processes.
+
+    The embedding matrices and the seen-item CSR are placed in shared memory once
+    (a scorer loaded from an exported model is re-mapped from its .npy files instead);
+    each worker scores a contiguous user range and writes its own part file.
+    Parts are merged into out_path and described in candidates_manifest.json
+    next to it. Returns the manifest dict.
+    """
+    if not isinstance(scorer, EmbeddingScorer):
+        raise ValueError("Parallel generation supports exact retrieval only")
+
+    top_k = min(top_k, scorer.num_items)
+    cand_dir = os.path.dirname(out_path)
+    parts_dir = os.path.join(cand_dir, "parts")
+    ensure_dir(parts_dir)
+
+    ranges = [(int(r[0]), int(r[-1]) + 1) for r in np.array_split(np.arange(num_users), workers) if len(r)]
+    part_paths = [os.path.join(parts_dir, f"candidates_topk.part-{i:05d}.parquet") for i in range(len(ranges))]
+
+    logger.info(f"Generating candidates for {num_users} users with {len(ranges)} workers")
+
+    shared = {'seen_indptr': seen.indptr, 'seen_indices': seen.indices}
+    if scorer.source is None:
+        shared.update({
+            'user_embeddings': scorer.user_embeddings,
+            'user_biases': scorer.user_biases,
+            'item_embeddings': scorer.item_embeddings,
+            'item_biases': scorer.item_biases
+        })
+    with SharedArrays(shared) as arrays:
+        with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [
+                pool.submit(_score_shard, arrays.spec, scorer.num_items, lo, hi, top_k, batch_size, path, scorer.source)
+                for (lo, hi), path in zip(ranges, part_paths)
+            ]
+            part_rows = [f.result() for f in futures]
+
+    logger.info(f"Merging {len(part_paths)} parts into {out_path}")
+    total_rows = merge_parts(part_paths, out_path)
+
+    manifest = {
+        'path': os.path.basename(out_path),
+        'num_users': int(num_users),
+        'top_k': int(top_k),
+        'num_rows': int(total_rows),
+        'workers': len(ranges),
+        'parts': [
+            {'path': os.path.relpath(path, cand_dir), 'user_range': [lo, hi], 'num_rows': int(rows)}
+            for (lo, hi), path, rows in zip(ranges, part_paths, part_rows)
+        ]
+    }
+    with open(os.path.join(cand_dir, "candidates_manifest.json"), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    if not keep_parts:
+        for path in part_paths:
+            os.remove(path)
+        if not os.listdir(parts_dir):
+            os.rmdir(parts_dir)
+
+    return manifest
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pcnrec.candidates.io import CandidateWriter, candidate_table, CANDIDATE_SCHEMA
+from pcnrec.data.interaction_index import InteractionIndex
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+STATE_DIR = "state"
+_HASH_SEED = 20240601
+
+def _hash_weights(n, seed):
+    """Random odd 64-bit multipliers; deterministic for a given (n, seed)."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, np.iinfo(np.int64).max, size=n, dtype=np.int64).astype(np.uint64) | np.uint64(1)
+
+def embedding_row_hashes(embeddings, biases):
+    """
+    Exact per-row 64-bit hash of [embedding, bias] float32 bits (wrapping uint64 arithmetic).
+    Any bit change in a user's representation changes its hash.
+    """
+    rows = np.hstack([embeddings, biases[:, None]]).astype(np.float32)
+    bits = np.ascontiguousarray(rows).view(np.uint32).astype(np.uint64)
+    with np.errstate(over='ignore'):
+        return (bits * _hash_weights(bits.shape[1], _HASH_SEED)).sum(axis=1, dtype=np.uint64)
+
+def item_digest(scorer):
+    """SHA-256 over item embeddings and biases; a change here affects every user."""
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(scorer.item_embeddings, dtype=np.float32).tobytes())
+    h.update(np.ascontiguousarray(scorer.item_biases, dtype=np.float32).tobytes())
+    return h.hexdigest()
+
+def seen_row_hashes(seen):
+    """
+    Per-user 64-bit set hash of seen items: sum of a random per-item value over the row.
+    Computed with one cumulative sum over the CSR indices.
+    """
+    values = _hash_weights(max(seen.num_items, 1), _HASH_SEED + 1)[seen.indices]
+    with np.errstate(over='ignore'):
+        cs = np.concatenate([np.zeros(1, dtype=np.uint64), np.cumsum(values, dtype=np.uint64)])
+        return cs[seen.indptr[1:]] - cs[seen.indptr[:-1]]
+
+def _base_scorer(retriever):
+    # IVFRetriever wraps an EmbeddingScorer
+    return getattr(retriever, 'scorer', retriever)
+
+def save_generation_state(cand_dir, retriever, seen, num_users, top_k, retrieval="exact"):
+    """
+    Records what candidates_topk.parquet was generated from: the seen-item CSR,
+    per-user representation hashes and the item-side digest.
+    """
+    state_dir = os.path.join(cand_dir, STATE_DIR)
+    ensure_dir(state_dir)
+    scorer = _base_scorer(retriever)
+
+    seen.save(os.path.join(state_dir, "seen.csr.npz"))
+    np.save(os.path.join(state_dir, "user_hashes.npy"),
+            embedding_row_hashes(scorer.user_embeddings[:num_users], scorer.user_biases[:num_users]))
+    with open(os.path.join(state_dir, "state.json"), 'w') as f:
+        json.dump({
+            'num_users': int(num_users),
+            'top_k': int(min(top_k, scorer.num_items)),
+            'retrieval': retrieval,
+            'item_digest': item_digest(scorer)
+        }, f, indent=2)
+
+def load_generation_state(cand_dir):
+    """Returns the saved state dict (with 'seen' and 'user_hashes'), or None."""
+    state_dir = os.path.join(cand_dir, STATE_DIR)
+    path = os.path.join(state_dir, "state.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        state = json.load(f)
+    state['seen'] = InteractionIndex.load(os.path.join(state_dir, "seen.csr.npz"))
+    state['user_hashes'] = np.load(os.path.join(state_dir, "user_hashes.npy"))
+    return state
+
+def _pad(values, n):
+    """First n entries of values, zero-padded if values is shorter."""
+    out = np.zeros(n, dtype=values.dtype)
+    m = min(n, len(values))
+    out[:m] = values[:m]
+    return out
+
+def find_changed_users(state, retriever, seen, num_users, top_k, retrieval="exact"):
+    """
+    Users whose candidates must be recomputed: seen set or user representation
+    changed, or user is new. Returns None when everything must be regenerated
+    (item side, top_k or retrieval mode changed).
+    """
+    scorer = _base_scorer(retriever)
+    if (state['item_digest'] != item_digest(scorer)
+            or state['top_k'] != min(top_k, scorer.num_items) or state.get('retrieval', 'exact') != retrieval):
+        return None
+
+    prev_users = min(state['num_users'], num_users)
+    changed = np.zeros(num_users, dtype=bool)
+    changed[prev_users:] = True
+
+    # Rows that differ in length or item-set hash between the snapshot and now
+    old_seen = state['seen']
+    changed[:prev_users] |= _pad(old_seen.lengths(), prev_users) != _pad(seen.lengths(), prev_users)
+    changed[:prev_users] |= _pad(seen_row_hashes(old_seen), prev_users) != _pad(seen_row_hashes(seen), prev_users)
+
+    user_hashes = embedding_row_hashes(scorer.user_embeddings[:prev_users], scorer.user_biases[:prev_users])
+    changed[:prev_users] |= user_hashes != state['user_hashes'][:prev_users]
+
+    return np.flatnonzero(changed).astype(np.int32)
+
+def _score_users(retriever, seen, users, top_k, batch_size):
+    """Candidate table for a sorted array of users."""
+    tables = []
+    for start in range(0, len(users), batch_size):
+        batch_users = users[start:start + batch_size]
+        top_items, top_scores = retriever.topk(batch_users, top_k, seen=seen)
+        tables.append(candidate_table(batch_users, top_items, top_scores))
+    return pa.concat_tables(tables) if tables else CANDIDATE_SCHEMA.empty_table()
+
+def refresh_candidates(prior_path, retriever, seen, changed_users, num_users, top_k, out_path=None, batch_size=1000):
+    """
+    Recomputes candidates for changed_users only and splices them into the prior artifact.
+
+    The prior file is streamed row group by row group: rows of changed users are
+    dropped, their new rows are scored for that row group's user range and merged
+    in, so memory stays bounded by one row group. Users beyond the prior file
+    (new users) are appended at the end. out_path defaults to prior_path
+    (replaced atomically). Returns the number of rows written.
+    """
+    out_path = out_path or prior_path
+    tmp_path = out_path + ".tmp"
+    changed_users = np.asarray(changed_users, dtype=np.int32)
+    top_k = min(top_k, retriever.num_items)
+
+    logger.info(f"Refreshing candidates for {len(changed_users)} of {num_users} users")
+
+    pf = pq.ParquetFile(prior_path)
+    done_upto = 0
+    with CandidateWriter(tmp_path) as writer:
+        for rg in range(pf.num_row_groups):
+            table = pf.read_row_group(rg, columns=CANDIDATE_SCHEMA.names).cast(CANDIDATE_SCHEMA)
+            if table.num_rows == 0:
+                continue
+            users = table.column('user_idx').to_numpy()
+            hi = int(users.max()) + 1
+
+            keep = ~np.isin(users, changed_users) & (users < num_users)
+            parts = [table.filter(pa.array(keep))]
+
+            # Changed users falling in this row group's range (and any gap before it)
+            sel = changed_users[(changed_users >= done_upto) & (changed_users < hi)]
+            if len(sel):
+                parts.append(_score_users(retriever, seen, sel, top_k, batch_size))
+            done_upto = max(done_upto, hi)
+
+            merged = pa.concat_tables(parts)
+            order = np.argsort(merged.column('user_idx').to_numpy(), kind='stable')
+            if merged.num_rows:
+                writer.write_table(merged.take(pa.array(order)))
+
+        # New users after the prior file's last user
+        rest = changed_users[changed_users >= done_upto]
+        for start in range(0, len(rest), batch_size):
+            writer.write_table(_score_users(retriever, seen, rest[start:start + batch_size], top_k, batch_size))
+
+    os.replace(tmp_path, out_path)
+    return writer.num_rows
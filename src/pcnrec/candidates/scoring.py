@@ -0,0 +1,109 @@
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+class EmbeddingScorer:
+    """
+    Scores users against the full item catalog with one GEMM per user batch.
+
+    LightFM's score for a (user, item) pair is
+        dot(user_embedding, item_embedding) + user_bias + item_bias
+    so a whole batch of users can be scored as U[batch] @ V.T plus broadcast biases.
+    Embeddings are pulled once from the model (or loaded from arrays) and reused
+    for every batch.
+
+    source: directory of the exported arrays when loaded with
+    model_store.load_embeddings (lets worker processes re-open them memory-mapped).
+    """
+
+    def __init__(self, user_embeddings, user_biases, item_embeddings, item_biases, num_threads=1, source=None):
+        self.user_embeddings = user_embeddings
+        self.user_biases = user_biases
+        self.item_embeddings = item_embeddings
+        self.item_biases = item_biases
+        self.num_threads = max(1, int(num_threads))
+        self.source = source
+
+    @classmethod
+    def from_lightfm(cls, model, num_threads=1):
+        """
+        Pulls user/item representations out of a fitted LightFM model.
+        Uses get_*_representations so identity (no side features) and
+        feature-based models are both handled the way model.predict does.
+        """
+        user_biases, user_embeddings = model.get_user_representations()
+        item_biases, item_embeddings = model.get_item_representations()
+        return cls(
+            np.ascontiguousarray(user_embeddings, dtype=np.float32),
+            np.ascontiguousarray(user_biases, dtype=np.float32),
+            np.ascontiguousarray(item_embeddings, dtype=np.float32),
+            np.ascontiguousarray(item_biases, dtype=np.float32),
+            num_threads=num_threads
+        )
+
+    @property
+    def num_users(self):
+        return self.user_embeddings.shape[0]
+
+    @property
+    def num_items(self):
+        return self.item_embeddings.shape[0]
+
+    def score(self, user_ids):
+        """
+        Returns a (len(user_ids), num_items) float32 score matrix.
+        """
+        user_ids = np.asarray(user_ids)
+        scores = self.user_embeddings[user_ids] @ self.item_embeddings.T
+        scores += self.item_biases[None, :]
+        scores += self.user_biases[user_ids][:, None]
+        return scores
+
+    def _topk_chunk(self, user_ids, top_k, seen):
+        scores = self.score(user_ids)
+        if seen is not None:
+            seen.mask_scores(scores, user_ids)
+        return topk_rows(scores, top_k)
+
+    def topk(self, user_ids, top_k, seen=None):
+        """
+        Scores a batch of users and returns (item_indices, scores), both (B, k),
+        sorted by descending score per row.
+
+        seen: optional InteractionIndex; those items are set to -inf before
+        top-k selection.
+        Work is split across num_threads row chunks; NumPy releases the GIL in
+        matmul and partitioning, so chunks run concurrently.
+        """
+        user_ids = np.asarray(user_ids)
+        if self.num_threads == 1 or len(user_ids) < 2 * self.num_threads:
+            return self._topk_chunk(user_ids, top_k, seen)
+
+        chunks = np.array_split(user_ids, self.num_threads)
+        with ThreadPoolExecutor(max_workers=self.num_threads) as pool:
+            parts = list(pool.map(lambda c: self._topk_chunk(c, top_k, seen), chunks))
+
+        top_items = np.concatenate([p[0] for p in parts])
+        top_scores = np.concatenate([p[1] for p in parts])
+        return top_items, top_scores
+
+def topk_rows(scores, top_k):
+    """
+    Row-wise top-k over a 2-D score matrix.
+    Returns (indices, values) sorted by descending value within each row.
+    """
+    n_cols = scores.shape[1]
+    if top_k < n_cols:
+        # argpartition is faster than a full argsort
+        part = np.argpartition(scores, -top_k, axis=1)[:, -top_k:]
+    else:
+        part = np.broadcast_to(np.arange(n_cols), scores.shape)
+
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+
+    top_items = np.take_along_axis(part, order, axis=1)
+    top_scores = np.take_along_axis(part_scores, order, axis=1)
+    return top_items, top_scores
@@ -0,0 +1,232 @@
+import os
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from lightfm import LightFM
+from scipy.sparse import coo_matrix
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.candidates.parallel import SharedArrays, attach_arrays
+from pcnrec.candidates.train_lightfm import build_interactions
+from pcnrec.data.interaction_index import InteractionIndex
+from pcnrec.utils.io import ensure_dir, save_pickle
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+def grid_trials(space):
+    """
+    All combinations of a {param: [values]} space. Scalars are treated as fixed values.
+    """
+    names = list(space)
+    values = [v if isinstance(v, list) else [v] for v in space.values()]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+def random_trials(space, n_trials, seed=42):
+    """
+    n_trials random draws from a space whose values are lists (uniform choice),
+    {low, high[, log]} ranges (float, or int if both bounds are ints), or scalars.
+    """
+    rng = np.random.default_rng(seed)
+    trials = []
+    for _ in range(n_trials):
+        trial = {}
+        for name, spec in space.items():
+            if isinstance(spec, list):
+                trial[name] = spec[rng.integers(len(spec))]
+            elif isinstance(spec, dict):
+                low, high = spec['low'], spec['high']
+                if spec.get('log'):
+                    value = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+                else:
+                    value = float(rng.uniform(low, high))
+                trial[name] = int(round(value)) if isinstance(low, int) and isinstance(high, int) else value
+            else:
+                trial[name] = spec
+        trials.append(trial)
+    return trials
+
+def recall_at_windows(scorer, seen, test_index, user_ids, windows, batch_size=1000):
+    """
+    Mean recall@w of the model's ranking (seen items excluded) against test_index,
+    for every w in windows. One top-max(windows) pass serves all windows.
+    """
+    windows = sorted(set(int(w) for w in windows))
+    depth = min(windows[-1], scorer.num_items)
+    hits = np.zeros((len(user_ids), len(windows)), dtype=np.int64)
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        top_items, _ = scorer.topk(batch, depth, seen=seen)
+        cum_hits = np.cumsum(test_index.contains(batch[:, None], top_items), axis=1)
+        for j, w in enumerate(windows):
+            hits[start:start + len(batch), j] = cum_hits[:, min(w, depth) - 1]
+
+    n_relevant = test_index.lengths(user_ids)[:, None]
+    recall = (hits / n_relevant).mean(axis=0)
+    return {f'recall@{w}': float(r) for w, r in zip(windows, recall)}
+
+def _should_prune(reports, epoch, value, min_reports):
+    """Median pruning: stop if value is below the median of other trials at this epoch."""
+    others = list(reports.get(epoch, []))
+    if len(others) < min_reports:
+        return False
+    return value < float(np.median(others))
+
+def _run_trial(spec, dims, trial_id, params, sweep_cfg, reports, lock, trial_dir):
+    """
+    Worker: trains one LightFM configuration on the shared interaction matrix,
+    evaluates every eval_every epochs and prunes against other trials' reports.
+    """
+    arrays, handles = attach_arrays(spec)
+    try:
+        num_users, num_items = dims
+        interactions = coo_matrix((arrays['data'], (arrays['row'], arrays['col'])), shape=(num_users, num_items))
+        seen = InteractionIndex(arrays['seen_indptr'], arrays['seen_indices'], num_items)
+        test_index = InteractionIndex(arrays['test_indptr'], arrays['test_indices'], num_items)
+        users = arrays['eval_users']
+
+        model = LightFM(
+            no_components=int(params['factors']),
+            learning_rate=float(params['learning_rate']),
+            loss=params['loss'],
+            random_state=sweep_cfg.get('seed', 42)
+        )
+
+        top_k = sweep_cfg['top_k']
+        windows = sorted(set(sweep_cfg['windows']) | {top_k})
+        eval_every = max(1, sweep_cfg.get('eval_every', 5))
+        epochs = int(params['epochs'])
+
+        result = {'trial': trial_id, **params, 'status': 'complete', 'epochs_run': 0}
+        for epoch in range(1, epochs + 1):
+            model.fit_partial(interactions, epochs=1, num_threads=sweep_cfg.get('num_threads', 1))
+            result['epochs_run'] = epoch
+            if epoch % eval_every and epoch != epochs:
+                continue
+
+            scorer = EmbeddingScorer.from_lightfm(model)
+            metrics = recall_at_windows(scorer, seen, test_index, users, windows)
+            result.update(metrics)
+            value = metrics[f'recall@{top_k}']
+
+            with lock:
+                pruned = epoch != epochs and _should_prune(reports, epoch, value, sweep_cfg.get('prune_after', 3))
+                reports[epoch] = list(reports.get(epoch, [])) + [value]
+            if pruned:
+                result['status'] = 'pruned'
+                return result
+
+        model_path = os.path.join(trial_dir, f"trial_{trial_id:03d}.pkl")
+        save_pickle(model, model_path)
+        result['model_path'] = model_path
+        return result
+    finally:
+        arrays.clear()
+        for shm in handles:
+            shm.close()
+
+def _scalar(value):
+    # numpy scalars from the leaderboard row -> plain Python for JSON/YAML
+    return value.item() if hasattr(value, 'item') else value
+
+def recommend_window(row, windows, top_k, target_ratio):
+    """
+    Smallest window whose recall reaches target_ratio of recall@top_k.
+    """
+    full = row[f'recall@{top_k}']
+    for w in sorted(windows):
+        if row[f'recall@{w}'] >= target_ratio * full:
+            return int(w)
+    return int(top_k)
+
+def run_sweep(train_df, test_df, num_users, num_items, sweep_cfg, out_dir):
+    """
+    Runs a grid or random search of LightFM settings in a process pool.
+
+    The interaction matrix (COO row/col/data), the train/test CSR indexes and
+    the evaluation users are placed in shared memory once and attached read-only
+    by every trial. Trials report recall@top_k every eval_every epochs and are
+    pruned when below the median of earlier reports at the same epoch.
+
+    Moves the best model to best_model.pkl (other trials' models are deleted),
+    writes leaderboard.csv, whose model_path is best_model.pkl for the best
+    trial and blank otherwise, and returns (leaderboard DataFrame, summary dict).
+    """
+    space = sweep_cfg['space']
+    if sweep_cfg.get('search', 'grid') == 'random':
+        trials = random_trials(space, sweep_cfg.get('n_trials', 10), seed=sweep_cfg.get('seed', 42))
+    else:
+        trials = grid_trials(space)
+
+    top_k = sweep_cfg['top_k']
+    windows = sorted(set(sweep_cfg['windows']) | {top_k})
+    trial_dir = os.path.join(out_dir, "trials")
+    ensure_dir(trial_dir)
+
+    interactions = build_interactions(train_df, num_users, num_items)
+    seen = InteractionIndex.from_frame(train_df, num_users=num_users, num_items=num_items)
+    test_index = InteractionIndex.from_frame(test_df, num_users=num_users, num_items=num_items)
+
+    users = np.flatnonzero(test_index.lengths() > 0).astype(np.int32)
+    eval_users = sweep_cfg.get('eval_users')
+    if eval_users and len(users) > eval_users:
+        rng = np.random.default_rng(sweep_cfg.get('seed', 42))
+        users = np.sort(rng.choice(users, eval_users, replace=False))
+
+    shared = {
+        'row': interactions.row, 'col': interactions.col, 'data': interactions.data,
+        'seen_indptr': seen.indptr, 'seen_indices': seen.indices,
+        'test_indptr': test_index.indptr, 'test_indices': test_index.indices,
+        'eval_users': users
+    }
+
+    workers = max(1, min(sweep_cfg.get('workers', 1), len(trials)))
+    logger.info(f"Running {len(trials)} trials with {workers} workers ({len(users)} eval users)")
+
+    with multiprocessing.Manager() as manager, SharedArrays(shared) as arrays:
+        reports, lock = manager.dict(), manager.Lock()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_run_trial, arrays.spec, (num_users, num_items), i, params, sweep_cfg, reports, lock, trial_dir)
+                for i, params in enumerate(trials)
+            ]
+            results = []
+            for f in futures:
+                result = f.result()
+                logger.info(f"Trial {result['trial']} {result['status']}: recall@{top_k}={result.get(f'recall@{top_k}', float('nan')):.4f}")
+                results.append(result)
+
+    leaderboard = pd.DataFrame(results)
+    leaderboard['_complete'] = leaderboard['status'] == 'complete'
+    leaderboard = leaderboard.sort_values(['_complete', f'recall@{top_k}'], ascending=False).drop(columns='_complete')
+    if 'model_path' not in leaderboard.columns:
+        leaderboard['model_path'] = None
+
+    complete = leaderboard[leaderboard['status'] == 'complete']
+    summary = {'n_trials': len(trials), 'n_pruned': int((leaderboard['status'] == 'pruned').sum())}
+    if len(complete):
+        best = complete.iloc[0]
+        best_path = os.path.join(out_dir, "best_model.pkl")
+        os.replace(best['model_path'], best_path)
+        summary.update({
+            'best_trial': int(best['trial']),
+            'best_params': {k: _scalar(best[k]) for k in space},
+            f'recall@{top_k}': float(best[f'recall@{top_k}']),
+            'recall_by_window': {int(w): float(best[f'recall@{w}']) for w in windows},
+            'recommended_candidate_window': recommend_window(best, windows, top_k, sweep_cfg.get('target_recall_ratio', 0.9)),
+            'best_model': best_path
+        })
+
+    # Keep only the best model, and point the leaderboard at what remains
+    for path in leaderboard['model_path'].dropna():
+        if os.path.exists(path):
+            os.remove(path)
+    if not os.listdir(trial_dir):
+        os.rmdir(trial_dir)
+    leaderboard['model_path'] = None
+    if len(complete):
+        leaderboard.loc[best.name, 'model_path'] = best_path
+    leaderboard.to_csv(os.path.join(out_dir, "leaderboard.csv"), index=False)
+
+    return leaderboard, summary
@@ -1,48 +1,154 @@
+import os
+import copy
+import json
 from lightfm import LightFM
-from lightfm.data import Dataset
 import numpy as np
+from scipy.sparse import coo_matrix
 from pcnrec.utils.logging import setup_logger
 from pcnrec.utils.io import ensure_dir, save_pickle
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.data.interaction_index import InteractionIndex
+from pcnrec.data.splits import time_aware_split
 
 logger = setup_logger(__name__)
 
 def build_interactions(train_df, num_users, num_items):
     """
     Builds LightFM interaction matrix.
-    Assumes user_idx and item_idx are contiguous 0..N-1
+    Assumes user_idx and item_idx are contiguous 0..N-1, so the COO matrix is
+    built directly from the id columns (one entry of 1.0 per row, like
+    lightfm.data.Dataset.build_interactions).
     """
-    # Create a Dataset object
-    dataset = Dataset()
-    dataset.fit(users=np.arange(num_users), items=np.arange(num_items))
-    
-    # Build interactions
-    # (user_idx, item_idx) tuples
-    interactions_zip = zip(train_df['user_idx'], train_df['item_idx'])
-    (interactions, _) = dataset.build_interactions(interactions_zip)
-    
-    return interactions
+    users = train_df['user_idx'].to_numpy(dtype=np.int32)
+    items = train_df['item_idx'].to_numpy(dtype=np.int32)
+    data = np.ones(len(users), dtype=np.float32)
+    return coo_matrix((data, (users, items)), shape=(num_users, num_items))
 
-def train_model(config, train_df, num_users, num_items):
+def evaluate_model(model, seen, val_index, user_ids, k=10, num_threads=1, batch_size=1000):
     """
-    Trains a LightFM model.
+    Precision/recall@k of the model's top-k (excluding seen items) against val_index.
+    """
+    scorer = EmbeddingScorer.from_lightfm(model, num_threads=num_threads)
+    hits = np.empty(len(user_ids), dtype=np.int64)
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        top_items, _ = scorer.topk(batch, k, seen=seen)
+        hits[start:start + len(batch)] = val_index.contains(batch[:, None], top_items).sum(axis=1)
+
+    n_relevant = val_index.lengths(user_ids)
+    return {
+        f'precision@{k}': float(np.mean(hits / k)),
+        f'recall@{k}': float(np.mean(hits / n_relevant))
+    }
+
+def _validation_split(train_df, num_users, num_items, val_params):
+    """
+    Holds out each user's latest interactions (time-aware, like the train/test split).
+    Returns (fit_df, seen index of fit_df, val index, sampled validation users).
+    """
+    fit_df, val_df = time_aware_split(train_df, val_params.get('ratio', 0.1))
+    seen = InteractionIndex.from_frame(fit_df, num_users=num_users, num_items=num_items)
+    val_index = InteractionIndex.from_frame(val_df, num_users=num_users, num_items=num_items)
+
+    users = np.flatnonzero((val_index.lengths() > 0) & (seen.lengths() > 0)).astype(np.int32)
+    max_users = val_params.get('max_users')
+    if max_users and len(users) > max_users:
+        rng = np.random.default_rng(val_params.get('seed', 42))
+        users = np.sort(rng.choice(users, max_users, replace=False))
+    return fit_df, seen, val_index, users
+
+def _save_checkpoint(model, path):
+    # Write then rename, so an interrupted epoch leaves the previous checkpoint intact
+    save_pickle(model, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+def train_model(config, train_df, num_users, num_items, checkpoint_dir=None):
+    """
+    Trains a LightFM model with fit_partial, one epoch at a time.
+
+    If candidates.validation.enabled, the latest `ratio` of each user's train
+    interactions is held out; precision/recall@k is computed on it after every
+    epoch and training stops once `metric` has not improved by `min_delta` for
+    `patience` epochs. With validation.refit (default) a fresh model is then
+    trained on all of train_df for the best epoch count, so the returned model
+    sees every train interaction; otherwise the best epoch's model (which has
+    not seen the held-out slice) is returned.
+    If checkpoint_dir is given, history.json is updated there every epoch along
+    with a single checkpoint: best.pkl (best validation epoch so far) when
+    validating, else latest.pkl. Older checkpoints are overwritten, so the
+    cached models/ output holds at most one.
     """
-    logger.info("Building interaction matrix...")
-    interactions = build_interactions(train_df, num_users, num_items)
-    
     params = config['candidates']
+    val_params = params.get('validation') or {}
+    validate = val_params.get('enabled', False)
+
+    if validate:
+        logger.info("Holding out validation interactions...")
+        fit_df, seen, val_index, val_users = _validation_split(train_df, num_users, num_items, val_params)
+        logger.info(f"Validation: {len(val_users)} users, {val_index.nnz} held-out interactions")
+        if len(val_users) == 0:
+            logger.warning("No users with both fit and held-out interactions; training without validation")
+            validate = False
+            fit_df = train_df
+    else:
+        fit_df = train_df
+
+    logger.info("Building interaction matrix...")
+    interactions = build_interactions(fit_df, num_users, num_items)
+
     model = LightFM(
         no_components=params['factors'],
         learning_rate=params['learning_rate'],
         loss=params['loss'],
         random_state=params['seed']
     )
-    
-    logger.info(f"Training LightFM with {params['epochs']} epochs...")
-    model.fit(
-        interactions,
-        epochs=params['epochs'],
-        num_threads=params['num_threads'],
-        verbose=True
-    )
-    
+
+    if checkpoint_dir:
+        ensure_dir(checkpoint_dir)
+
+    k = val_params.get('k', 10)
+    metric = f"{val_params.get('metric', 'recall')}@{k}"
+    patience = val_params.get('patience', 3)
+    min_delta = val_params.get('min_delta', 0.0)
+
+    best_model, best_value, best_epoch = None, -np.inf, None
+    history = []
+
+    logger.info(f"Training LightFM for up to {params['epochs']} epochs...")
+    for epoch in range(1, params['epochs'] + 1):
+        model.fit_partial(interactions, epochs=1, num_threads=params['num_threads'])
+        entry = {'epoch': epoch}
+
+        if validate:
+            entry.update(evaluate_model(model, seen, val_index, val_users, k=k, num_threads=params['num_threads']))
+            logger.info(f"Epoch {epoch}: {entry}")
+            if entry[metric] > best_value + min_delta:
+                best_model, best_value, best_epoch = copy.deepcopy(model), entry[metric], epoch
+        else:
+            logger.info(f"Epoch {epoch} done")
+        history.append(entry)
+
+        if checkpoint_dir:
+            if not validate:
+                _save_checkpoint(model, os.path.join(checkpoint_dir, "latest.pkl"))
+            elif best_epoch == epoch:
+                _save_checkpoint(best_model, os.path.join(checkpoint_dir, "best.pkl"))
+            with open(os.path.join(checkpoint_dir, "history.json"), 'w') as f:
+                json.dump({'metric': metric if validate else None, 'best_epoch': best_epoch, 'epochs': history}, f, indent=2)
+
+        if validate and epoch - best_epoch >= patience:
+            logger.info(f"Early stopping at epoch {epoch}; best {metric}={best_value:.4f} at epoch {best_epoch}")
+            break
+
+    if validate:
+        if not val_params.get('refit', True):
+            return best_model
+        logger.info(f"Refitting on all train interactions for {best_epoch} epochs...")
+        model = LightFM(
+            no_components=params['factors'],
+            learning_rate=params['learning_rate'],
+            loss=params['loss'],
+            random_state=params['seed']
+        )
+        model.fit_partial(build_interactions(train_df, num_users, num_items), epochs=best_epoch, num_threads=params['num_threads'])
     return model
@@ -0,0 +1,149 @@
+import hashlib
+import numpy as np
+import pandas as pd
+
+DEFAULT_BINS = ['head', 'torso', 'tail']
+
+_BYTE_POPCOUNT = np.array([bin(b).count('1') for b in range(256)], dtype=np.int64)
+
+def popcount(masks):
+    """Number of set bits per element of an unsigned integer array."""
+    masks = np.asarray(masks)
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(masks).astype(np.int64)
+    # NumPy < 2.0: per-byte lookup table
+    as_bytes = np.ascontiguousarray(masks).view(np.uint8).reshape(masks.shape + (masks.itemsize,))
+    return _BYTE_POPCOUNT[as_bytes].sum(axis=-1)
+
+class ItemCatalog:
+    """
+    Array-backed item attributes, indexed by internal_id.
+
+    bin_codes:   int8 popularity-bin code per item (index into bin_names, -1 = missing)
+    genre_masks: uint32 (uint64 past 32 genres) bitmask of genres, bit j = genre_names[j]
+    popularity:  float32 popularity count
+
+    Built once from items.parquet; per-item lookups are array indexing and
+    counting unique genres of a selection is a bitwise OR plus popcount.
+    """
+
+    def __init__(self, bin_codes, genre_masks, popularity, bin_names, genre_names):
+        self.bin_codes = bin_codes
+        self.genre_masks = genre_masks
+        self.popularity = popularity
+        self.bin_names = list(bin_names)
+        self.genre_names = list(genre_names)
+        self._version = None
+
+    @classmethod
+    def from_items_df(cls, items_df):
+        """
+        items_df: items.parquet frame, with internal_id as index or column,
+        and 'genres' ("A|B"), 'popularity_bin' and 'popularity_count' columns.
+        """
+        if items_df.index.name != 'internal_id' and 'internal_id' in items_df.columns:
+            items_df = items_df.set_index('internal_id')
+        ids = items_df.index.to_numpy(dtype=np.int64)
+        n = int(ids.max()) + 1 if len(ids) else 0
+
+        # Popularity bins: known names first (in order), then any others
+        bin_codes = np.full(n, -1, dtype=np.int8)
+        bin_names = []
+        if 'popularity_bin' in items_df.columns:
+            column = items_df['popularity_bin']
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                # compute_popularity's categorical: keep its (most -> least popular) order
+                bin_names = [str(c) for c in column.cat.categories]
+                codes = column.cat.codes.to_numpy()
+            else:
+                present = set(column.dropna().astype(str))
+                bin_names = [b for b in DEFAULT_BINS if b in present] + sorted(present - set(DEFAULT_BINS))
+                codes = pd.Categorical(column, categories=bin_names).codes
+            bin_codes[ids] = codes
+
+        # Genre bitmasks via one-hot of the split genre strings
+        genre_names = []
+        genre_masks = np.zeros(n, dtype=np.uint32)
+        if 'genres' in items_df.columns:
+            onehot = items_df['genres'].fillna('').astype(str).str.get_dummies(sep='|')
+            onehot = onehot.loc[:, [c for c in onehot.columns if c != '']]
+            genre_names = list(onehot.columns)
+            if len(genre_names) > 64:
+                raise ValueError(f"{len(genre_names)} genres do not fit a 64-bit mask")
+            mask_dtype = np.uint32 if len(genre_names) <= 32 else np.uint64
+            bits = onehot.to_numpy(dtype=mask_dtype) << np.arange(len(genre_names), dtype=mask_dtype)
+            genre_masks = np.zeros(n, dtype=mask_dtype)
+            genre_masks[ids] = np.bitwise_or.reduce(bits, axis=1) if len(genre_names) else 0
+
+        popularity = np.zeros(n, dtype=np.float32)
+        if 'popularity_count' in items_df.columns:
+            popularity[ids] = items_df['popularity_count'].to_numpy(dtype=np.float32)
+
+        return cls(bin_codes, genre_masks, popularity, bin_names, genre_names)
+
+    @classmethod
+    def load(cls, items_path):
+        columns = ['internal_id', 'genres', 'popularity_count', 'popularity_bin']
+        return cls.from_items_df(pd.read_parquet(items_path, columns=columns))
+
+    @property
+    def num_items(self):
+        return len(self.bin_codes)
+
+    def version(self):
+        """
+        Content digest of the bins, genre masks and names (hex). Cached;
+        update_bins resets it, so results keyed by it go stale with the bins.
+        """
+        if self._version is None:
+            h = hashlib.sha256()
+            for arr in (self.bin_codes, self.genre_masks):
+                h.update(str(arr.dtype).encode('ascii'))
+                h.update(np.ascontiguousarray(arr).tobytes())
+            h.update("|".join(self.bin_names).encode('utf-8'))
+            h.update(b"\x00")
+            h.update("|".join(self.genre_names).encode('utf-8'))
+            self._version = h.hexdigest()[:16]
+        return self._version
+
+    def bin_code(self, name):
+        """Code of a bin name, or -1 if no item has that bin."""
+        return self.bin_names.index(name) if name in self.bin_names else -1
+
+    def bin_name(self, item_id):
+        code = int(self.bin_codes[item_id])
+        return self.bin_names[code] if code >= 0 else None
+
+    def update_bins(self, item_ids, codes):
+        """
+        In-place bin update for the items a PopularityStore reported as changed.
+        codes index the store's bin_names, which must match this catalog's.
+        """
+        self.bin_codes[np.asarray(item_ids, dtype=np.int64)] = codes
+        self._version = None
+
+    def bin_counts(self, item_ids):
+        """{bin_name: count} over item_ids (every bin name present, possibly 0)."""
+        codes = self.bin_codes[np.asarray(item_ids, dtype=np.int64)]
+        counts = np.bincount(codes[codes >= 0], minlength=len(self.bin_names))
+        return {name: int(c) for name, c in zip(self.bin_names, counts)}
+
+    def genre_union(self, item_ids):
+        """Bitmask of all genres covered by item_ids."""
+        masks = self.genre_masks[np.asarray(item_ids, dtype=np.int64)]
+        return masks.dtype.type(np.bitwise_or.reduce(masks)) if len(masks) else masks.dtype.type(0)
+
+    def unique_genres(self, item_ids):
+        """Number of distinct genres across item_ids."""
+        return int(popcount(np.asarray([self.genre_union(item_ids)]))[0])
+
+    def genres(self, item_id):
+        """Genre names of one item."""
+        mask = int(self.genre_masks[item_id])
+        return [g for j, g in enumerate(self.genre_names) if mask >> j & 1]
+
+def as_catalog(items):
+    """Returns items if it is already an ItemCatalog, else builds one from an items frame."""
+    if isinstance(items, ItemCatalog):
+        return items
+    return ItemCatalog.from_items_df(items)
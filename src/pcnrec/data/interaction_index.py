@@ -0,0 +1,145 @@
+import os
+import numpy as np
+import pandas as pd
+
+class InteractionIndex:
+    """
+    Compact CSR index of (user_idx -> item_idx) interactions.
+
+    indptr:  int32 (num_users + 1,) row offsets (int64 past 2**31 interactions)
+    indices: int32 item ids, sorted and de-duplicated within each user row
+    data:    optional per-interaction values aligned with indices (e.g. timestamp)
+
+    Replaces dict-of-sets lookups: batch masking and membership tests are
+    single vectorized operations over the flat arrays.
+    """
+
+    def __init__(self, indptr, indices, num_items, data=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.num_items = int(num_items)
+        self.data = data
+        self._keys = None
+
+    @classmethod
+    def from_frame(cls, df, num_users=None, num_items=None, user_col='user_idx', item_col='item_idx', data_col=None):
+        """
+        Builds the index from an interactions frame with contiguous integer ids.
+        """
+        users = df[user_col].to_numpy(dtype=np.int64)
+        items = df[item_col].to_numpy(dtype=np.int64)
+        if num_users is None:
+            num_users = int(users.max()) + 1 if len(users) else 0
+        if num_items is None:
+            num_items = int(items.max()) + 1 if len(items) else 0
+
+        keys = users * num_items + items
+        keys, first = np.unique(keys, return_index=True)
+
+        counts = np.bincount(users[first], minlength=num_users)
+        ptr_dtype = np.int32 if len(keys) < np.iinfo(np.int32).max else np.int64
+        indptr = np.zeros(num_users + 1, dtype=ptr_dtype)
+        np.cumsum(counts, out=indptr[1:])
+        indices = (keys % max(num_items, 1)).astype(np.int32)
+
+        data = None
+        if data_col is not None:
+            data = df[data_col].to_numpy()[first]
+
+        return cls(indptr, indices, num_items, data=data)
+
+    @property
+    def num_users(self):
+        return len(self.indptr) - 1
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    def lengths(self, user_ids=None):
+        """Number of interactions per user."""
+        counts = np.diff(self.indptr)
+        return counts if user_ids is None else counts[np.asarray(user_ids)]
+
+    def items(self, user_id):
+        """Item ids for one user (a view, sorted)."""
+        return self.indices[self.indptr[user_id]:self.indptr[user_id + 1]]
+
+    def values(self, user_id):
+        """data values for one user, aligned with items(user_id)."""
+        return self.data[self.indptr[user_id]:self.indptr[user_id + 1]]
+
+    def _batch_positions(self, user_ids):
+        """
+        Flat positions into indices for a batch of users, plus the batch row of each position.
+        """
+        user_ids = np.asarray(user_ids)
+        valid = user_ids < self.num_users
+        starts = np.where(valid, self.indptr[np.minimum(user_ids, self.num_users)], 0)
+        lengths = np.where(valid, self.indptr[np.minimum(user_ids + 1, self.num_users)] - starts, 0)
+        starts = starts.astype(np.int64)
+        lengths = lengths.astype(np.int64)
+        rows = np.repeat(np.arange(len(user_ids)), lengths)
+        offsets = np.cumsum(lengths) - lengths
+        pos = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return rows, pos
+
+    def mask_scores(self, scores, user_ids, value=-np.inf):
+        """
+        Sets scores[b, item] = value for every item seen by user_ids[b], in place.
+        scores is (len(user_ids), num_items).
+        """
+        rows, pos = self._batch_positions(user_ids)
+        if len(pos):
+            scores[rows, self.indices[pos]] = value
+
+    def _key_array(self):
+        # Built on first membership query only (8 bytes per interaction)
+        if self._keys is None:
+            rows = np.repeat(np.arange(self.num_users, dtype=np.int64), np.diff(self.indptr))
+            self._keys = rows * self.num_items + self.indices
+        return self._keys
+
+    def contains(self, user_ids, item_ids):
+        """
+        Elementwise membership: (user_ids[j], item_ids[j]) in index.
+        Arrays broadcast, so a (B, 1) user column against a (B, k) item matrix works.
+        """
+        user_ids, item_ids = np.broadcast_arrays(np.asarray(user_ids, dtype=np.int64), np.asarray(item_ids, dtype=np.int64))
+        keys = self._key_array()
+        if len(keys) == 0:
+            return np.zeros(user_ids.shape, dtype=bool)
+        query = user_ids * self.num_items + item_ids
+        pos = np.minimum(np.searchsorted(keys, query), len(keys) - 1)
+        in_range = (item_ids >= 0) & (item_ids < self.num_items)
+        return (keys[pos] == query) & in_range
+
+    def save(self, path):
+        """Saves indptr/indices (and data, if any) to an uncompressed .npz."""
+        arrays = {'indptr': self.indptr, 'indices': self.indices, 'num_items': np.array(self.num_items)}
+        if self.data is not None:
+            arrays['data'] = self.data
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            data = z['data'] if 'data' in z.files else None
+            return cls(z['indptr'], z['indices'], int(z['num_items']), data=data)
+
+def index_path(parquet_path):
+    """interactions_train.parquet -> interactions_train.csr.npz (same directory)."""
+    return os.path.splitext(parquet_path)[0] + ".csr.npz"
+
+def load_interaction_index(parquet_path, num_users=None, num_items=None, df=None):
+    """
+    Loads the CSR index persisted next to an interactions parquet file.
+    Falls back to building it from the parquet (or from df, if given) for runs
+    prepared before the index existed.
+    """
+    path = index_path(parquet_path)
+    if os.path.exists(path):
+        return InteractionIndex.load(path)
+    if df is None:
+        df = pd.read_parquet(parquet_path, columns=['user_idx', 'item_idx'])
+    return InteractionIndex.from_frame(df, num_users=num_users, num_items=num_items)
@@ -1,7 +1,8 @@
 import os
+import json
+import hashlib
 import requests
 import zipfile
-import io
 from pcnrec.utils.logging import setup_logger
 from pcnrec.utils.io import ensure_dir
 
@@ -9,54 +10,265 @@ logger = setup_logger(__name__)
 
 MOVIELENS_URLS = {
     "ml-100k": "https://files.grouplens.org/datasets/movielens/ml-100k.zip",
-    "ml-1m": "https://files.grouplens.org/datasets/movielens/ml-1m.zip"
+    "ml-1m": "https://files.grouplens.org/datasets/movielens/ml-1m.zip",
+    "ml-10m": "https://files.grouplens.org/datasets/movielens/ml-10m.zip",
+    "ml-20m": "https://files.grouplens.org/datasets/movielens/ml-20m.zip",
+    "ml-25m": "https://files.grouplens.org/datasets/movielens/ml-25m.zip"
 }
 
 EXPECTED_FILES = {
     "ml-100k": ["u.data", "u.item"],
-    "ml-1m": ["ratings.dat", "movies.dat"]
+    "ml-1m": ["ratings.dat", "movies.dat"],
+    "ml-10m": ["ratings.dat", "movies.dat"],
+    "ml-20m": ["ratings.csv", "movies.csv"],
+    "ml-25m": ["ratings.csv", "movies.csv"]
 }
 
-def download_movielens(variant, data_dir):
+# Folder each zip extracts to, where it differs from the variant name
+EXTRACT_DIRS = {
+    "ml-10m": "ml-10M100K"
+}
+
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 1 << 20
+
+def file_sha256(path):
+    """SHA-256 of a file, streamed in 1 MB blocks."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def read_manifest(target_dir):
+    path = os.path.join(target_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def check_extraction(target_dir, variant, verify=False):
+    """
+    Problems with an extracted variant ([] if usable).
+    The cheap check compares each expected file's size and mtime with the
+    manifest written at extraction; verify=True also re-hashes the files
+    against the recorded SHA-256 digests. A file whose size matches but whose
+    mtime moved (touched, copied, restored from backup) is re-hashed; if the
+    digest still matches, the manifest's mtime is refreshed instead of
+    reporting a problem.
+    """
+    manifest = read_manifest(target_dir)
+    if manifest is None:
+        return ["no manifest"]
+    if manifest.get('variant') != variant:
+        return [f"manifest is for {manifest.get('variant')}"]
+
+    problems = []
+    refreshed = False
+    for name in EXPECTED_FILES[variant]:
+        path = os.path.join(target_dir, name)
+        recorded = manifest['files'].get(name)
+        if recorded is None or not os.path.exists(path):
+            problems.append(f"{name} missing")
+            continue
+        st = os.stat(path)
+        if st.st_size != recorded['size']:
+            problems.append(f"{name} changed since extraction")
+        elif st.st_mtime_ns != recorded['mtime_ns']:
+            if file_sha256(path) != recorded['sha256']:
+                problems.append(f"{name} changed since extraction")
+            else:
+                recorded['mtime_ns'] = st.st_mtime_ns
+                refreshed = True
+        elif verify and file_sha256(path) != recorded['sha256']:
+            problems.append(f"{name} checksum mismatch")
+    if refreshed:
+        logger.info(f"Files in {target_dir} were touched but their checksums match; refreshing manifest mtimes")
+        _write_manifest(target_dir, variant, manifest.get('archive'), manifest['files'])
+    return problems
+
+def _describe_files(target_dir, variant):
+    files = {}
+    for name in EXPECTED_FILES[variant]:
+        path = os.path.join(target_dir, name)
+        st = os.stat(path)
+        files[name] = {'sha256': file_sha256(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return files
+
+def _write_manifest(target_dir, variant, archive_info, files):
+    manifest = {'variant': variant, 'archive': archive_info, 'files': files}
+    with open(os.path.join(target_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+def find_archive(variant, archive_path=None, mirror_dir=None):
+    """Local zip for variant: archive_path, else <mirror_dir>/<variant>.zip, else None."""
+    if archive_path:
+        if not os.path.exists(archive_path):
+            raise FileNotFoundError(f"archive_path {archive_path} does not exist")
+        return archive_path
+    if mirror_dir:
+        candidate = os.path.join(mirror_dir, os.path.basename(MOVIELENS_URLS[variant]))
+        if os.path.exists(candidate):
+            return candidate
+        logger.warning(f"{candidate} not found in mirror")
+    return None
+
+def _local_archive(variant, data_dir, archive_path=None, mirror_dir=None):
+    """find_archive, falling back to a previous download in data_dir; None if there is none."""
+    archive = find_archive(variant, archive_path, mirror_dir)
+    if archive is None:
+        previous = os.path.join(data_dir, os.path.basename(MOVIELENS_URLS[variant]))
+        archive = previous if os.path.exists(previous) else None
+    return archive
+
+def archive_member_digests(archive, variant):
+    """{name: sha256} of the variant's EXPECTED_FILES inside the zip (streamed, nothing extracted)."""
+    folder = EXTRACT_DIRS.get(variant, variant)
+    digests = {}
+    with zipfile.ZipFile(archive) as z:
+        available = set(z.namelist())
+        for name in EXPECTED_FILES[variant]:
+            member = f"{folder}/{name}"
+            if member not in available:
+                continue
+            h = hashlib.sha256()
+            with z.open(member) as src:
+                for block in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    h.update(block)
+            digests[name] = h.hexdigest()
+    return digests
+
+def stream_download(url, dest, timeout=60):
+    """
+    Streams url to dest in 1 MB chunks (never holding the archive in memory).
+    Writes dest.part and renames on completion, so dest is always complete.
     """
-    Downloads and extracts the MovieLens dataset.
+    part = dest + ".part"
+    with requests.get(url, stream=True, timeout=timeout) as r:
+        r.raise_for_status()
+        with open(part, 'wb') as f:
+            for block in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(block)
+    os.replace(part, dest)
+    return dest
+
+def extract_members(archive, variant, data_dir):
+    """
+    Extracts only the variant's EXPECTED_FILES from the zip, streaming each
+    member to a .part file while hashing it. zipfile checks each member's CRC
+    as it is read, so truncated or corrupted archives fail here.
+    Returns {name: {'sha256', 'size', 'mtime_ns'}}.
+    """
+    folder = EXTRACT_DIRS.get(variant, variant)
+    target_dir = os.path.join(data_dir, folder)
+    ensure_dir(target_dir)
+
+    files = {}
+    with zipfile.ZipFile(archive) as z:
+        available = set(z.namelist())
+        for name in EXPECTED_FILES[variant]:
+            member = f"{folder}/{name}"
+            if member not in available:
+                raise RuntimeError(f"{archive} has no member {member}")
+            dest = os.path.join(target_dir, name)
+            h = hashlib.sha256()
+            with z.open(member) as src, open(dest + ".part", 'wb') as out:
+                for block in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    h.update(block)
+                    out.write(block)
+            os.replace(dest + ".part", dest)
+            st = os.stat(dest)
+            files[name] = {'sha256': h.hexdigest(), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+    return files
+
+def download_movielens(variant, data_dir, archive_path=None, mirror_dir=None, archive_sha256=None, verify=False):
+    """
+    Makes the variant's raw files available under <data_dir>/<folder> and returns that path.
+
+    Source, in order: archive_path (local GroupLens zip), <mirror_dir>/<variant>.zip,
+    or a streamed download to <data_dir>/<variant>.zip. Only the needed members
+    are extracted, and a manifest.json with their SHA-256 digests is written
+    last. Later calls check files against it (size/mtime, or full hashes with
+    verify=True) and re-extract on a content mismatch. Files extracted before
+    manifests existed are checked against a local archive when one is
+    available, and adopted with a warning otherwise.
+    archive_sha256: optional pinned digest the archive must match.
     """
     if variant not in MOVIELENS_URLS:
         raise ValueError(f"Unknown variant: {variant}")
-    
+
     url = MOVIELENS_URLS[variant]
-    target_dir = os.path.join(data_dir, variant)
-    
-    # Check if already exists
-    if os.path.exists(target_dir):
-        # Basic check
-        missing = [f for f in EXPECTED_FILES[variant] if not os.path.exists(os.path.join(target_dir, f))]
-        if not missing:
-            logger.info(f"Dataset {variant} already exists in {target_dir}")
+    target_dir = os.path.join(data_dir, EXTRACT_DIRS.get(variant, variant))
+
+    problems = check_extraction(target_dir, variant, verify=verify)
+    if not problems:
+        logger.info(f"Dataset {variant} already exists in {target_dir}")
+        return target_dir
+    if problems == ["no manifest"] and all(os.path.exists(os.path.join(target_dir, name)) for name in EXPECTED_FILES[variant]):
+        # Extracted before manifests existed: check against a local archive if
+        # there is one, otherwise adopt the files as they are
+        files = _describe_files(target_dir, variant)
+        archive = _local_archive(variant, data_dir, archive_path, mirror_dir)
+        if archive is not None and (not archive_sha256 or file_sha256(archive) == archive_sha256):
+            expected = archive_member_digests(archive, variant)
+            mismatched = [name for name in EXPECTED_FILES[variant] if files[name]['sha256'] != expected.get(name)]
+            if not mismatched:
+                logger.info(f"Dataset {variant} found in {target_dir} without a manifest; matches {archive}, recording checksums")
+                _write_manifest(target_dir, variant, {'source': archive, 'sha256': file_sha256(archive),
+                                                      'size': os.path.getsize(archive)}, files)
+                return target_dir
+            problems = [f"{name} differs from {archive}" for name in mismatched]
+        elif archive is None:
+            logger.warning(
+                f"Dataset {variant} found in {target_dir} without a manifest and no local archive to check it "
+                f"against; adopting the files unverified. Delete {target_dir} (or set dataset.archive_path) "
+                f"to re-extract from a verified archive."
+            )
+            _write_manifest(target_dir, variant, None, files)
             return target_dir
-        else:
-            logger.info(f"Dataset {variant} incomplete. Missing: {missing}. Re-downloading.")
+    if os.path.exists(target_dir):
+        logger.info(f"Dataset {variant} in {target_dir} not usable ({', '.join(problems)}). Re-extracting.")
 
     ensure_dir(data_dir)
-    logger.info(f"Downloading {variant} from {url}...")
-    
+
     try:
-        r = requests.get(url)
-        r.raise_for_status()
-        z = zipfile.ZipFile(io.BytesIO(r.content))
-        z.extractall(data_dir)
-        logger.info(f"Extracted to {data_dir}")
-        
-        # Verify extraction
-        # Note: zips often extract to a subdir like 'ml-100k/' so target_dir should match that
-        # ml-100k zip contains a folder 'ml-100k'
-        # ml-1m zip contains a folder 'ml-1m'
-        if not os.path.exists(target_dir):
-             raise RuntimeError(f"Extraction failed to create {target_dir}")
-             
-        logger.info(f"Successfully downloaded and extracted {variant}")
+        archive = find_archive(variant, archive_path, mirror_dir)
+        source = archive
+        if archive is None:
+            archive = os.path.join(data_dir, os.path.basename(url))
+            source = url
+            if os.path.exists(archive):
+                logger.info(f"Using previously downloaded {archive}")
+            else:
+                logger.info(f"Downloading {variant} from {url}...")
+                stream_download(url, archive)
+        else:
+            logger.info(f"Extracting {variant} from local archive {archive}...")
+
+        archive_digest = file_sha256(archive)
+        if archive_sha256 and archive_digest != archive_sha256:
+            raise ValueError(f"{archive} has SHA-256 {archive_digest}, expected {archive_sha256}")
+
+        files = extract_members(archive, variant, data_dir)
+        archive_info = {'source': source, 'sha256': archive_digest, 'size': os.path.getsize(archive)}
+        # Manifest last: its presence marks a complete extraction
+        _write_manifest(target_dir, variant, archive_info, files)
+
+        logger.info(f"Successfully extracted {variant} to {target_dir}")
         return target_dir
-        
+
     except Exception as e:
-        logger.error(f"Failed to download {variant}: {e}")
+        logger.error(f"Failed to obtain {variant}: {e}")
+        if not (archive_path or mirror_dir):
+            logger.error("Offline? Set dataset.archive_path or dataset.mirror_dir to a local copy of the GroupLens zip.")
         raise
+
+def source_digests(target_dir, variant):
+    """
+    {name: sha256} of the variant's raw files, from the manifest when the files
+    are unchanged since extraction, otherwise hashed from disk.
+    """
+    manifest = read_manifest(target_dir)
+    if manifest is not None and not check_extraction(target_dir, variant):
+        return {name: manifest['files'][name]['sha256'] for name in EXPECTED_FILES[variant]}
+    return {name: file_sha256(os.path.join(target_dir, name)) for name in EXPECTED_FILES[variant]}
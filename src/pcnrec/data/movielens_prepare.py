@@ -1,36 +1,121 @@
 import pandas as pd
 import numpy as np
 import os
+import io
+import csv
 from pcnrec.utils.logging import setup_logger
 from pcnrec.utils.io import save_parquet, save_yaml, ensure_dir
+from pcnrec.data.movielens_download import source_digests
 import json
+import hashlib
 
 logger = setup_logger(__name__)
 
+ML_100K_GENRES = [
+    "unknown", "Action", "Adventure", "Animation", "Children's", "Comedy", 
+    "Crime", "Documentary", "Drama", "Fantasy", "Film-Noir", "Horror", 
+    "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"
+]
+
+RATING_NAMES = ["user_id", "item_id", "rating", "timestamp"]
+# Parse dtypes; ratings are read as float (ml-10m+ has half stars) and downcast after
+RATING_DTYPES = {"user_id": np.int32, "item_id": np.int32, "rating": np.float32, "timestamp": np.int64}
+CHUNK_ROWS = 5_000_000
+
+class _DelimiterRewriter(io.RawIOBase):
+    """
+    Raw stream that replaces a multi-byte delimiter with a single byte while
+    reading, so pandas can use its C parser on '::'-separated files.
+    """
+
+    def __init__(self, path, old=b'::', new=b'\x1f', chunk_size=1 << 22):
+        self._f = open(path, 'rb')
+        self._old, self._new = old, new
+        self._chunk_size = chunk_size
+        self._carry = b''
+        self._buf = b''
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        chunk = self._f.read(self._chunk_size)
+        data = (self._carry + chunk).replace(self._old, self._new)
+        self._carry = b''
+        if chunk:
+            # Hold back a possible partial delimiter at the end of the chunk
+            keep = len(self._old) - 1
+            while keep and not data.endswith(self._old[:keep]):
+                keep -= 1
+            if keep:
+                data, self._carry = data[:-keep], data[-keep:]
+        self._buf += data
+        return bool(chunk)
+
+    def readinto(self, b):
+        while len(self._buf) < len(b) and self._fill():
+            pass
+        n = min(len(b), len(self._buf))
+        b[:n] = self._buf[:n]
+        self._buf = self._buf[n:]
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+def _read_double_colon(path, names, **kwargs):
+    """
+    pd.read_csv for '::'-separated MovieLens .dat files, using the C engine.
+    Quotes are literal (QUOTE_NONE), as with the regex-separator python engine:
+    titles such as '"Great Performances" Cats (1998)' keep their quotes.
+    """
+    with io.BufferedReader(_DelimiterRewriter(path)) as f:
+        result = pd.read_csv(f, sep='\x1f', names=names, header=None, engine='c', encoding='latin-1',
+                             quoting=csv.QUOTE_NONE, **kwargs)
+        if kwargs.get('chunksize'):
+            # Consume the reader before the stream is closed
+            return _concat_ratings(result)
+        return result
+
+def downcast_ratings(df):
+    """
+    int32 ids and timestamp (int64 only if timestamps exceed int32), int8 rating
+    when every rating is a whole star (ml-100k/ml-1m), float32 otherwise (half stars).
+    """
+    out = df.astype({"user_id": np.int32, "item_id": np.int32})
+    ratings = out["rating"].to_numpy()
+    if len(ratings) and np.all(ratings == np.round(ratings)) and ratings.min() >= -128 and ratings.max() <= 127:
+        out["rating"] = ratings.astype(np.int8)
+    else:
+        out["rating"] = ratings.astype(np.float32)
+    ts = out["timestamp"].to_numpy()
+    if not len(ts) or (ts.min() >= np.iinfo(np.int32).min and ts.max() <= np.iinfo(np.int32).max):
+        out["timestamp"] = ts.astype(np.int32)
+    return out
+
+def _concat_ratings(chunks):
+    """Concatenates typed rating chunks from a chunked read_csv and downcasts them."""
+    return downcast_ratings(pd.concat([downcast_ratings(c) for c in chunks], ignore_index=True))
+
 def load_ml_100k(data_dir):
     # u.data: user id | item id | rating | timestamp
     # u.item: movie id | movie title | ... genres ...
     
     ratings_path = os.path.join(data_dir, "u.data")
     names = ["user_id", "item_id", "rating", "timestamp"]
-    df = pd.read_csv(ratings_path, sep='\t', names=names, engine='python')
+    df = downcast_ratings(pd.read_csv(ratings_path, sep='\t', names=names, engine='c', dtype=RATING_DTYPES))
     
     items_path = os.path.join(data_dir, "u.item")
     # genres are columns 5-23
-    genre_names = [
-        "unknown", "Action", "Adventure", "Animation", "Children's", "Comedy", 
-        "Crime", "Documentary", "Drama", "Fantasy", "Film-Noir", "Horror", 
-        "Musical", "Mystery", "Romance", "Sci-Fi", "Thriller", "War", "Western"
-    ]
+    genre_names = ML_100K_GENRES
     # u.item is pipe separated, might have encoding issues
-    items = pd.read_csv(items_path, sep='|', encoding='latin-1', header=None, engine='python')
-    items = items.iloc[:, :24] # keep relevant cols
+    items = pd.read_csv(items_path, sep='|', encoding='latin-1', header=None, engine='c', usecols=range(24))
     items.columns = ["item_id", "title", "release_date", "video_release_date", "IMDb_URL"] + genre_names
     
-    def get_genres(row):
-        return "|".join([g for g in genre_names if row[g] == 1])
-    
-    items['genres'] = items.apply(get_genres, axis=1)
+    # "Action|Comedy": each 0/1 genre flag times "name|", summed row-wise as strings
+    flags = items[genre_names].eq(1)
+    items['genres'] = flags.dot(pd.Index(genre_names) + '|').str.rstrip('|')
     items = items[['item_id', 'title', 'genres']]
     
     return df, items
@@ -40,13 +125,75 @@ def load_ml_1m(data_dir):
     # movies.dat: MovieID::Title::Genres
     
     ratings_path = os.path.join(data_dir, "ratings.dat")
-    df = pd.read_csv(ratings_path, sep='::', names=["user_id", "item_id", "rating", "timestamp"], engine='python', encoding='latin-1')
+    df = _read_double_colon(ratings_path, RATING_NAMES, dtype=RATING_DTYPES, chunksize=CHUNK_ROWS)
     
     movies_path = os.path.join(data_dir, "movies.dat")
-    items = pd.read_csv(movies_path, sep='::', names=["item_id", "title", "genres"], engine='python', encoding='latin-1')
+    items = _read_double_colon(movies_path, ["item_id", "title", "genres"])
     
     return df, items
 
+def load_ml_10m(data_dir):
+    # Same '::' layout as ml-1m (ratings in half stars); the zip extracts to ml-10M100K/
+    return load_ml_1m(data_dir)
+
+def load_ml_csv(data_dir):
+    # ml-20m / ml-25m
+    # ratings.csv: userId,movieId,rating,timestamp (with header)
+    # movies.csv: movieId,title,genres (titles quoted when they contain commas)
+    
+    ratings_path = os.path.join(data_dir, "ratings.csv")
+    chunks = pd.read_csv(ratings_path, header=0, names=RATING_NAMES, dtype=RATING_DTYPES, engine='c', chunksize=CHUNK_ROWS)
+    df = _concat_ratings(chunks)
+    
+    movies_path = os.path.join(data_dir, "movies.csv")
+    items = pd.read_csv(movies_path, header=0, names=["item_id", "title", "genres"], engine='c')
+    
+    return df, items
+
+LOADERS = {
+    "ml-100k": load_ml_100k,
+    "ml-1m": load_ml_1m,
+    "ml-10m": load_ml_10m,
+    "ml-20m": load_ml_csv,
+    "ml-25m": load_ml_csv
+}
+
+def source_checksum(data_dir, variant):
+    """
+    SHA-256 over the variant's raw source files (name + file digest each).
+    File digests come from the extraction manifest when the files are unchanged,
+    so this does not re-read the raw files.
+    """
+    h = hashlib.sha256()
+    for name, digest in source_digests(data_dir, variant).items():
+        h.update(name.encode('utf-8'))
+        h.update(digest.encode('ascii'))
+    return h.hexdigest()
+
+def load_movielens(variant, data_dir, cache_dir=None):
+    """
+    Parses a MovieLens variant into (ratings_df, items_df).
+    With cache_dir, the parsed frames are stored as parquet keyed by the
+    checksum of the source files; later runs on unchanged sources skip parsing.
+    """
+    if variant not in LOADERS:
+        raise ValueError(f"Unsupported variant {variant}")
+    if cache_dir is None:
+        return LOADERS[variant](data_dir)
+
+    digest = source_checksum(data_dir, variant)[:16]
+    ratings_cache = os.path.join(cache_dir, f"{variant}-{digest}-ratings.parquet")
+    items_cache = os.path.join(cache_dir, f"{variant}-{digest}-items.parquet")
+    if os.path.exists(ratings_cache) and os.path.exists(items_cache):
+        logger.info(f"Using parsed cache {ratings_cache}")
+        return pd.read_parquet(ratings_cache), pd.read_parquet(items_cache)
+
+    df, items = LOADERS[variant](data_dir)
+    # Items first: the ratings file marks a complete cache entry
+    save_parquet(items, items_cache)
+    save_parquet(df, ratings_cache)
+    return df, items
+
 from pcnrec.data.splits import time_aware_split
 from pcnrec.data.popularity import compute_popularity
 
@@ -56,38 +203,37 @@ def prepare_data(config, raw_data_dir):
     min_interactions = config['dataset']['min_user_interactions']
     
     logger.info(f"Loading {variant} from {raw_data_dir}")
-    if variant == 'ml-100k':
-        df, items_df = load_ml_100k(raw_data_dir)
-    elif variant == 'ml-1m':
-        df, items_df = load_ml_1m(raw_data_dir)
-    else:
-        raise ValueError(f"Unsupported variant {variant}")
+    cache_dir = None
+    if config['dataset'].get('parse_cache', True):
+        cache_dir = os.path.join(config['dataset']['data_dir'], "parsed")
+    df, items_df = load_movielens(variant, raw_data_dir, cache_dir=cache_dir)
         
     logger.info(f"Original interactions: {len(df)}")
     
     # 1. Filter users
-    user_counts = df.groupby('user_id').size()
-    valid_users = user_counts[user_counts >= min_interactions].index
-    df = df[df['user_id'].isin(valid_users)].copy()
+    user_codes, _ = pd.factorize(df['user_id'])
+    keep = np.bincount(user_codes)[user_codes] >= min_interactions
+    df = df[keep].reset_index(drop=True)
     logger.info(f"Filtered interactions (min {min_interactions}): {len(df)}")
     
-    # 2. Remap IDs
-    unique_users = df['user_id'].unique()
-    unique_items = df['item_id'].unique()
-    
-    user_map = {uid: i for i, uid in enumerate(unique_users)}
-    item_map = {iid: i for i, iid in enumerate(unique_items)}
+    # 2. Remap IDs (factorize: internal ids in order of first appearance)
+    user_codes, unique_users = pd.factorize(df['user_id'])
+    item_codes, unique_items = pd.factorize(df['item_id'])
     
-    df['user_idx'] = df['user_id'].map(user_map)
-    df['item_idx'] = df['item_id'].map(item_map)
+    df['user_idx'] = user_codes.astype(np.int32)
+    df['item_idx'] = item_codes.astype(np.int32)
     
     # Map items metadata
-    items_df = items_df[items_df['item_id'].isin(unique_items)].copy()
-    items_df['item_idx'] = items_df['item_id'].map(item_map)
+    item_lookup = pd.Index(unique_items)
+    items_df = items_df[items_df['item_id'].isin(item_lookup)].copy()
+    items_df['item_idx'] = item_lookup.get_indexer(items_df['item_id']).astype(np.int32)
     items_df = items_df.sort_values('item_idx').reset_index(drop=True)
     
     # Save ID maps
-    users_out = pd.DataFrame({'original_id': list(user_map.keys()), 'internal_id': list(user_map.values())})
+    users_out = pd.DataFrame({
+        'original_id': np.asarray(unique_users),
+        'internal_id': np.arange(len(unique_users), dtype=np.int32)
+    })
     items_df = items_df[['item_id', 'item_idx', 'title', 'genres']].rename(columns={'item_id': 'original_id', 'item_idx': 'internal_id'})
     
     # 3. Time-aware Split
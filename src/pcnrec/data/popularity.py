@@ -1,41 +1,109 @@
+import numpy as np
 import pandas as pd
 
+SECONDS_PER_DAY = 86400
+
+def bin_scheme(pop_config):
+    """
+    Returns [(name, quantile), ...] ordered from most to least popular.
+    Each bin holds items whose popularity is >= its quantile threshold (and below
+    the previous bin's); the last bin's quantile is None (everything else).
+
+    pop_config['bins'], if set, is a list of {name, quantile} in that order;
+    otherwise the scheme is head/torso/tail from head_quantile/torso_quantile.
+    """
+    bins = pop_config.get('bins')
+    if not bins:
+        return [('head', pop_config['head_quantile']), ('torso', pop_config['torso_quantile']), ('tail', None)]
+
+    scheme = [(b['name'], b.get('quantile')) for b in bins]
+    quantiles = [q for _, q in scheme[:-1]]
+    if any(q is None for q in quantiles) or scheme[-1][1] is not None:
+        raise ValueError("popularity.bins: every bin but the last needs a quantile, and the last must not have one")
+    if any(a <= b for a, b in zip(quantiles, quantiles[1:])):
+        raise ValueError(f"popularity.bins: quantiles must be strictly decreasing, got {quantiles}")
+    if len(set(name for name, _ in scheme)) != len(scheme):
+        raise ValueError("popularity.bins: bin names must be unique")
+    return scheme
+
+def decayed_counts(train_df, half_life_days, num_items=None):
+    """
+    Per-item interaction weight 2^(-age / half_life), age measured in days
+    back from the latest train timestamp.
+    """
+    ts = train_df['timestamp'].to_numpy(dtype=np.float64)
+    age_days = (ts.max() - ts) / SECONDS_PER_DAY if len(ts) else ts
+    weights = np.exp2(-age_days / half_life_days)
+    return np.bincount(train_df['item_idx'].to_numpy(dtype=np.int64), weights=weights, minlength=num_items or 0)
+
+def assign_bins(values, thresholds):
+    """
+    Bins values with one searchsorted call.
+    thresholds: lower bounds of each bin but the last, most popular first
+    (non-increasing). Returns int8 codes: 0 = most popular bin.
+    """
+    ascending = np.asarray(thresholds, dtype=np.float64)[::-1]
+    above = np.searchsorted(ascending, values, side='right')  # thresholds <= value
+    return (len(ascending) - above).astype(np.int8)
+
 def compute_popularity(train_df, items_df, config):
     """
     Computes popularity counts and bins based on training data.
+
+    Bins come from bin_scheme(config['popularity']); thresholds are quantiles of
+    the popularity of items that occur in train. If popularity.half_life_days is
+    set, binning uses time-decayed counts (stored as 'popularity_score').
+    'popularity_bin' is a categorical column (int8 codes), categories ordered
+    most to least popular.
     """
-    pop_counts = train_df['item_idx'].value_counts()
-    
-    # We map back to items_df
+    half_life = config['popularity'].get('half_life_days')
+
     # items_df must have 'internal_id' which corresponds to item_idx
+    ids = items_df['internal_id'].to_numpy(dtype=np.int64)
+    n = int(ids.max()) + 1 if len(ids) else 0
+    item_idx = train_df['item_idx'].to_numpy(dtype=np.int64)
+    n = max(n, int(item_idx.max()) + 1 if len(item_idx) else 0)
+
+    counts = np.bincount(item_idx, minlength=n)
+    scores = decayed_counts(train_df, half_life, num_items=n) if half_life else None
+    return apply_popularity(items_df, counts, config, scores=scores)
+
+def apply_popularity(items_df, counts, config, scores=None):
+    """
+    Bins items from per-item train counts (indexed by internal_id), e.g.
+    accumulated over chunks. scores: optional decayed counts used for binning.
+    Returns (items_df with popularity columns, stats).
+    """
+    pop_config = config['popularity']
+    scheme = bin_scheme(pop_config)
+
     items_df = items_df.copy()
-    items_df['popularity_count'] = items_df['internal_id'].map(pop_counts).fillna(0).astype(int)
-    
-    # Calculate thresholds from TRAIN set popularity of items that exist in train
-    # or all items? Usually distribution is over all available items, 
-    # but strictly we only know about train items.
-    
-    train_pop = items_df[items_df['popularity_count'] > 0]['popularity_count']
-    
-    head_thresh = train_pop.quantile(config['popularity']['head_quantile'])
-    torso_thresh = train_pop.quantile(config['popularity']['torso_quantile'])
-    
-    def get_bin(count):
-        if count >= head_thresh:
-            return 'head'
-        elif count >= torso_thresh:
-            return 'torso'
-        else:
-            return 'tail'
-            
-    items_df['popularity_bin'] = items_df['popularity_count'].apply(get_bin)
-    
-    stats = {
-        'head_threshold': float(head_thresh),
-        'torso_threshold': float(torso_thresh),
-        'head_items': int((items_df['popularity_bin'] == 'head').sum()),
-        'torso_items': int((items_df['popularity_bin'] == 'torso').sum()),
-        'tail_items': int((items_df['popularity_bin'] == 'tail').sum())
-    }
-    
+    ids = items_df['internal_id'].to_numpy(dtype=np.int64)
+    items_df['popularity_count'] = counts[ids].astype(int)
+
+    if scores is not None:
+        values = scores[ids]
+        items_df['popularity_score'] = values.astype(np.float32)
+    else:
+        values = counts[ids].astype(np.float64)
+
+    # Thresholds from the popularity of items that exist in train
+    train_pop = values[counts[ids] > 0]
+    quantiles = [q for _, q in scheme[:-1]]
+    thresholds = np.quantile(train_pop, quantiles) if len(train_pop) else np.zeros(len(quantiles))
+
+    codes = assign_bins(values, thresholds)
+    categories = [name for name, _ in scheme]
+    items_df['popularity_bin'] = pd.Categorical.from_codes(codes, categories=categories)
+
+    bin_sizes = np.bincount(codes, minlength=len(categories))
+    stats = {}
+    for (name, _), threshold in zip(scheme[:-1], thresholds):
+        stats[f'{name}_threshold'] = float(threshold)
+    for name, size in zip(categories, bin_sizes):
+        stats[f'{name}_items'] = int(size)
+    stats['popularity_bins'] = categories
+    if scores is not None:
+        stats['popularity_half_life_days'] = pop_config.get('half_life_days')
+
     return items_df, stats
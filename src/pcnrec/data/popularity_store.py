@@ -0,0 +1,299 @@
+import json
+import numpy as np
+import pandas as pd
+from pcnrec.data.popularity import SECONDS_PER_DAY, bin_scheme, assign_bins
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+class QuantileSketch:
+    """
+    Log-bucketed quantile sketch (DDSketch-style) over positive values.
+
+    Bucket k holds values in (gamma^(k-1), gamma^k], gamma = (1+a)/(1-a), so
+    quantiles are returned with relative error <= a. Buckets hold counts,
+    which can be decremented: an item whose popularity changes is removed
+    from its old bucket and added to its new one.
+    """
+
+    def __init__(self, relative_accuracy=0.01, buckets=None, offset=0):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self.gamma)
+        self.buckets = buckets if buckets is not None else np.zeros(0, dtype=np.int64)
+        self.offset = int(offset)
+
+    @property
+    def count(self):
+        return int(self.buckets.sum())
+
+    def _keys(self, values):
+        return np.ceil(np.log(values) / self._log_gamma).astype(np.int64)
+
+    def _grow(self, lo, hi):
+        if len(self.buckets) == 0:
+            self.buckets = np.zeros(hi - lo + 1, dtype=np.int64)
+            self.offset = lo
+            return
+        new_lo, new_hi = min(lo, self.offset), max(hi, self.offset + len(self.buckets) - 1)
+        if new_lo == self.offset and new_hi == self.offset + len(self.buckets) - 1:
+            return
+        grown = np.zeros(new_hi - new_lo + 1, dtype=np.int64)
+        grown[self.offset - new_lo:self.offset - new_lo + len(self.buckets)] = self.buckets
+        self.buckets, self.offset = grown, new_lo
+
+    def add(self, values, weight=1):
+        """Adds (weight=1) or removes (weight=-1) positive values."""
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        # Decayed weights of very old items can underflow to 0
+        values = np.maximum(values, np.finfo(np.float64).tiny)
+        keys = self._keys(values)
+        self._grow(int(keys.min()), int(keys.max()))
+        np.add.at(self.buckets, keys - self.offset, weight)
+
+    def quantile(self, q, integer=False):
+        """
+        Approximate q-quantiles (scalar or list) of the values currently held.
+        integer=True (values are counts) returns the smallest integer in the
+        bucket, which is exact wherever buckets are narrower than 1.
+        """
+        qs = np.atleast_1d(np.asarray(q, dtype=np.float64))
+        n = self.count
+        if n == 0:
+            return np.zeros(len(qs)) if np.ndim(q) else 0.0
+        cum = np.cumsum(self.buckets)
+        idx = np.searchsorted(cum, qs * (n - 1), side='right')
+        keys = idx + self.offset
+        if integer:
+            values = np.floor(self.gamma ** (keys - 1.0)) + 1
+        else:
+            values = 2 * self.gamma ** keys / (self.gamma + 1)
+        return values if np.ndim(q) else float(values[0])
+
+class PopularityStore:
+    """
+    Incremental per-item popularity for a growing interaction log.
+
+    counts:  int64 interaction count per item
+    scores:  decayed counts, if half_life_days is set. Stored on a fixed
+             reference time scale (weight 2^((t - t_ref)/half_life)), so time
+             passing rescales every item equally and leaves bins unchanged;
+             popularity() converts to 2^(-age/half_life) at the latest timestamp.
+    codes:   int8 bin code per item (index into bin_names, most popular first)
+
+    Thresholds are quantiles of the popularity of items with count > 0. By
+    default they are exact (np.quantile, linear interpolation, as in
+    compute_popularity), so the store bins every item as a fresh prepare run
+    would. With relative_accuracy set they come from a QuantileSketch that
+    is updated only for the items in each batch; bins then follow the
+    sketch's own thresholds and may differ from compute_popularity's.
+    """
+
+    def __init__(self, num_items, scheme, half_life_days=None, relative_accuracy=None):
+        self.scheme = [(name, q) for name, q in scheme]
+        self.half_life_days = half_life_days
+        self.counts = np.zeros(num_items, dtype=np.int64)
+        self.scores = np.zeros(num_items, dtype=np.float64) if half_life_days else None
+        self.codes = np.full(num_items, len(self.scheme) - 1, dtype=np.int8)
+        self.sketch = QuantileSketch(relative_accuracy) if relative_accuracy else None
+        self.t_ref = None
+        self.last_timestamp = None
+
+    @classmethod
+    def from_config(cls, config, num_items):
+        pop_config = config['popularity']
+        return cls(
+            num_items, bin_scheme(pop_config),
+            half_life_days=pop_config.get('half_life_days'),
+            relative_accuracy=pop_config.get('sketch_accuracy')
+        )
+
+    @classmethod
+    def from_interactions(cls, config, interactions_df, num_items, items_df=None):
+        """
+        Store seeded with an interactions frame ('item_idx', 'timestamp').
+        Its codes are the store's own bins, so the next update() reports only
+        changes caused by that batch. If items_df (with internal_id and
+        popularity_bin, as written by compute_popularity) is given, the
+        seeded bins are checked against it; with exact thresholds they agree
+        (a mismatch is logged).
+        """
+        store = cls.from_config(config, num_items)
+        store.update(interactions_df['item_idx'].to_numpy(), interactions_df['timestamp'].to_numpy())
+        if items_df is not None:
+            codes = pd.Categorical(items_df['popularity_bin'].astype(str), categories=store.bin_names).codes
+            if (codes < 0).any():
+                raise ValueError(f"items have popularity bins outside the scheme {store.bin_names}")
+            mismatched = int((store.codes[items_df['internal_id'].to_numpy(dtype=np.int64)] != codes).sum())
+            if mismatched:
+                logger.warning(
+                    f"Popularity store bins differ from items.parquet for {mismatched} items"
+                    + (" (sketch thresholds are approximate)" if store.sketch is not None else "")
+                )
+        return store
+
+    @property
+    def num_items(self):
+        return len(self.counts)
+
+    @property
+    def bin_names(self):
+        return [name for name, _ in self.scheme]
+
+    def _values(self, ids=None):
+        # Binning values on the internal scale (counts, or reference-scale scores)
+        values = self.scores if self.half_life_days else self.counts
+        return (values if ids is None else values[ids]).astype(np.float64)
+
+    def _grow(self, num_items):
+        extra = num_items - self.num_items
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+        if self.scores is not None:
+            self.scores = np.concatenate([self.scores, np.zeros(extra)])
+        self.codes = np.concatenate([self.codes, np.full(extra, len(self.scheme) - 1, dtype=np.int8)])
+
+    def _rebase(self, t_new):
+        # Keep reference-scale weights finite: move t_ref forward and rescale
+        factor = np.exp2(-(t_new - self.t_ref) / (self.half_life_days * SECONDS_PER_DAY))
+        self.scores *= factor
+        self.t_ref = t_new
+        if self.sketch is not None:
+            active = self.counts > 0
+            self.sketch = QuantileSketch(self.sketch.relative_accuracy)
+            self.sketch.add(self.scores[active])
+
+    def _ref_thresholds(self):
+        quantiles = [q for _, q in self.scheme[:-1]]
+        if self.sketch is not None:
+            return self.sketch.quantile(quantiles, integer=not self.half_life_days)
+        # Exact, with compute_popularity's interpolation
+        active = self._values()[self.counts > 0]
+        return np.quantile(active, quantiles) if len(active) else np.zeros(len(quantiles))
+
+    def thresholds(self):
+        """Current bin thresholds on the popularity() scale, most popular bin first."""
+        return self._ref_thresholds() * self._scale()
+
+    def _scale(self):
+        if not self.half_life_days or self.last_timestamp is None:
+            return 1.0
+        return float(np.exp2(-(self.last_timestamp - self.t_ref) / (self.half_life_days * SECONDS_PER_DAY)))
+
+    def popularity(self):
+        """Per-item popularity: counts, or decayed counts as of the latest timestamp."""
+        return self._values() * self._scale()
+
+    def update(self, item_idx, timestamps=None):
+        """
+        Adds one batch of interactions and re-bins.
+
+        Returns a report with the items whose bin changed:
+            {'num_interactions', 'touched_items', 'changed_items' (int64 ids),
+             'old_codes', 'new_codes' (int8), 'thresholds'}
+        """
+        item_idx = np.asarray(item_idx, dtype=np.int64)
+        if len(item_idx) and int(item_idx.max()) >= self.num_items:
+            self._grow(int(item_idx.max()) + 1)
+
+        exponent = None
+        if self.half_life_days:
+            if timestamps is None:
+                raise ValueError("timestamps are required when half_life_days is set")
+            ts = np.asarray(timestamps, dtype=np.float64)
+            if self.t_ref is None:
+                self.t_ref = float(ts.min())
+            exponent = (ts - self.t_ref) / (self.half_life_days * SECONDS_PER_DAY)
+            if len(ts) and exponent.max() > 512:
+                self._rebase(float(ts.max()))
+                exponent = (ts - self.t_ref) / (self.half_life_days * SECONDS_PER_DAY)
+
+        # Move touched items between sketch buckets: remove old values, add new ones
+        touched = np.unique(item_idx)
+        if self.sketch is not None:
+            was_active = self.counts[touched] > 0
+            self.sketch.add(self._values(touched[was_active]), weight=-1)
+
+        self.counts += np.bincount(item_idx, minlength=self.num_items)
+        if exponent is not None:
+            self.scores += np.bincount(item_idx, weights=np.exp2(exponent), minlength=self.num_items)
+        if timestamps is not None and len(timestamps):
+            batch_last = float(np.max(timestamps))
+            self.last_timestamp = batch_last if self.last_timestamp is None else max(self.last_timestamp, batch_last)
+
+        if self.sketch is not None:
+            self.sketch.add(self._values(touched))
+
+        new_codes = assign_bins(self._values(), self._ref_thresholds())
+        changed = np.flatnonzero(new_codes != self.codes)
+        report = {
+            'num_interactions': int(len(item_idx)),
+            'touched_items': int(len(touched)),
+            'changed_items': changed,
+            'old_codes': self.codes[changed],
+            'new_codes': new_codes[changed],
+            'thresholds': self.thresholds()
+        }
+        self.codes = new_codes
+        return report
+
+    def apply_to_items(self, items_df):
+        """
+        Copy of items_df (with 'internal_id') with popularity_count,
+        popularity_score (if decayed) and the categorical popularity_bin
+        replaced by the store's current values.
+        """
+        items_df = items_df.copy()
+        ids = items_df['internal_id'].to_numpy(dtype=np.int64)
+        items_df['popularity_count'] = self.counts[ids].astype(int)
+        if self.half_life_days:
+            items_df['popularity_score'] = self.popularity()[ids].astype(np.float32)
+        items_df['popularity_bin'] = pd.Categorical.from_codes(self.codes[ids], categories=self.bin_names)
+        return items_df
+
+    def save(self, path):
+        """Saves arrays and settings to an uncompressed .npz."""
+        meta = {
+            'scheme': self.scheme,
+            'half_life_days': self.half_life_days,
+            'relative_accuracy': self.sketch.relative_accuracy if self.sketch is not None else None,
+            'sketch_offset': self.sketch.offset if self.sketch is not None else 0,
+            't_ref': self.t_ref,
+            'last_timestamp': self.last_timestamp
+        }
+        arrays = {'counts': self.counts, 'codes': self.codes, 'meta': np.array(json.dumps(meta))}
+        if self.sketch is not None:
+            arrays['sketch'] = self.sketch.buckets
+        if self.scores is not None:
+            arrays['scores'] = self.scores
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as z:
+            meta = json.loads(str(z['meta']))
+            store = cls(0, meta['scheme'], half_life_days=meta['half_life_days'], relative_accuracy=meta['relative_accuracy'])
+            store.counts = z['counts']
+            store.codes = z['codes']
+            if 'scores' in z.files:
+                store.scores = z['scores']
+            if 'sketch' in z.files:
+                store.sketch = QuantileSketch(meta['relative_accuracy'], buckets=z['sketch'], offset=meta['sketch_offset'])
+        store.t_ref = meta['t_ref']
+        store.last_timestamp = meta['last_timestamp']
+        return store
+
+def changes_summary(report, bin_names):
+    """JSON-friendly summary of an update() report: transition counts and thresholds."""
+    transitions = {}
+    for old, new in zip(report['old_codes'], report['new_codes']):
+        key = f"{bin_names[old]}->{bin_names[new]}"
+        transitions[key] = transitions.get(key, 0) + 1
+    return {
+        'num_interactions': report['num_interactions'],
+        'touched_items': report['touched_items'],
+        'changed_items': int(len(report['changed_items'])),
+        'transitions': transitions,
+        'thresholds': {name: float(t) for name, t in zip(bin_names[:-1], report['thresholds'])}
+    }
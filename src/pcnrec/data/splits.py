@@ -1,34 +1,53 @@
-import pandas as pd
+import numpy as np
 from pcnrec.utils.logging import setup_logger
 
 logger = setup_logger(__name__)
 
+def _user_time_order(users, timestamps):
+    """
+    Stable argsort by (user, timestamp). Integer columns are packed into one
+    int64 key when the ranges allow it (about 2x faster than np.lexsort).
+    """
+    if len(users) and users.dtype.kind in 'iu' and timestamps.dtype.kind in 'iu':
+        u_min, t_min = int(users.min()), int(timestamps.min())
+        u_span = int(users.max()) - u_min + 1
+        t_span = int(timestamps.max()) - t_min + 1
+        if u_span * t_span < 2 ** 63:
+            key = (users.astype(np.int64) - u_min) * t_span + (timestamps.astype(np.int64) - t_min)
+            return np.argsort(key, kind='stable')
+    return np.lexsort((timestamps, users))
+
 def time_aware_split(df, test_ratio):
     """
     Performs time-aware split per user.
     df must have 'user_idx' and 'timestamp'.
+
+    Each user's last n_test interactions (by timestamp) go to test, with
+    n_test = int(n * test_ratio), at least 1 when the user has more than one
+    interaction, and at most n - 1.
+    Vectorized: one stable sort by (user_idx, timestamp), then per-user
+    rank/count arithmetic gives the test mask. Rows keep their original index,
+    and both outputs are ordered by (user_idx, timestamp).
     """
     logger.info("Sorting by timestamp for splitting...")
-    df = df.sort_values(['user_idx', 'timestamp'])
-    
-    train_list = []
-    test_list = []
-    
-    for uid, group in df.groupby('user_idx'):
-        n = len(group)
-        n_test = int(n * test_ratio)
-        if n_test < 1 and n > 1:
-            n_test = 1
-        
-        if n_test >= n:
-             n_test = n - 1
-             
-        split_idx = n - n_test
-        
-        train_list.append(group.iloc[:split_idx])
-        test_list.append(group.iloc[split_idx:])
-        
-    train_df = pd.concat(train_list)
-    test_df = pd.concat(test_list)
-    
+    order = _user_time_order(df['user_idx'].to_numpy(), df['timestamp'].to_numpy())
+    users = df['user_idx'].to_numpy()[order]
+
+    # Group boundaries in the sorted user column
+    n_rows = len(users)
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if n_rows else np.array([], dtype=np.int64)
+    counts = np.diff(np.r_[starts, n_rows])
+
+    n_test = (counts * test_ratio).astype(np.int64)
+    n_test[(n_test < 1) & (counts > 1)] = 1
+    n_test = np.where(n_test >= counts, counts - 1, n_test)
+
+    # Position within the user's group vs. where the test tail starts
+    rank = np.arange(n_rows) - np.repeat(starts, counts)
+    is_test = rank >= np.repeat(counts - n_test, counts)
+
+    sorted_df = df.iloc[order]
+    train_df = sorted_df[~is_test]
+    test_df = sorted_df[is_test]
+
     return train_df, test_df
@@ -0,0 +1,281 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pcnrec.utils.io import ensure_dir, save_parquet
+from pcnrec.utils.logging import setup_logger
+from pcnrec.data.movielens_prepare import ML_100K_GENRES
+from pcnrec.data.splits import time_aware_split
+from pcnrec.data.popularity import apply_popularity, SECONDS_PER_DAY
+from pcnrec.data.interaction_index import InteractionIndex, index_path
+from pcnrec.candidates.scoring import EmbeddingScorer
+from pcnrec.candidates.generate_candidates import write_candidates
+
+logger = setup_logger(__name__)
+
+# Genre combinations are rendered from int64 bitmasks (one bit per genre)
+MAX_GENRES = 63
+
+# MovieLens-like star distribution (1..5)
+RATING_PROBS = [0.06, 0.11, 0.27, 0.34, 0.22]
+
+INTERACTION_SCHEMA = pa.schema([
+    ('user_id', pa.int32()),
+    ('item_id', pa.int32()),
+    ('rating', pa.int8()),
+    ('timestamp', pa.int32()),
+    ('user_idx', pa.int32()),
+    ('item_idx', pa.int32())
+])
+
+def genre_names(num_genres):
+    """MovieLens genre names (without 'unknown'), extended with Genre<j> past 18."""
+    names = ML_100K_GENRES[1:]
+    return names[:num_genres] + [f"Genre{j}" for j in range(len(names), num_genres)]
+
+def zipf_weights(n, alpha, rng=None):
+    """Power-law weights rank^-alpha; shuffled over ids when rng is given."""
+    weights = np.arange(1, n + 1, dtype=np.float64) ** -alpha
+    return rng.permutation(weights) if rng is not None else weights
+
+def generate_items(num_items, num_genres, genres_per_item, genre_alpha, rng):
+    """
+    Items frame (original_id, internal_id, title, genres) and the (num_items, num_genres)
+    bool genre matrix. Each item gets 1 + Poisson(genres_per_item - 1) distinct
+    genres, drawn by Zipf-distributed genre frequency (Gumbel top-k).
+    """
+    if not 1 <= num_genres <= MAX_GENRES:
+        raise ValueError(f"num_genres must be between 1 and {MAX_GENRES}, got {num_genres}")
+    names = genre_names(num_genres)
+    k = np.clip(1 + rng.poisson(max(genres_per_item - 1, 0), num_items), 1, num_genres)
+    keys = np.log(zipf_weights(num_genres, genre_alpha)) + rng.gumbel(size=(num_items, num_genres))
+    order = np.argsort(-keys, axis=1)
+    genre_matrix = np.zeros((num_items, num_genres), dtype=bool)
+    rows = np.repeat(np.arange(num_items), k)
+    cols = order[rows, np.concatenate([np.arange(c) for c in k]) if num_items else []]
+    genre_matrix[rows, cols] = True
+
+    # Render "A|B" once per distinct genre combination
+    masks = genre_matrix.astype(np.int64) @ (1 << np.arange(num_genres, dtype=np.int64))
+    unique_masks, inverse = np.unique(masks, return_inverse=True)
+    rendered = np.array(['|'.join(n for j, n in enumerate(names) if m >> j & 1) for m in unique_masks], dtype=object)
+
+    ids = np.arange(num_items, dtype=np.int32)
+    items = pd.DataFrame({
+        'original_id': ids.astype(np.int64) + 1,
+        'internal_id': ids,
+        'title': [f"Synthetic Movie {i + 1} ({1950 + i % 70})" for i in range(num_items)],
+        'genres': rendered[inverse]
+    })
+    return items, genre_matrix
+
+class _GenreSampler:
+    """
+    Popularity-weighted item sampling, globally or within one genre, vectorized
+    over a batch of draws. Per-genre CDFs are concatenated with genre g's CDF
+    shifted by g, so one searchsorted serves every genre.
+    """
+
+    def __init__(self, item_weights, genre_matrix):
+        self.global_cdf = np.cumsum(item_weights)
+        self.global_cdf /= self.global_cdf[-1]
+        genre_idx, item_idx = np.nonzero(genre_matrix.T)
+        self.items = item_idx
+        w = item_weights[item_idx]
+        seg_start = np.searchsorted(genre_idx, np.arange(genre_matrix.shape[1]))
+        totals = np.add.reduceat(w, seg_start) if len(w) else w
+        cum = np.cumsum(w)
+        offset = np.concatenate([[0.0], cum])[seg_start]
+        self.shifted_cdf = genre_idx + (cum - offset[genre_idx]) / totals[genre_idx]
+
+    def sample_global(self, u):
+        return np.minimum(np.searchsorted(self.global_cdf, u, side='right'), len(self.global_cdf) - 1)
+
+    def sample_genre(self, genres, u):
+        pos = np.searchsorted(self.shifted_cdf, genres + u, side='right')
+        return self.items[np.minimum(pos, len(self.items) - 1)]
+
+def _draw_items(users, sampler, user_genres, params, rng):
+    # One item per entry of users: from a preferred genre with probability genre_affinity, else global
+    u = rng.random(len(users))
+    from_genre = rng.random(len(users)) < params['genre_affinity']
+    pick = rng.integers(0, user_genres.shape[1], len(users))
+    items = np.empty(len(users), dtype=np.int64)
+    items[~from_genre] = sampler.sample_global(u[~from_genre])
+    items[from_genre] = sampler.sample_genre(user_genres[users[from_genre], pick[from_genre]], u[from_genre])
+    return items
+
+def generate_interactions(user_ids, sampler, user_genres, params, rng):
+    """
+    Interactions for a block of users: power-law activity (Pareto above
+    min_interactions), a genre_affinity share drawn from each user's preferred
+    genres and the rest from global popularity; (user, item) pairs are unique.
+    Users left below min_interactions by de-duplication are topped up with
+    further draws, so every user has at least min_interactions, as after
+    prepare_data's filter.
+    """
+    n_users = len(user_ids)
+    num_items = params['num_items']
+    min_n = params['min_interactions']
+    extra_mean = max(params['mean_interactions'] - min_n, 0)
+    alpha = params['user_alpha']
+    # Lomax (Pareto II) with mean extra_mean: mean = scale / (alpha - 1)
+    scale = extra_mean * (alpha - 1) if alpha > 1 else extra_mean
+    n = min_n + np.floor(rng.pareto(alpha, n_users) * scale).astype(np.int64)
+    n = np.minimum(n, params['max_interactions'])
+
+    local = np.repeat(np.arange(n_users), n)
+    keys = np.unique(local * num_items + _draw_items(user_ids[local], sampler, user_genres, params, rng))
+    while True:
+        counts = np.bincount(keys // num_items, minlength=n_users)
+        short = np.flatnonzero(counts < min_n)
+        if not len(short):
+            break
+        local = np.repeat(short, min_n - counts[short])
+        keys = np.union1d(keys, local * num_items + _draw_items(user_ids[local], sampler, user_genres, params, rng))
+    users, items = user_ids[keys // num_items], keys % num_items
+
+    return pd.DataFrame({
+        'user_id': (users + 1).astype(np.int32),
+        'item_id': (items + 1).astype(np.int32),
+        'rating': rng.choice(np.arange(1, 6, dtype=np.int8), len(users), p=RATING_PROBS),
+        'timestamp': rng.integers(params['t_start'], params['t_end'], len(users)).astype(np.int32),
+        'user_idx': users.astype(np.int32),
+        'item_idx': items.astype(np.int32)
+    })
+
+def synthetic_scorer(user_genres, genre_matrix, item_weights, rng, noise=0.3):
+    """
+    Embedding model for synthetic candidates: users point at their preferred
+    genres, items at their genres, and item biases follow log popularity.
+    """
+    num_users = len(user_genres)
+    num_genres = genre_matrix.shape[1]
+    user_emb = rng.normal(0, noise, (num_users, num_genres)).astype(np.float32)
+    np.add.at(user_emb, (np.arange(num_users)[:, None], user_genres), 1.0)
+    item_emb = genre_matrix / np.sqrt(genre_matrix.sum(axis=1, keepdims=True))
+    item_emb = (item_emb + rng.normal(0, noise, item_emb.shape)).astype(np.float32)
+    item_bias = np.log(item_weights / item_weights.max()).astype(np.float32) * 0.1
+    return EmbeddingScorer(user_emb, np.zeros(num_users, dtype=np.float32), item_emb, item_bias)
+
+def generate_dataset(config, output_dir, num_users=None, num_items=None, candidates=None):
+    """
+    Writes a MovieLens-shaped run under output_dir (data/ and candidates/):
+    interactions_train/test.parquet (+ .csr.npz), users.parquet, items.parquet
+    (genres, popularity_count, popularity_bin), stats.json and
+    candidates/candidates_topk.parquet, with the schemas step1 produces.
+
+    Users are generated in chunks of synthetic.chunk_users and streamed to the
+    parquet files, so memory is bounded by one chunk plus the CSR indexes.
+    Returns stats.
+    """
+    syn = config['synthetic']
+    rng = np.random.default_rng(syn.get('seed', 42))
+    num_users = num_users or syn['num_users']
+    num_items = num_items or syn['num_items']
+    num_genres = syn.get('num_genres', 18)
+    candidates = syn.get('candidates', True) if candidates is None else candidates
+    if num_items < config['dataset']['min_user_interactions']:
+        raise ValueError(f"num_items ({num_items}) must be at least dataset.min_user_interactions "
+                         f"({config['dataset']['min_user_interactions']})")
+    data_dir = os.path.join(output_dir, "data")
+    ensure_dir(data_dir)
+
+    logger.info(f"Generating {num_items} items, {num_genres} genres...")
+    items, genre_matrix = generate_items(num_items, num_genres, syn.get('genres_per_item', 1.7), syn.get('genre_alpha', 1.0), rng)
+    item_weights = zipf_weights(num_items, syn.get('item_alpha', 1.0), rng)
+    sampler = _GenreSampler(item_weights, genre_matrix)
+
+    # Two preferred genres per user, drawn by overall genre frequency
+    genre_freq = genre_matrix.sum(axis=0) / genre_matrix.sum()
+    user_genres = rng.choice(num_genres, size=(num_users, 2), p=genre_freq)
+
+    t_end = syn.get('t_end', 1_600_000_000)
+    params = {
+        'num_items': num_items,
+        'min_interactions': config['dataset']['min_user_interactions'],
+        'mean_interactions': syn.get('mean_interactions', 60),
+        'max_interactions': max(config['dataset']['min_user_interactions'], num_items // 2),
+        'user_alpha': syn.get('user_alpha', 2.0),
+        'genre_affinity': syn.get('genre_affinity', 0.6),
+        't_start': t_end - int(syn.get('span_days', 3 * 365) * SECONDS_PER_DAY),
+        't_end': t_end
+    }
+    half_life = config['popularity'].get('half_life_days')
+
+    counts = np.zeros(num_items, dtype=np.int64)
+    # Decayed weights relative to t_end; rescaled to the last train timestamp at the end
+    decayed = np.zeros(num_items) if half_life else None
+    max_train_ts = None
+    indexes = {'train': ([], []), 'test': ([], [])}
+    n_rows = {'train': 0, 'test': 0}
+    chunk = syn.get('chunk_users', 50000)
+    paths = {split: os.path.join(data_dir, f"interactions_{split}.parquet") for split in indexes}
+    writers = {split: pq.ParquetWriter(path, INTERACTION_SCHEMA) for split, path in paths.items()}
+    try:
+        for start in range(0, num_users, chunk):
+            user_ids = np.arange(start, min(start + chunk, num_users), dtype=np.int64)
+            df = generate_interactions(user_ids, sampler, user_genres, params, rng)
+            train_df, test_df = time_aware_split(df, config['dataset']['test_ratio'])
+            # Both parts come back ordered by (user_idx, timestamp)
+            for split, part in [('train', train_df), ('test', test_df)]:
+                writers[split].write_table(pa.Table.from_pandas(part, schema=INTERACTION_SCHEMA, preserve_index=False))
+                n_rows[split] += len(part)
+                # CSR block for this contiguous user range
+                block = InteractionIndex.from_frame(
+                    part.assign(user_idx=part['user_idx'] - start), num_users=len(user_ids), num_items=num_items)
+                indexes[split][0].append(np.diff(block.indptr))
+                indexes[split][1].append(block.indices)
+
+            items_idx = train_df['item_idx'].to_numpy(dtype=np.int64)
+            counts += np.bincount(items_idx, minlength=num_items)
+            if half_life and len(train_df):
+                ts = train_df['timestamp'].to_numpy(dtype=np.float64)
+                decayed += np.bincount(items_idx, weights=np.exp2((ts - t_end) / (half_life * SECONDS_PER_DAY)), minlength=num_items)
+                max_train_ts = max(max_train_ts or ts.max(), ts.max())
+            logger.info(f"Users {start}-{user_ids[-1]}: {len(train_df)} train / {len(test_df)} test")
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    for split, (lengths, indices) in indexes.items():
+        lengths = np.concatenate(lengths) if lengths else np.zeros(0, dtype=np.int64)
+        indices = np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32)
+        ptr_dtype = np.int32 if len(indices) < np.iinfo(np.int32).max else np.int64
+        indptr = np.zeros(num_users + 1, dtype=ptr_dtype)
+        np.cumsum(lengths, out=indptr[1:])
+        InteractionIndex(indptr, indices, num_items).save(index_path(paths[split]))
+
+    scores = None
+    if half_life:
+        scores = decayed * np.exp2((t_end - max_train_ts) / (half_life * SECONDS_PER_DAY)) if max_train_ts is not None else decayed
+    items, pop_stats = apply_popularity(items, counts, config, scores=scores)
+    save_parquet(items, os.path.join(data_dir, "items.parquet"))
+    users = pd.DataFrame({'original_id': np.arange(1, num_users + 1, dtype=np.int32), 'internal_id': np.arange(num_users, dtype=np.int32)})
+    save_parquet(users, os.path.join(data_dir, "users.parquet"))
+
+    stats = {
+        'num_users': num_users,
+        'num_items': num_items,
+        'train_interactions': n_rows['train'],
+        'test_interactions': n_rows['test'],
+        **pop_stats,
+        'synthetic': {k: v for k, v in syn.items()}
+    }
+    with open(os.path.join(data_dir, "stats.json"), 'w') as f:
+        json.dump(stats, f, indent=2, default=str)
+
+    if candidates:
+        top_k = config['candidates']['top_k']
+        logger.info(f"Writing top-{top_k} synthetic candidates...")
+        scorer = synthetic_scorer(user_genres, genre_matrix, item_weights, rng)
+        seen = InteractionIndex.load(index_path(paths['train']))
+        stats['candidate_rows'] = write_candidates(
+            scorer, seen, num_users, num_items, top_k,
+            os.path.join(output_dir, "candidates", "candidates_topk.parquet"),
+            num_threads=config['candidates'].get('num_threads', 1)
+        )
+
+    return stats
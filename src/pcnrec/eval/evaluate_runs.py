@@ -1,21 +1,36 @@
 import pandas as pd
 import numpy as np
-from pcnrec.eval.metrics import compute_metrics_for_user
+from pcnrec.eval.metrics import compute_metrics_from_relevance
+from pcnrec.data.interaction_index import InteractionIndex
 from pcnrec.runs.io import read_results, save_summary
+from pcnrec.verify.cache import verify_selections
 
-def evaluate_run(run_dir, test_df, items_df, k=10, subset_users=None):
+def evaluate_run(run_dir, test_df, items_df, k=10, subset_users=None, catalog=None, constraints=None, audit_pass=None):
     """
     Evaluates a single run directory against test set.
+    test_df may be the test interactions frame or its InteractionIndex
+    (pass the index when evaluating several runs to build it once).
+    With catalog and constraints, selections are re-verified through the
+    shared verification cache (verify.cache.verify_selections) and tail
+    counts come from the recomputed stats; selections repeated across runs
+    and the all/feasible-only passes are verified once.
+    audit_pass: {user_id: bool} from the run's audit (verify.auditor);
+    when given it replaces the verifier flag stored in the rows.
     """
     results = read_results(run_dir)
     if not results:
         return {}, pd.DataFrame()
         
     # Build GT lookup
-    gt_lookup = test_df.groupby('user_idx')['item_idx'].apply(set).to_dict()
+    if isinstance(test_df, InteractionIndex):
+        gt_index = test_df
+    else:
+        gt_index = InteractionIndex.from_frame(test_df)
+    gt_counts = gt_index.lengths()
     
     metrics_list = []
     
+    rows, selections = [], []
     for row in results:
         uid = row['user_id']
         
@@ -25,27 +40,33 @@ def evaluate_run(run_dir, test_df, items_df, k=10, subset_users=None):
         selected = row['selected_item_ids']
         if items_df is not None:
              selected = [sid for sid in selected if sid in items_df.index]
+        rows.append(row)
+        selections.append(selected)
+    
+    verifications = [None] * len(rows)
+    if catalog is not None and constraints is not None:
+        verifications = verify_selections(selections, catalog, constraints)
+    
+    for row, selected, verification in zip(rows, selections, verifications):
+        uid = row['user_id']
         
-        gt = gt_lookup.get(uid, set())
+        relevance = gt_index.contains(uid, np.asarray(selected, dtype=np.int64)).astype(int)
+        n_gt = int(gt_counts[uid]) if uid < gt_index.num_users else 0
         
-        m = compute_metrics_for_user(selected, gt, items_df, k=k)
+        tail_count = verification['recomputed']['tail_count'] if verification is not None else None
+        m = compute_metrics_from_relevance(relevance.tolist(), n_gt, selected, items_df, k=k, tail_count=tail_count)
         
         # Extended metrics
         verifier_pass = False
-        if 'verifier' in row:
+        if audit_pass is not None:
+             verifier_pass = bool(audit_pass.get(uid, False))
+        elif 'verifier' in row:
              verifier_pass = row['verifier'].get('pass', False)
         elif 'verifier_result' in row:
              verifier_pass = row['verifier_result'].get('pass', False)
         
-        # Check if implicitly passed (e.g. sanity baselines assume pass?)
-        # Actually sanity baselines don't have verifier_result. 
-        # But for comparison table we want "PassRate".
-        # We can re-check verification here if we wanted to be 100% sure for baselines.
-        # But let's stick to what's in JSON for now. 
-        # For sanity baselines, maybe we should run verifier? 
-        # The user didn't explicitly ask to run verifier on baselines, but "PassRate" is a key metric.
-        # If baselines don't define it, it's 0 or N/A.
-        # However, constrained_greedy SHOULD pass.
+        # Without an audit, rows that carry no verifier result (sanity
+        # baselines) count as not passing; step2_evaluate audits every run.
         
         m['verifier_pass'] = 1.0 if verifier_pass else 0.0
         m['repair_used'] = 1.0 if row.get('deterministic_repair_used', False) else 0.0
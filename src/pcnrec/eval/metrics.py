@@ -22,7 +22,16 @@ def compute_metrics_for_user(selected_ids, ground_truth_ids, items_df=None, k=10
     # Relevance list for NDCG
     relevance = [1 if i in ground_truth_ids else 0 for i in selected_ids]
     
-    recall = sum(relevance) / len(ground_truth_ids) if ground_truth_ids else 0.0
+    return compute_metrics_from_relevance(relevance, len(ground_truth_ids), selected_ids, items_df, k=k)
+
+def compute_metrics_from_relevance(relevance, n_relevant, selected_ids, items_df=None, k=10, tail_count=None):
+    """
+    Same metrics as compute_metrics_for_user, from a precomputed 0/1 relevance
+    vector (e.g. InteractionIndex.contains) and the ground-truth size.
+    tail_count: the selection's tail items if already known (e.g. a verifier
+    result's recomputed stats); otherwise counted from items_df.
+    """
+    recall = sum(relevance) / n_relevant if n_relevant else 0.0
     ndcg = ndcg_at_k(relevance, k)
     
     metrics = {
@@ -30,10 +39,11 @@ def compute_metrics_for_user(selected_ids, ground_truth_ids, items_df=None, k=10
         f'ndcg@{k}': ndcg
     }
     
-    if items_df is not None:
+    if tail_count is not None or items_df is not None:
         # Tail Exposure
-        subset = items_df.loc[selected_ids]
-        tail_count = (subset['popularity_bin'] == 'tail').sum()
+        if tail_count is None:
+            subset = items_df.loc[selected_ids]
+            tail_count = (subset['popularity_bin'] == 'tail').sum()
         metrics[f'tail_prop@{k}'] = tail_count / len(selected_ids) if selected_ids else 0.0
         
     return metrics
@@ -27,10 +27,20 @@ class SafetyConfig(BaseModel):
     no_duplicates: Optional[bool] = None
     model_config = ConfigDict(extra='forbid')
 
+class ConstraintRule(BaseModel):
+    # One constraints.rules entry (pcnrec.verify.constraints registry); unused fields stay None
+    type: str
+    bin: Optional[str] = None
+    limit: Optional[int] = None
+    max_distance: Optional[float] = None
+    target: Optional[str] = None
+    model_config = ConfigDict(extra='forbid')
+
 class ConstraintsConfig(BaseModel):
     popularity: Optional[PopularityConfig] = None
     diversity: Optional[DiversityConfig] = None
     safety: Optional[SafetyConfig] = None
+    rules: Optional[List[ConstraintRule]] = None
     model_config = ConfigDict(extra='forbid')
 
 class RecommendationSelection(BaseModel):
@@ -54,5 +64,5 @@ class ProofCertificate(BaseModel):
     selected_item_ids: List[int]
     computed_stats_claimed: ComputedStats
     negotiation_trace: List[NegotiationRound]
-    signature: str = Field(..., description="Non-cryptographic hash showing traceability.")
+    signature: str = Field(..., description="Filled in by the system (HMAC-SHA256 over the canonical certificate); leave empty.")
     model_config = ConfigDict(extra='forbid')
@@ -0,0 +1,309 @@
+import os
+import json
+import shutil
+import hashlib
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+RECORDS_DIR = "artifacts"
+ENTRY_FILE = "entry.json"
+
+# Per stage: outputs (paths under the run dir), run-specific files inside them
+# that are not cached (ignore), config paths that determine the outputs (minus
+# excluded paths that only affect speed or file locations), and upstream stages
+# whose artifact digests are part of the key. 'inputs' narrows an upstream stage
+# to the files the stage actually reads, so e.g. update_popularity rewriting
+# items.parquet does not invalidate the model.
+STAGES = {
+    'data': {
+        'outputs': ['data'],
+        'ignore': ['data/config_resolved.yaml'],
+        'config': ['dataset', 'popularity'],
+        'exclude': ['dataset.output_dir', 'dataset.data_dir', 'dataset.parse_cache', 'dataset.archive_path',
+                    'dataset.mirror_dir', 'dataset.archive_sha256', 'dataset.verify_checksums'],
+        'upstream': []
+    },
+    'model': {
+        'outputs': ['models'],
+        'config': ['candidates'],
+        'exclude': ['candidates.top_k', 'candidates.retrieval', 'candidates.ivf', 'candidates.sweep', 'candidates.num_threads'],
+        'upstream': ['data'],
+        'inputs': {'data': ['data/interactions_train.parquet', 'data/interactions_train.csr.npz']}
+    },
+    'candidates': {
+        'outputs': ['candidates'],
+        'config': ['candidates.top_k', 'candidates.retrieval', 'candidates.ivf'],
+        'exclude': ['candidates.ivf.recall_sample_users'],
+        'upstream': ['data', 'model']
+    },
+    'mmr': {
+        'outputs': ['baselines/mmr_topn.parquet'],
+        'config': ['mmr'],
+        'exclude': [],
+        'upstream': ['data', 'candidates']
+    }
+}
+
+def _get_path(config, dotted):
+    node = config
+    for part in dotted.split('.'):
+        if not isinstance(node, dict) or part not in node:
+            return None
+        node = node[part]
+    return node
+
+def _drop_path(params, dotted):
+    parts = dotted.split('.')
+    node = params
+    for part in parts[:-1]:
+        node = node.get(part) if isinstance(node, dict) else None
+        if node is None:
+            return
+    if isinstance(node, dict):
+        node.pop(parts[-1], None)
+
+def stage_params(config, stage):
+    """The config values a stage's outputs depend on, as {dotted path: value}."""
+    spec = STAGES[stage]
+    params = {path: json.loads(json.dumps(_get_path(config, path), default=str)) for path in spec['config']}
+    for path in spec['exclude']:
+        for root in spec['config']:
+            if path == root:
+                params.pop(root, None)
+            elif path.startswith(root + '.'):
+                _drop_path(params[root], path[len(root) + 1:])
+    return params
+
+def _hash_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            h.update(block)
+    return h.hexdigest()
+
+def _digest_files(run_dir, files):
+    # sha256 over (relative path, content hash) pairs
+    h = hashlib.sha256()
+    for rel in files:
+        h.update(rel.encode('utf-8'))
+        h.update(_hash_file(os.path.join(run_dir, rel)).encode('ascii'))
+    return h.hexdigest()
+
+def _list_files(run_dir, spec):
+    """Relative paths of all cached files under the stage's outputs, sorted."""
+    files = []
+    for out in spec['outputs']:
+        path = os.path.join(run_dir, out)
+        if os.path.isfile(path):
+            files.append(out)
+        elif os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                for name in names:
+                    files.append(os.path.relpath(os.path.join(root, name), run_dir))
+    ignore = set(spec.get('ignore', []))
+    return sorted(f for f in files if f not in ignore)
+
+def _stat(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def _link_or_copy(src, dst):
+    ensure_dir(os.path.dirname(dst))
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        # Different filesystem (or no hardlink support): fall back to a copy
+        shutil.copy2(src, dst)
+
+def detach(paths):
+    """
+    Replaces hardlinked files under paths with private copies, so writing to
+    them in place cannot change the shared store.
+    """
+    for path in paths:
+        targets = [path] if os.path.isfile(path) else [
+            os.path.join(root, name) for root, _, names in os.walk(path) for name in names
+        ]
+        for target in targets:
+            if os.stat(target).st_nlink > 1:
+                tmp = target + ".detach"
+                shutil.copy2(target, tmp)
+                os.replace(tmp, target)
+
+class PipelineStage:
+    """
+    Content-addressed caching for one step of a run.
+
+    key    = sha256(stage, config params, extra args, upstream artifact digests)
+    digest = sha256 over the stage's output files (paths + content hashes)
+
+    Finished outputs are hardlinked into <store_dir>/<stage>/<key>/; a run whose
+    key is already in the store gets the files linked into its run dir instead
+    of recomputing them. Per-run records live in <run_dir>/artifacts/<stage>.json.
+
+    Usage in a step script:
+        stage = PipelineStage(config, run_dir, 'model')
+        if stage.restore():
+            return                # up to date
+        stage.begin()             # clears (or detaches) old outputs
+        ... compute ...
+        stage.commit()
+    """
+
+    def __init__(self, config, run_dir, stage, extra=None, store_dir=None):
+        settings = config.get('artifacts') or {}
+        self.enabled = settings.get('enabled', True)
+        self.stage = stage
+        self.spec = STAGES[stage]
+        self.run_dir = run_dir
+        self.store_dir = store_dir or settings.get('store_dir') or os.path.join(config['dataset']['output_dir'], "_store")
+        self.params = stage_params(config, stage)
+        self.extra = extra or {}
+        inputs = self.spec.get('inputs', {})
+        self.upstream = {
+            name: input_digest(run_dir, inputs[name]) if name in inputs else artifact_digest(run_dir, name)
+            for name in self.spec['upstream']
+        }
+
+        blob = json.dumps({'stage': stage, 'params': self.params, 'extra': self.extra, 'upstream': self.upstream}, sort_keys=True, default=str)
+        self.key = hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    @property
+    def entry_dir(self):
+        return os.path.join(self.store_dir, self.stage, self.key)
+
+    def _record_path(self):
+        return os.path.join(self.run_dir, RECORDS_DIR, f"{self.stage}.json")
+
+    def _write_record(self, digest, files):
+        record = {
+            'stage': self.stage,
+            'key': self.key,
+            'digest': digest,
+            'params': self.params,
+            'extra': self.extra,
+            'upstream': self.upstream,
+            'files': {rel: _stat(os.path.join(self.run_dir, rel)) for rel in files}
+        }
+        ensure_dir(os.path.dirname(self._record_path()))
+        with open(self._record_path(), 'w') as f:
+            json.dump(record, f, indent=2)
+
+    def restore(self):
+        """
+        True if the run already holds this key's outputs, or they were linked
+        in from the store. False if the stage has to run.
+
+        Outputs changed since they were recorded (e.g. by update_popularity.py
+        or step1_sweep_candidates.py --promote) are never replaced: this
+        raises RuntimeError, and the step has to be rerun with --force to
+        recompute them.
+        """
+        if not self.enabled:
+            return False
+        record = read_record(self.run_dir, self.stage)
+        if record:
+            changed = _changed_files(self.run_dir, record)
+            if changed:
+                raise RuntimeError(
+                    f"{self.stage}: outputs in {self.run_dir} were modified since they were recorded "
+                    f"({', '.join(changed[:5])}{', ...' if len(changed) > 5 else ''}); "
+                    f"rerun with --force to recompute them"
+                )
+            if record['key'] == self.key:
+                logger.info(f"{self.stage}: up to date ({self.key[:12]})")
+                return True
+
+        entry_path = os.path.join(self.entry_dir, ENTRY_FILE)
+        if not os.path.exists(entry_path):
+            return False
+        with open(entry_path, 'r') as f:
+            entry = json.load(f)
+
+        self._clear()
+        for rel in entry['files']:
+            _link_or_copy(os.path.join(self.entry_dir, rel), os.path.join(self.run_dir, rel))
+        self._write_record(entry['digest'], entry['files'])
+        logger.info(f"{self.stage}: restored {len(entry['files'])} files from {self.entry_dir}")
+        return True
+
+    def _clear(self):
+        for out in self.spec['outputs']:
+            path = os.path.join(self.run_dir, out)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.lexists(path):
+                os.remove(path)
+
+    def begin(self, keep=False):
+        """
+        Prepares the run dir for recomputing: removes old outputs, or with
+        keep=True (e.g. incremental refresh reading its previous outputs)
+        replaces store hardlinks with private copies.
+        """
+        if keep:
+            detach([os.path.join(self.run_dir, out) for out in self.spec['outputs'] if os.path.exists(os.path.join(self.run_dir, out))])
+        else:
+            self._clear()
+
+    def commit(self):
+        """Hashes the outputs, publishes them to the store and records them for this run."""
+        files = _list_files(self.run_dir, self.spec)
+        digest = _digest_files(self.run_dir, files)
+
+        if self.enabled:
+            entry_path = os.path.join(self.entry_dir, ENTRY_FILE)
+            if os.path.exists(entry_path):
+                shutil.rmtree(self.entry_dir)
+            for rel in files:
+                _link_or_copy(os.path.join(self.run_dir, rel), os.path.join(self.entry_dir, rel))
+            with open(entry_path, 'w') as f:
+                json.dump({'stage': self.stage, 'key': self.key, 'digest': digest, 'params': self.params,
+                           'extra': self.extra, 'upstream': self.upstream, 'files': files}, f, indent=2)
+
+        self._write_record(digest, files)
+        logger.info(f"{self.stage}: {len(files)} files, digest {digest[:12]}")
+        return digest
+
+def read_record(run_dir, stage):
+    path = os.path.join(run_dir, RECORDS_DIR, f"{stage}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _changed_files(run_dir, record):
+    """Files added, removed or rewritten (size/mtime) since the record was written, sorted."""
+    files = _list_files(run_dir, STAGES[record['stage']])
+    recorded = record['files']
+    changed = set(files).symmetric_difference(recorded)
+    changed.update(rel for rel in files if rel in recorded and _stat(os.path.join(run_dir, rel)) != recorded[rel])
+    return sorted(changed)
+
+def _record_intact(run_dir, record):
+    # Same file list and (size, mtime) as when recorded: nothing rewritten since
+    return not _changed_files(run_dir, record)
+
+def artifact_digest(run_dir, stage):
+    """
+    Content digest of a stage's outputs in run_dir: from its record when the
+    files are unchanged since, otherwise hashed from the files (runs made
+    before caching, or outputs edited by other scripts). None if absent.
+    """
+    record = read_record(run_dir, stage)
+    if record and _record_intact(run_dir, record):
+        return record['digest']
+    files = _list_files(run_dir, STAGES[stage])
+    return _digest_files(run_dir, files) if files else None
+
+def input_digest(run_dir, files):
+    """Content digest of the given files (relative to run_dir) that exist; None if none do."""
+    files = [rel for rel in files if os.path.isfile(os.path.join(run_dir, rel))]
+    return _digest_files(run_dir, files) if files else None
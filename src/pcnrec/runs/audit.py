@@ -0,0 +1,285 @@
+import os
+import hmac
+import json
+import hashlib
+import numpy as np
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_KEY_ENV = "PCNREC_SIGNING_KEY"
+AUDIT_DIR = "audit"
+
+# One record per appended results row: the user and the RFC 6962 leaf hash of the row
+LEAF_DTYPE = np.dtype([('user_id', '<i8'), ('leaf', 'u1', (32,))])
+
+_warned_unkeyed = False
+
+def canonical_bytes(obj):
+    """
+    Canonical UTF-8 JSON encoding (sorted keys, no whitespace). The object is
+    first round-tripped through JSON so an in-memory row and the same row read
+    back from results.jsonl encode identically.
+    """
+    normalized = json.loads(json.dumps(obj, default=str))
+    return json.dumps(normalized, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+def signing_key(config=None):
+    """HMAC key from the environment variable named by audit.key_env (None if unset)."""
+    env = ((config or {}).get('audit') or {}).get('key_env') or DEFAULT_KEY_ENV
+    value = os.environ.get(env)
+    return value.encode('utf-8') if value else None
+
+def key_id(key):
+    """Short fingerprint identifying a key in manifests without revealing it."""
+    if key is None:
+        return None
+    return hmac.new(key, b"pcnrec-key-id", hashlib.sha256).hexdigest()[:16]
+
+def _certificate_dict(certificate):
+    return certificate.model_dump() if hasattr(certificate, 'model_dump') else dict(certificate)
+
+def signing_payload(certificate, user_id, run_id, constraints):
+    """Bytes covered by a certificate signature: the certificate (minus its signature), user, run and enforced constraints."""
+    cert = _certificate_dict(certificate)
+    cert.pop('signature', None)
+    return canonical_bytes({
+        "certificate": cert,
+        "user_id": int(user_id),
+        "run_id": run_id,
+        "constraints": constraints
+    })
+
+def sign_certificate(certificate, user_id, run_id, constraints, key):
+    """
+    'hmac-sha256:<hex>' over signing_payload. Without a key the digest is
+    unkeyed ('sha256:<hex>') and only detects accidental changes.
+    """
+    global _warned_unkeyed
+    payload = signing_payload(certificate, user_id, run_id, constraints)
+    if key is None:
+        if not _warned_unkeyed:
+            logger.warning(f"{DEFAULT_KEY_ENV} is not set; certificates get unkeyed sha256 digests")
+            _warned_unkeyed = True
+        return "sha256:" + hashlib.sha256(payload).hexdigest()
+    return "hmac-sha256:" + hmac.new(key, payload, hashlib.sha256).hexdigest()
+
+def verify_signature(certificate, user_id, run_id, constraints, key):
+    """True if the certificate's signature matches (constant-time compare)."""
+    signature = _certificate_dict(certificate).get('signature') or ""
+    if signature.startswith("hmac-sha256:") and key is None:
+        return False
+    expected = sign_certificate(certificate, user_id, run_id, constraints, key if signature.startswith("hmac-sha256:") else None)
+    return hmac.compare_digest(signature, expected)
+
+def leaf_hash(row):
+    """RFC 6962 leaf hash of a results row: sha256(0x00 || canonical row)."""
+    return hashlib.sha256(b"\x00" + canonical_bytes(row)).digest()
+
+def _node(left, right):
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+def _levels(leaves):
+    """
+    Tree levels bottom-up. Pairs are hashed left to right and an odd last node
+    is carried up unchanged, which gives the RFC 6962 tree shape.
+    """
+    levels = [leaves]
+    while len(levels[-1]) > 1:
+        level = levels[-1]
+        nxt = [_node(level[i], level[i + 1]) for i in range(0, len(level) - 1, 2)]
+        if len(level) % 2:
+            nxt.append(level[-1])
+        levels.append(nxt)
+    return levels
+
+def merkle_root(leaves):
+    """Root (hex) over a list of 32-byte leaf hashes; sha256(b'') for an empty tree."""
+    if not leaves:
+        return hashlib.sha256(b"").hexdigest()
+    return _levels(list(leaves))[-1][0].hex()
+
+def inclusion_proof(leaves, index):
+    """Sibling hashes (hex, bottom-up) proving leaves[index] is in merkle_root(leaves)."""
+    proof = []
+    for level in _levels(list(leaves))[:-1]:
+        sibling = index ^ 1
+        if sibling < len(level):
+            proof.append(level[sibling].hex())
+        index //= 2
+    return proof
+
+def verify_inclusion(leaf, index, size, proof, root):
+    """
+    Checks an inclusion proof in O(log size) hashes. leaf is the 32-byte leaf
+    hash (see leaf_hash), root the hex root recorded in run_manifest.json.
+    """
+    if not 0 <= index < size:
+        return False
+    h = leaf
+    proof = [bytes.fromhex(p) for p in proof]
+    k = 0
+    while size > 1:
+        if index % 2 == 1:
+            if k >= len(proof):
+                return False
+            h = _node(proof[k], h)
+            k += 1
+        elif index + 1 < size:
+            if k >= len(proof):
+                return False
+            h = _node(h, proof[k])
+            k += 1
+        index //= 2
+        size = (size + 1) // 2
+    return k == len(proof) and hmac.compare_digest(h.hex(), root)
+
+class AuditLog:
+    """
+    Append-only Merkle log of a run's results rows, kept next to results.jsonl
+    as fixed-size (user_id, leaf hash) records in audit/<name>.leaves. Roots
+    and proofs are computed from these records, never from the JSONL.
+    """
+    def __init__(self, run_output_dir, name="all"):
+        self.dir = os.path.join(run_output_dir, AUDIT_DIR)
+        self.name = name
+        self.path = os.path.join(self.dir, f"{name}.leaves")
+        ensure_dir(self.dir)
+        self._records = self._load()
+        self._pending = []
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return np.zeros(0, dtype=LEAF_DTYPE)
+        raw = np.fromfile(self.path, dtype=np.uint8)
+        usable = len(raw) - len(raw) % LEAF_DTYPE.itemsize
+        if usable != len(raw):
+            # A torn last record from an interrupted append
+            logger.warning(f"Truncating partial record in {self.path}")
+            with open(self.path, 'r+b') as f:
+                f.truncate(usable)
+        return raw[:usable].view(LEAF_DTYPE).copy()
+
+    def __len__(self):
+        return len(self._records) + len(self._pending)
+
+    @property
+    def user_ids(self):
+        return set(self._records['user_id'].tolist()) | {u for u, _ in self._pending}
+
+    def append(self, row):
+        """Appends a results row's leaf; returns its index."""
+        leaf = leaf_hash(row)
+        rec = np.zeros(1, dtype=LEAF_DTYPE)
+        rec['user_id'] = int(row['user_id'])
+        rec['leaf'][0] = np.frombuffer(leaf, dtype=np.uint8)
+        with open(self.path, 'ab') as f:
+            f.write(rec.tobytes())
+        self._pending.append((int(row['user_id']), leaf))
+        return len(self) - 1
+
+    def sync(self, rows):
+        """Appends leaves for rows (e.g. results written before the log existed) whose user is not logged yet."""
+        logged = self.user_ids
+        added = 0
+        for row in rows:
+            if int(row['user_id']) not in logged:
+                self.append(row)
+                logged.add(int(row['user_id']))
+                added += 1
+        return added
+
+    def leaves(self):
+        return [bytes(l) for l in self._records['leaf']] + [leaf for _, leaf in self._pending]
+
+    def root(self):
+        return merkle_root(self.leaves())
+
+    def index_of(self, user_id):
+        ids = self._records['user_id'].tolist() + [u for u, _ in self._pending]
+        return ids.index(int(user_id)) if int(user_id) in ids else None
+
+    def proof(self, user_id):
+        """{'index', 'size', 'leaf', 'proof'} for a user's row, or None if not logged."""
+        index = self.index_of(user_id)
+        if index is None:
+            return None
+        leaves = self.leaves()
+        return {
+            "index": index,
+            "size": len(leaves),
+            "leaf": leaves[index].hex(),
+            "proof": inclusion_proof(leaves, index)
+        }
+
+    def summary(self):
+        """Manifest entry for this log."""
+        return {
+            "root": self.root(),
+            "size": len(self),
+            "leaves": os.path.relpath(self.path, os.path.dirname(self.dir))
+        }
+
+def _iter_rows(path):
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def check_logs(run_dir, logs):
+    """
+    Re-checks a run's Merkle logs against its results.jsonl and manifest.
+    logs: the manifest's audit.logs ({name: {'root', 'size', ...}}). Each
+    log's root is recomputed from its leaves file and compared with the
+    recorded root and size, and every leaf with the hash of that user's row
+    in results.jsonl (first row per user, as AuditLog.sync). Returns
+    {name: {'ok', 'root_ok', 'size', 'mismatched', 'missing'}}; mismatched
+    and missing list up to 10 user ids each.
+    """
+    row_leaves = {}
+    path = os.path.join(run_dir, "results.jsonl")
+    if os.path.exists(path):
+        for row in _iter_rows(path):
+            row_leaves.setdefault(int(row['user_id']), leaf_hash(row))
+
+    report = {}
+    for name, entry in logs.items():
+        log = AuditLog(run_dir, name)
+        root_ok = len(log) == entry.get('size') and hmac.compare_digest(log.root(), entry.get('root') or "")
+        mismatched, missing = [], []
+        for user_id, leaf in zip(log._records['user_id'].tolist(), log._records['leaf']):
+            expected = row_leaves.get(user_id)
+            if expected is None:
+                missing.append(user_id)
+            elif bytes(leaf) != expected:
+                mismatched.append(user_id)
+        report[name] = {
+            "ok": root_ok and not mismatched and not missing,
+            "root_ok": root_ok,
+            "size": len(log),
+            "mismatched": mismatched[:10],
+            "missing": missing[:10]
+        }
+    return report
+
+def check_signatures(run_dir, run_id, constraints, key):
+    """
+    Re-checks the certificate signature of every row in results.jsonl.
+    Returns {'valid', 'invalid', 'unsigned', 'invalid_users' (up to 10)}.
+    """
+    counts = {"valid": 0, "invalid": 0, "unsigned": 0, "invalid_users": []}
+    path = os.path.join(run_dir, "results.jsonl")
+    if not os.path.exists(path):
+        return counts
+    for row in _iter_rows(path):
+        certificate = row.get('certificate')
+        if not certificate or not certificate.get('signature'):
+            counts["unsigned"] += 1
+        elif verify_signature(certificate, row['user_id'], run_id, constraints, key):
+            counts["valid"] += 1
+        else:
+            counts["invalid"] += 1
+            if len(counts["invalid_users"]) < 10:
+                counts["invalid_users"].append(int(row['user_id']))
+    return counts
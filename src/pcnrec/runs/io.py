@@ -1,5 +1,7 @@
 import json
 import os
+import fcntl
+from contextlib import contextmanager
 from pcnrec.utils.io import ensure_dir
 
 def append_result_row(output_dir, row_dict):
@@ -39,5 +41,43 @@ def save_manifest(output_dir, manifest_dict):
     Saves run_manifest.json.
     """
     path = os.path.join(output_dir, "run_manifest.json")
-    with open(path, 'w') as f:
-        json.dump(manifest_dict, f, indent=2)
+    with _locked(path):
+        with open(path, 'w') as f:
+            json.dump(manifest_dict, f, indent=2)
+
+@contextmanager
+def _locked(path):
+    """Exclusive flock on <path>.lock, serializing writers across processes (e.g. shards)."""
+    with open(path + ".lock", 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _merge(base, updates):
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+
+def update_manifest(output_dir, updates):
+    """
+    Merges updates into run_manifest.json (nested dicts are merged, so shards
+    can each add their own entry) and replaces the file atomically. The whole
+    read-modify-write holds the manifest lock, so concurrent shards do not
+    drop each other's entries.
+    """
+    path = os.path.join(output_dir, "run_manifest.json")
+    with _locked(path):
+        manifest = {}
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                manifest = json.load(f)
+        _merge(manifest, updates)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, path)
+    return manifest
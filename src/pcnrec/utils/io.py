@@ -29,9 +29,9 @@ def save_parquet(df, path):
     ensure_dir(os.path.dirname(path))
     df.to_parquet(path, index=False)
 
-def load_parquet(path):
-    """Loads a DataFrame from a parquet file."""
-    return pd.read_parquet(path)
+def load_parquet(path, **kwargs):
+    """Loads a DataFrame from a parquet file. kwargs go to pd.read_parquet (columns, filters)."""
+    return pd.read_parquet(path, **kwargs)
 
 def save_yaml(data, path):
     """Saves data to a YAML file."""
@@ -1,10 +1,53 @@
+import numpy as np
 import pandas as pd
 from collections import Counter
+from pcnrec.data.interaction_index import InteractionIndex
 
-def get_user_profile(user_id, train_df, items_df, max_items=5, max_genres=3):
+def build_profile_index(train_df, num_items=None, min_rating=4.0):
+    """
+    CSR index of each user's liked items (rating >= min_rating, or all items for
+    users with none), with timestamps as data so recency ordering needs no frame scan.
+    Keyed by user_idx/item_idx.
+    """
+    df = train_df
+    if 'rating' in df.columns:
+        liked = df['rating'] >= min_rating
+        has_liked = liked.groupby(df['user_idx']).transform('any')
+        df = df[liked | ~has_liked]
+    data_col = 'timestamp' if 'timestamp' in df.columns else None
+    return InteractionIndex.from_frame(df, num_items=num_items, data_col=data_col)
+
+def _profile_from_index(user_id, profile_index, items_df, max_items, max_genres):
+    if user_id >= profile_index.num_users or profile_index.lengths([user_id])[0] == 0:
+        return "No history available."
+
+    if items_df.index.name != 'internal_id' and 'internal_id' in items_df.columns:
+        items_df = items_df.set_index('internal_id')
+
+    item_ids = profile_index.items(user_id)
+    if profile_index.data is not None:
+        # Most recent first
+        item_ids = item_ids[np.argsort(-profile_index.values(user_id), kind='stable')]
+    info = items_df.reindex(item_ids)
+
+    genre_counts = Counter(g for gs in info['genres'].dropna() if gs for g in gs.split('|'))
+    top_genres = [g for g, c in genre_counts.most_common(max_genres)]
+    top_movies = info['title'].dropna().head(max_items).tolist()
+
+    profile_str = f"User likes genres associated with: {', '.join(top_genres)}.\n"
+    profile_str += f"Recently liked items: {', '.join(top_movies)}."
+
+    return profile_str
+
+def get_user_profile(user_id, train_df, items_df, max_items=5, max_genres=3, profile_index=None):
     """
     Constructs a text summary of user profile from training interactions.
+    With profile_index (see build_profile_index), user_id is a user_idx and the
+    history is read from the CSR index instead of filtering train_df.
     """
+    if profile_index is not None:
+        return _profile_from_index(user_id, profile_index, items_df, max_items, max_genres)
+
     history = train_df[train_df['user_id'] == user_id]
     if history.empty:
         return "No history available."
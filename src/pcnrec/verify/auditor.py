@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import numpy as np
+import pyarrow as pa
+import pyarrow.json as pajson
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from pcnrec.verify.batch import verify_batch, window_membership
+from pcnrec.verify.constraints import PAD, REASON_NAMES
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+AUDIT_DIR = "audit"
+VERDICTS_FILE = "verdicts.parquet"
+SUMMARY_FILE = "summary.json"
+
+# Only the fields the audit needs; everything else in a row is skipped by the reader
+RESULT_SCHEMA = pa.schema([
+    ('user_id', pa.int64()),
+    ('selected_item_ids', pa.list_(pa.int64())),
+    ('candidates_shown', pa.list_(pa.struct([('item_idx', pa.int64())]))),
+    ('verifier', pa.struct([('pass', pa.bool_())])),
+    ('verifier_result', pa.struct([('pass', pa.bool_())]))
+])
+
+VERDICT_SCHEMA = pa.schema([
+    ('user_id', pa.int64()),
+    ('pass', pa.bool_()),
+    ('reasons', pa.int16()),
+    ('head_count', pa.int16()),
+    ('tail_count', pa.int16()),
+    ('unique_genres', pa.int16()),
+    ('window_source', pa.int8())
+])
+
+# window_source codes
+WINDOW_NONE, WINDOW_ROW, WINDOW_CANDIDATES = 0, 1, 2
+
+def results_path(run_dir):
+    """results.jsonl, or results.parquet if that is what the run wrote."""
+    for name in ("results.jsonl", "results.parquet"):
+        path = os.path.join(run_dir, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+def _line_blocks(path, block_bytes):
+    """Yields byte blocks of about block_bytes that end on a line boundary."""
+    with open(path, 'rb') as f:
+        rest = b""
+        while True:
+            data = f.read(block_bytes)
+            if not data:
+                if rest.strip():
+                    yield rest
+                return
+            data = rest + data
+            cut = data.rfind(b"\n") + 1
+            if cut == 0:
+                rest = data
+                continue
+            rest = data[cut:]
+            yield data[:cut]
+
+def iter_result_batches(path, block_mb=16):
+    """
+    Streams a results file as tables of RESULT_SCHEMA fields. JSONL is read
+    in block_mb blocks, each parsed by pyarrow's multi-threaded JSON reader
+    (other fields are skipped); parquet by row group.
+    """
+    if path.endswith('.parquet'):
+        pf = pq.ParquetFile(path)
+        columns = [f.name for f in RESULT_SCHEMA if f.name in pf.schema_arrow.names]
+        for batch in pf.iter_batches(columns=columns):
+            yield batch
+        return
+    read_options = pajson.ReadOptions(block_size=1 << 20, use_threads=True)
+    parse_options = pajson.ParseOptions(explicit_schema=RESULT_SCHEMA, unexpected_field_behavior='ignore')
+    for block in _line_blocks(path, int(block_mb * (1 << 20))):
+        yield pajson.read_json(pa.BufferReader(block), read_options=read_options, parse_options=parse_options)
+
+def pad_lists(values, lengths, width=None):
+    """Flattened list values + per-row lengths -> (n, width) int64 array padded with -1."""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    width = int(lengths.max(initial=0)) if width is None else width
+    out = np.full((len(lengths), width), PAD, dtype=np.int64)
+    keep = np.minimum(lengths, width)
+    starts = np.cumsum(lengths) - lengths
+    rows = np.repeat(np.arange(len(lengths)), keep)
+    cols = np.arange(keep.sum()) - np.repeat(np.cumsum(keep) - keep, keep)
+    out[rows, cols] = np.asarray(values, dtype=np.int64)[np.repeat(starts, keep) + cols]
+    return out
+
+def _list_column(batch, name):
+    """(flattened values, lengths) of a list column; null lists have length 0."""
+    if name not in batch.schema.names:
+        return None, np.zeros(batch.num_rows, dtype=np.int64)
+    column = batch.column(name)
+    lengths = pc.fill_null(pc.list_value_length(column), 0).to_numpy(zero_copy_only=False)
+    return pc.list_flatten(column), lengths.astype(np.int64)
+
+class CandidateWindows:
+    """
+    First `window` candidates (by rank) per user from candidates_topk.parquet,
+    read per user range so memory follows the chunk, not the file.
+    """
+    def __init__(self, path, window):
+        self.path = path
+        self.window = window
+
+    def lookup(self, user_ids):
+        """(n, window) -1-padded candidate ids for user_ids (all -1 for unknown users)."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if len(user_ids) == 0:
+            return np.full((0, self.window), PAD, dtype=np.int64)
+        lo, hi = int(user_ids.min()), int(user_ids.max()) + 1
+        table = pq.read_table(
+            self.path, columns=['user_idx', 'item_idx', 'rank'],
+            filters=[('user_idx', '>=', lo), ('user_idx', '<', hi), ('rank', '<=', self.window)]
+        )
+        users = table.column('user_idx').to_numpy().astype(np.int64)
+        items = table.column('item_idx').to_numpy().astype(np.int64)
+        ranks = table.column('rank').to_numpy().astype(np.int64)
+        if len(users) > 1 and (users[1:] < users[:-1]).any():
+            order = np.argsort(users, kind='stable')
+            users, items, ranks = users[order], items[order], ranks[order]
+        # Candidates are stored grouped by user: runs of equal user_idx
+        starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]]) if len(users) else np.zeros(0, dtype=np.int64)
+        known = users[starts]
+        row = np.repeat(np.arange(len(known)), np.diff(np.r_[starts, len(users)]))
+        grid = np.full((len(known) + 1, self.window), PAD, dtype=np.int64)
+        grid[row, ranks - 1] = items
+        pos = np.searchsorted(known, user_ids)
+        found = (pos < len(known)) & (known[np.minimum(pos, max(len(known) - 1, 0))] == user_ids) if len(known) else np.zeros(len(user_ids), dtype=bool)
+        return grid[np.where(found, pos, len(known))]
+
+def audit_batch(batch, catalog, constraints, windows=None):
+    """
+    Re-verifies one record batch. Windows come from the row's candidates_shown
+    when stored, else from windows (CandidateWindows), else are not checked.
+    Returns (verdict table, has_stored, stored): the rows' own verifier pass
+    flags, where present.
+    """
+    user_ids = batch.column('user_id').to_numpy(zero_copy_only=False).astype(np.int64)
+    sel_values, sel_lengths = _list_column(batch, 'selected_item_ids')
+    selections = pad_lists(sel_values.to_numpy(zero_copy_only=False) if sel_values is not None else [], sel_lengths)
+    if selections.shape[1] == 0:
+        selections = np.full((len(user_ids), 1), PAD, dtype=np.int64)
+
+    shown_values, shown_lengths = _list_column(batch, 'candidates_shown')
+    has_row_window = shown_lengths > 0
+    source = np.full(len(user_ids), WINDOW_NONE, dtype=np.int8)
+    shown = None
+    if has_row_window.any():
+        ids = pc.struct_field(shown_values, [0]).to_numpy(zero_copy_only=False)
+        shown = pad_lists(ids, shown_lengths)
+        source[has_row_window] = WINDOW_ROW
+    if windows is not None and (~has_row_window).any():
+        missing = np.flatnonzero(~has_row_window)
+        from_file = windows.lookup(user_ids[missing])
+        width = max(shown.shape[1] if shown is not None else 0, from_file.shape[1])
+        merged = np.full((len(user_ids), width), PAD, dtype=np.int64)
+        if shown is not None:
+            merged[:, :shown.shape[1]] = shown
+        merged[missing, :from_file.shape[1]] = from_file
+        shown = merged
+        source[missing] = WINDOW_CANDIDATES
+
+    in_window = None
+    if shown is not None:
+        # Rows with no window at all are not checked against one
+        checked = source != WINDOW_NONE
+        if checked.all():
+            in_window = window_membership(selections, shown)
+        else:
+            in_window = selections != PAD
+            in_window[checked] = window_membership(selections[checked], shown[checked])
+
+    result = verify_batch(selections, catalog, constraints, in_window=in_window)
+    verdicts = pa.table({
+        'user_id': user_ids,
+        'pass': result['pass'],
+        'reasons': result['reasons'].astype(np.int16),
+        'head_count': result['head_count'].astype(np.int16),
+        'tail_count': result['tail_count'].astype(np.int16),
+        'unique_genres': result['unique_genres'].astype(np.int16),
+        'window_source': source
+    }, schema=VERDICT_SCHEMA)
+
+    has_stored = np.zeros(len(user_ids), dtype=bool)
+    stored = np.zeros(len(user_ids), dtype=bool)
+    for name in ('verifier_result', 'verifier'):
+        if name in batch.schema.names:
+            flags = pc.struct_field(batch.column(name), [0])
+            valid = flags.is_valid().to_numpy(zero_copy_only=False)
+            values = pc.fill_null(flags, False).to_numpy(zero_copy_only=False)
+            stored = np.where(valid, values, stored)
+            has_stored |= valid
+    return verdicts, has_stored, stored
+
+def audit_run(run_dir, catalog, constraints, candidates_path=None, window=None, block_mb=16, output_dir=None, user_range=None):
+    """
+    Streams run_dir's results, re-verifies every selection with verify_batch
+    and writes audit/verdicts.parquet (per-user pass flag and REASON_* bit
+    flags) plus audit/summary.json (pass rate, per-reason counts, agreement
+    with the verifier result stored in the rows). Memory is bounded by one
+    block of results. Returns the summary dict.
+
+    output_dir replaces run_dir/audit; user_range=(lo, hi) audits only users
+    lo <= user_id < hi (e.g. one evaluation shard, writing to its own output_dir).
+    """
+    path = results_path(run_dir)
+    if path is None:
+        raise FileNotFoundError(f"No results.jsonl or results.parquet in {run_dir}")
+    out_dir = output_dir or os.path.join(run_dir, AUDIT_DIR)
+    ensure_dir(out_dir)
+    windows = CandidateWindows(candidates_path, window) if candidates_path and window else None
+
+    rows = passed = stored_rows = stored_passed = disagreements = 0
+    reason_counts = {name: 0 for name in REASON_NAMES.values()}
+    source_counts = np.zeros(3, dtype=np.int64)
+    start = time.time()
+    verdict_path = os.path.join(out_dir, VERDICTS_FILE)
+    tmp_path = f"{verdict_path}.{os.getpid()}.tmp"
+    with pq.ParquetWriter(tmp_path, VERDICT_SCHEMA) as writer:
+        for batch in iter_result_batches(path, block_mb=block_mb):
+            if user_range is not None:
+                ids = batch.column('user_id')
+                batch = batch.filter(pc.and_(pc.greater_equal(ids, user_range[0]), pc.less(ids, user_range[1])))
+            if batch.num_rows == 0:
+                continue
+            verdicts, has_stored, stored = audit_batch(batch, catalog, constraints, windows)
+            writer.write_table(verdicts)
+            ok = verdicts.column('pass').to_numpy(zero_copy_only=False)
+            reasons = verdicts.column('reasons').to_numpy().astype(np.int64)
+            rows += len(ok)
+            passed += int(ok.sum())
+            for bit, name in REASON_NAMES.items():
+                reason_counts[name] += int(((reasons & bit) != 0).sum())
+            source_counts += np.bincount(verdicts.column('window_source').to_numpy(), minlength=3)
+            stored_rows += int(has_stored.sum())
+            stored_passed += int((stored & has_stored).sum())
+            disagreements += int(((stored != ok) & has_stored).sum())
+    os.replace(tmp_path, verdict_path)
+    elapsed = time.time() - start
+
+    summary = {
+        "results": os.path.relpath(path, run_dir),
+        "rows": rows,
+        "pass_rate": passed / rows if rows else 0.0,
+        "reason_counts": reason_counts,
+        "window_source": {
+            "none": int(source_counts[WINDOW_NONE]),
+            "row": int(source_counts[WINDOW_ROW]),
+            "candidates": int(source_counts[WINDOW_CANDIDATES])
+        },
+        "window": window,
+        "user_range": [int(u) for u in user_range] if user_range is not None else None,
+        "constraints": constraints,
+        "stored_verifier_rows": stored_rows,
+        "stored_pass_rate": stored_passed / stored_rows if stored_rows else None,
+        "stored_disagreements": disagreements,
+        "elapsed_s": elapsed,
+        "rows_per_s": rows / elapsed if elapsed > 0 else None
+    }
+    summary_path = os.path.join(out_dir, SUMMARY_FILE)
+    tmp_path = f"{summary_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, summary_path)
+    return summary
+
+def run_constraints(run_dir, config):
+    """Constraints the run was produced under (its run_manifest.json config), else config['constraints']."""
+    manifest_path = os.path.join(run_dir, "run_manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        constraints = (manifest.get('config') or {}).get('constraints')
+        if constraints is not None:
+            return constraints
+    return config['constraints']
+
+def verdicts_current(run_dir, output_dir=None):
+    """True if audit/verdicts.parquet (or output_dir's) exists and is newer than the run's results."""
+    path = results_path(run_dir)
+    verdict_path = os.path.join(output_dir or os.path.join(run_dir, AUDIT_DIR), VERDICTS_FILE)
+    return path is not None and os.path.exists(verdict_path) and os.path.getmtime(verdict_path) >= os.path.getmtime(path)
+
+def load_verdicts(run_dir, columns=None, output_dir=None):
+    """audit/verdicts.parquet (or output_dir's) as a DataFrame (None if the run was not audited)."""
+    verdict_path = os.path.join(output_dir or os.path.join(run_dir, AUDIT_DIR), VERDICTS_FILE)
+    if not os.path.exists(verdict_path):
+        return None
+    return pq.read_table(verdict_path, columns=columns).to_pandas()
@@ -0,0 +1,139 @@
+import json
+import numpy as np
+from pcnrec.data.catalog import as_catalog
+from pcnrec.verify.constraints import compile_constraints, PAD, REASON_NOT_IN_WINDOW
+
+def pack_selections(lists, width=None):
+    """List of item-id lists -> (n, width) int64 array, padded with -1."""
+    width = width if width is not None else max((len(x) for x in lists), default=0)
+    out = np.full((len(lists), width), PAD, dtype=np.int64)
+    lengths = np.fromiter((min(len(x), width) for x in lists), dtype=np.int64, count=len(lists))
+    rows = np.repeat(np.arange(len(lists)), lengths)
+    cols = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    if len(rows):
+        out[rows, cols] = np.concatenate([np.asarray(x[:width], dtype=np.int64) for x in lists if len(x)])
+    return out
+
+def window_membership(selections, shown, block_rows=4096):
+    """
+    (n, top_n) bool: selections[u, j] is among shown[u] (an (n, W) -1-padded
+    array of the candidate ids shown to user u). Compares each selected id
+    with its row's window in blocks of block_rows users (int32 when ids fit),
+    so memory stays at block_rows * top_n * W bytes.
+    """
+    selections = np.asarray(selections, dtype=np.int64)
+    shown = np.asarray(shown, dtype=np.int64)
+    found = np.zeros(selections.shape, dtype=bool)
+    if selections.size == 0 or shown.size == 0:
+        return found
+    if max(selections.max(initial=0), shown.max(initial=0)) < np.iinfo(np.int32).max:
+        selections, shown = selections.astype(np.int32), shown.astype(np.int32)
+    for start in range(0, len(selections), block_rows):
+        block = slice(start, start + block_rows)
+        found[block] = (selections[block, :, None] == shown[block, None, :]).any(axis=2)
+    return found & (selections != PAD)
+
+def verify_batch(selections, catalog, constraints, shown=None, in_window=None, genre_targets=None):
+    """
+    Verifies many selections at once; per-user results match verify_certificate.
+
+    selections:  (n_users, top_n) int array of item ids, rows padded with -1
+                 (see pack_selections)
+    catalog:     ItemCatalog (or items frame)
+    constraints: one constraints dict (config['constraints'] layout) for every
+                 user, or a sequence of per-user dicts (certificate constraints);
+                 each distinct dict is compiled once (compile_constraints)
+    shown:       (n_users, W) -1-padded candidate window per user, or
+    in_window:   (n_users, top_n) bool membership, if already known
+                 (neither: window membership is not checked)
+    genre_targets: optional (n_users, num_genres) targets for genre_calibration
+
+    Returns a dict of per-user arrays: 'pass' (bool), 'reasons' (int bit
+    flags, REASON_*), 'head_count', 'tail_count', 'unique_genres' and
+    'in_window' (the membership used), plus the plans and per-constraint
+    values reason_messages needs. Like verify_certificate, a selection
+    outside the window fails with only REASON_NOT_IN_WINDOW.
+    """
+    catalog = as_catalog(catalog)
+    selections = np.asarray(selections, dtype=np.int64)
+    if selections.ndim != 2:
+        raise ValueError(f"selections must be 2-D (users x top_n), got shape {selections.shape}")
+    n = len(selections)
+    valid = selections != PAD
+
+    if in_window is None:
+        in_window = window_membership(selections, shown) if shown is not None else valid
+    in_window = np.asarray(in_window, dtype=bool)
+
+    # Rows sharing a constraints dict share one plan
+    if isinstance(constraints, dict):
+        groups = [(constraints, np.arange(n))]
+    else:
+        ids = {}
+        key_ids = np.array([ids.setdefault(json.dumps(c, sort_keys=True, default=str), len(ids)) for c in constraints], dtype=np.int64)
+        order = np.argsort(key_ids, kind='stable')
+        bounds = np.searchsorted(key_ids[order], np.arange(len(ids) + 1))
+        groups = [(constraints[order[bounds[g]]], order[bounds[g]:bounds[g + 1]]) for g in range(len(ids))]
+
+    reasons = np.zeros(n, dtype=np.int64)
+    head = np.zeros(n, dtype=np.int64)
+    tail = np.zeros(n, dtype=np.int64)
+    genres = np.zeros(n, dtype=np.int64)
+    plan_index = np.zeros(n, dtype=np.int64)
+    group_pos = np.zeros(n, dtype=np.int64)
+    plans, evaluations = [], []
+    for g, (group_constraints, rows) in enumerate(groups):
+        plan = compile_constraints(group_constraints, catalog)
+        targets = genre_targets[rows] if genre_targets is not None else None
+        r = plan.evaluate(selections[rows], in_window=in_window[rows], genre_targets=targets)
+        stats = r['stats']
+        reasons[rows] = r['reasons']
+        head[rows] = stats.bin_count(catalog.bin_code('head'))
+        tail[rows] = stats.bin_count(catalog.bin_code('tail'))
+        genres[rows] = stats.unique_genres
+        plan_index[rows] = g
+        group_pos[rows] = np.arange(len(rows))
+        plans.append(plan)
+        evaluations.append({'values': r['values'], 'violated': r['violated']})
+
+    return {
+        'pass': reasons == 0,
+        'reasons': reasons,
+        'head_count': head,
+        'tail_count': tail,
+        'unique_genres': genres,
+        'in_window': in_window,
+        'plans': plans,
+        'plan_index': plan_index,
+        'group_pos': group_pos,
+        'evaluations': evaluations
+    }
+
+def reason_messages(result, i, selections):
+    """verify_certificate's reason strings for row i of a verify_batch result."""
+    code = int(result['reasons'][i])
+    row = np.asarray(selections[i])
+    items = row[row != PAD].tolist()
+    if code & REASON_NOT_IN_WINDOW:
+        shown = set(row[np.asarray(result['in_window'][i], dtype=bool)].tolist())
+        return [f"Selection contains items not in candidate window: {set(items) - shown}"]
+
+    g = int(result['plan_index'][i])
+    return result['plans'][g].messages(result['evaluations'][g], int(result['group_pos'][i]))
+
+def batch_results(result, selections):
+    """verify_batch output as a list of verify_certificate-style dicts."""
+    out = []
+    for i in range(len(result['pass'])):
+        code = int(result['reasons'][i])
+        recomputed = {} if code & REASON_NOT_IN_WINDOW else {
+            "head_count": int(result['head_count'][i]),
+            "tail_count": int(result['tail_count'][i]),
+            "unique_genres": int(result['unique_genres'][i])
+        }
+        out.append({
+            "pass": bool(result['pass'][i]),
+            "reasons": reason_messages(result, i, selections),
+            "recomputed": recomputed
+        })
+    return out
@@ -0,0 +1,214 @@
+import os
+import json
+import atexit
+import sqlite3
+import hashlib
+from collections import OrderedDict
+from pcnrec.data.catalog import as_catalog
+from pcnrec.verify.constraints import compile_constraints
+from pcnrec.verify.batch import verify_batch, pack_selections, batch_results
+from pcnrec.utils.io import ensure_dir
+from pcnrec.utils.logging import setup_logger
+
+logger = setup_logger(__name__)
+
+DEFAULT_MAXSIZE = 100000
+COMMIT_EVERY = 512
+# Part of every key: bump when the stored result format or the verifier's
+# semantics change, so old SQLite entries stop matching
+CACHE_FORMAT = 1
+
+class VerificationCache:
+    """
+    Memo of constraint verification results, keyed by (CACHE_FORMAT, sorted
+    selection, compiled-constraint digest, catalog version). An in-memory LRU of
+    maxsize entries sits in front of an optional SQLite file shared by every
+    script and process using the same path; the file keeps at most
+    max_disk_entries results, dropping the least recently used first (a row
+    is refreshed when written or read from disk; hits served by the
+    in-memory LRU do not touch the file).
+
+    Window membership is not part of the key: callers check it before the
+    lookup (the result depends on the window only through that check), so
+    the same selection hits across users and runs.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, path=None, max_disk_entries=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()
+        self._db = None
+        self._unsaved = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            ensure_dir(os.path.dirname(os.path.abspath(path)))
+            self._db = sqlite3.connect(path, timeout=30)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._db.commit()
+            atexit.register(self.flush)
+
+    @staticmethod
+    def key(selected_ids, plan_key, catalog_version):
+        ids = ",".join(str(int(i)) for i in sorted(selected_ids))
+        return hashlib.sha256(f"{CACHE_FORMAT}|{catalog_version}|{plan_key}|{ids}".encode('ascii')).hexdigest()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        """Cached result dict, or None."""
+        value = self._memory.get(key)
+        if value is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return json.loads(value)
+        if self._db is not None:
+            row = self._db.execute("SELECT value FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._remember(key, row[0])
+                self._store(key, row[0])
+                self.hits += 1
+                self.disk_hits += 1
+                return json.loads(row[0])
+        self.misses += 1
+        return None
+
+    def _store(self, key, value):
+        # Re-inserting gives the row a new, highest rowid: rowid order is recency order
+        self._db.execute("INSERT OR REPLACE INTO results (key, value) VALUES (?, ?)", (key, value))
+        self._unsaved += 1
+        if self._unsaved >= COMMIT_EVERY:
+            self.flush()
+
+    def put(self, key, result):
+        value = json.dumps(result)
+        self._remember(key, value)
+        if self._db is not None:
+            self._store(key, value)
+
+    def flush(self):
+        """
+        Commits pending disk writes and trims the file to the
+        max_disk_entries most recent rows. The rowid span (two index lookups)
+        bounds the row count, so the trim only walks the table once the span
+        exceeds the limit; rowids have gaps after re-inserts, so the cutoff
+        is found by counting rows, not by rowid arithmetic.
+        """
+        if self._db is None:
+            return
+        if self.max_disk_entries:
+            lo, hi = self._db.execute("SELECT min(rowid), max(rowid) FROM results").fetchone()
+            if hi is not None and hi - lo + 1 > self.max_disk_entries:
+                self._db.execute(
+                    "DELETE FROM results WHERE rowid < "
+                    "(SELECT rowid FROM results ORDER BY rowid DESC LIMIT 1 OFFSET ?)",
+                    (int(self.max_disk_entries) - 1,)
+                )
+        self._db.commit()
+        self._unsaved = 0
+
+    def stats(self):
+        """Hit/miss counters and hit rate since creation."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory)
+        }
+
+    def clear(self):
+        self._memory.clear()
+        if self._db is not None:
+            self._db.execute("DELETE FROM results")
+            self._db.commit()
+
+_cache = VerificationCache()
+
+def get_cache():
+    """The process-wide cache shared by the verifier, evaluation and audit code."""
+    return _cache
+
+def configure_cache(config):
+    """
+    Replaces the process-wide cache according to config['verify_cache']
+    (maxsize, path, max_disk_entries; enabled: false keeps an empty LRU of
+    size 0). The default path is <dataset.output_dir>/_verify_cache.sqlite.
+    """
+    global _cache
+    opts = config.get('verify_cache') or {}
+    _cache.flush()
+    if not opts.get('enabled', True):
+        _cache = VerificationCache(maxsize=0)
+        return _cache
+    path = opts.get('path')
+    if path is None:
+        path = os.path.join(config['dataset']['output_dir'], "_verify_cache.sqlite")
+    _cache = VerificationCache(
+        maxsize=opts.get('maxsize', DEFAULT_MAXSIZE),
+        path=path or None,
+        max_disk_entries=opts.get('max_disk_entries')
+    )
+    return _cache
+
+def window_failure(selected_ids, window_ids):
+    """verify_certificate's result for a selection with items outside window_ids, else None."""
+    if window_ids is None:
+        return None
+    outside = set(selected_ids) - set(window_ids)
+    if not outside:
+        return None
+    return {
+        "pass": False,
+        "reasons": [f"Selection contains items not in candidate window: {outside}"],
+        "recomputed": {}
+    }
+
+def verify_selections(selections, catalog, constraints, windows=None, cache=None):
+    """
+    verify_certificate-style results for many selections under one
+    constraints dict. Rows outside their window fail without a lookup;
+    cached rows are returned as is and the rest go through one verify_batch
+    call and are stored.
+
+    selections: list of item-id lists
+    windows:    optional list of the candidate ids shown per row (None entries skip the check)
+    """
+    catalog = as_catalog(catalog)
+    cache = cache if cache is not None else get_cache()
+    plan = compile_constraints(constraints, catalog)
+    version = catalog.version()
+
+    results = [None] * len(selections)
+    pending = {}
+    for i, selected in enumerate(selections):
+        window = windows[i] if windows is not None else None
+        results[i] = window_failure(selected, window)
+        if results[i] is not None:
+            continue
+        key = VerificationCache.key(selected, plan.key, version)
+        if key in pending:
+            pending[key].append(i)
+            continue
+        results[i] = cache.get(key)
+        if results[i] is None:
+            pending[key] = [i]
+
+    if pending:
+        # One batch over the distinct missing selections
+        packed = pack_selections([selections[rows[0]] for rows in pending.values()])
+        fresh = batch_results(verify_batch(packed, catalog, constraints), packed)
+        for (key, rows), result in zip(pending.items(), fresh):
+            cache.put(key, result)
+            for i in rows:
+                results[i] = json.loads(json.dumps(result)) if i != rows[0] else result
+    return results
@@ -1,4 +1,36 @@
+import json
+import hashlib
+import weakref
+from functools import cached_property
 from typing import List
+import numpy as np
+from pcnrec.data.catalog import as_catalog, popcount
+
+# Reason codes (bit flags, 0 = pass), in the order verify_certificate reports them
+REASON_NOT_IN_WINDOW = 1
+REASON_DUPLICATES = 2
+REASON_TOO_MANY_HEAD = 4        # popularity.max_head_in_topn
+REASON_TOO_FEW_TAIL = 8         # popularity.min_tail_in_topn
+REASON_LOW_DIVERSITY = 16
+REASON_GENRE_CONCENTRATION = 32
+REASON_MISCALIBRATED = 64
+REASON_BIN_MAX = 128            # bin_max rules
+REASON_BIN_MIN = 256            # bin_min rules
+
+REASON_NAMES = {
+    REASON_NOT_IN_WINDOW: 'not_in_window',
+    REASON_DUPLICATES: 'duplicates',
+    REASON_TOO_MANY_HEAD: 'too_many_head',
+    REASON_TOO_FEW_TAIL: 'too_few_tail',
+    REASON_LOW_DIVERSITY: 'low_diversity',
+    REASON_GENRE_CONCENTRATION: 'genre_concentration',
+    REASON_MISCALIBRATED: 'miscalibrated',
+    REASON_BIN_MAX: 'bin_max',
+    REASON_BIN_MIN: 'bin_min'
+}
+
+# Padding in (users x top_n) selection arrays
+PAD = -1
 
 def check_no_duplicates(selected_ids: List[int]) -> bool:
     return len(selected_ids) == len(set(selected_ids))
@@ -11,3 +43,468 @@ def check_min_tail(tail_count: int, limit: int) -> bool:
 
 def check_min_unique_genres(unique_count: int, limit: int) -> bool:
     return unique_count >= limit
+
+# --- Registry ---
+
+CONSTRAINT_TYPES = {}
+
+def register_constraint(cls):
+    """Class decorator: makes cls available as {type: cls.type, ...} in constraints.rules."""
+    CONSTRAINT_TYPES[cls.type] = cls
+    return cls
+
+class Constraint:
+    """
+    One constraint on a top-N selection.
+
+    A constraint reads one quantity of the selection (quantity(), e.g.
+    ('bin', code) or 'unique_genres'), which SelectionStats computes for a
+    whole batch and verify.incremental.SelectionState maintains under swaps,
+    and compares it with its limit. violated/shortfall work elementwise on
+    scalars or arrays.
+
+    kind tells the greedy solver how to treat it: 'max' constraints block
+    items (blocks), 'min' constraints reserve slots (need/contributes).
+    """
+    type = None
+    reason = 0
+    kind = None
+
+    def bind(self, catalog):
+        """Resolves names (bins, genres) against the catalog; returns self."""
+        return self
+
+    def quantity(self):
+        raise NotImplementedError
+
+    def violated(self, value):
+        raise NotImplementedError
+
+    def shortfall(self, value):
+        """How far value is from satisfying the constraint (0 when satisfied)."""
+        raise NotImplementedError
+
+    def message(self, value):
+        raise NotImplementedError
+
+    def window_fail(self, window, top_n):
+        """Reason name if no top_n subset of the window (SelectionStats of one row) can satisfy this, else None."""
+        return None
+
+    # Greedy hooks (state: GreedyState)
+    def blocks(self, state, item, code, mask):
+        return False
+
+    def need(self, state):
+        return 0
+
+    def contributes(self, state, item, code, mask):
+        return False
+
+@register_constraint
+class NoDuplicates(Constraint):
+    type = 'no_duplicates'
+    reason = REASON_DUPLICATES
+    kind = 'max'
+
+    def quantity(self):
+        return 'duplicates'
+
+    def violated(self, value):
+        return value > 0
+
+    def shortfall(self, value):
+        return value
+
+    def message(self, value):
+        return "Duplicate items found."
+
+    def blocks(self, state, item, code, mask):
+        return item in state.items
+
+class _BinConstraint(Constraint):
+    def __init__(self, bin, limit, reason=None):
+        self.bin = bin
+        self.limit = limit
+        self.code = -1
+        if reason is not None:
+            # The built-in head/tail limits keep their own reason bits
+            self.reason = reason
+
+    def bind(self, catalog):
+        self.code = catalog.bin_code(self.bin)
+        return self
+
+    def quantity(self):
+        return ('bin', self.code)
+
+@register_constraint
+class BinMax(_BinConstraint):
+    """At most limit items from popularity bin (popularity.max_head_in_topn = head)."""
+    type = 'bin_max'
+    reason = REASON_BIN_MAX
+    kind = 'max'
+
+    def violated(self, value):
+        return value > self.limit
+
+    def shortfall(self, value):
+        return np.maximum(value - self.limit, 0)
+
+    def message(self, value):
+        return f"Too many {self.bin} items: {int(value)} > {self.limit}"
+
+    def window_fail(self, window, top_n):
+        # Items that must come from the bin once every other binned item is used
+        others = int(((window.codes >= 0) & (window.codes != self.code)).sum())
+        if max(0, top_n - others) > self.limit:
+            return f"{self.bin}_forced_violation"
+        return None
+
+    def blocks(self, state, item, code, mask):
+        return code == self.code and code >= 0 and state.bin_counts.get(code, 0) >= self.limit
+
+@register_constraint
+class BinMin(_BinConstraint):
+    """At least limit items from popularity bin (popularity.min_tail_in_topn = tail)."""
+    type = 'bin_min'
+    reason = REASON_BIN_MIN
+    kind = 'min'
+
+    def violated(self, value):
+        return value < self.limit
+
+    def shortfall(self, value):
+        return np.maximum(self.limit - value, 0)
+
+    def message(self, value):
+        return f"Too few {self.bin} items: {int(value)} < {self.limit}"
+
+    def window_fail(self, window, top_n):
+        if int(window.measure(self.quantity())[0]) < self.limit:
+            return f"{self.bin}_shortage"
+        return None
+
+    def need(self, state):
+        return max(0, self.limit - state.bin_counts.get(self.code, 0))
+
+    def contributes(self, state, item, code, mask):
+        return code == self.code and code >= 0
+
+@register_constraint
+class MinUniqueGenres(Constraint):
+    """At least limit distinct genres (diversity.min_unique_genres_in_topn)."""
+    type = 'min_unique_genres'
+    reason = REASON_LOW_DIVERSITY
+    kind = 'min'
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def quantity(self):
+        return 'unique_genres'
+
+    def violated(self, value):
+        return value < self.limit
+
+    def shortfall(self, value):
+        return np.maximum(self.limit - value, 0)
+
+    def message(self, value):
+        return f"Low diversity: {int(value)} < {self.limit} unique genres"
+
+    def window_fail(self, window, top_n):
+        if int(window.measure('unique_genres')[0]) < self.limit:
+            return 'genre_shortage_window'
+        return None
+
+    def need(self, state):
+        return max(0, self.limit - bin(state.covered).count('1'))
+
+    def contributes(self, state, item, code, mask):
+        return bool(mask & ~state.covered)
+
+@register_constraint
+class MaxPerGenre(Constraint):
+    """At most limit items sharing any one genre."""
+    type = 'max_per_genre'
+    reason = REASON_GENRE_CONCENTRATION
+    kind = 'max'
+
+    def __init__(self, limit):
+        self.limit = limit
+
+    def quantity(self):
+        return 'max_genre_count'
+
+    def violated(self, value):
+        return value > self.limit
+
+    def shortfall(self, value):
+        return np.maximum(value - self.limit, 0)
+
+    def message(self, value):
+        return f"Genre concentration: {int(value)} items share a genre > {self.limit}"
+
+    def window_fail(self, window, top_n):
+        # Each genre admits at most limit items; genre-less items are free
+        free = int((window.masks[0] == 0).sum())
+        if free + self.limit * int(window.measure('unique_genres')[0]) < top_n:
+            return 'genre_cap_shortage'
+        return None
+
+    def blocks(self, state, item, code, mask):
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            if state.genre_counts.get(bit, 0) >= self.limit:
+                return True
+        return False
+
+@register_constraint
+class GenreCalibration(Constraint):
+    """
+    Genre distribution of the selection within max_distance (total variation)
+    of a target: the catalog's genre shares, or per-user targets passed to
+    ConstraintPlan.evaluate(genre_targets=...).
+    """
+    type = 'genre_calibration'
+    reason = REASON_MISCALIBRATED
+
+    def __init__(self, max_distance, target='catalog'):
+        if target != 'catalog':
+            raise ValueError(f"genre_calibration target must be 'catalog' (per-user targets go to evaluate), got {target}")
+        self.max_distance = max_distance
+        self.target = None
+
+    def bind(self, catalog):
+        bits = (catalog.genre_masks[:, None].astype(np.uint64) >> np.arange(len(catalog.genre_names), dtype=np.uint64)) & np.uint64(1)
+        totals = bits.sum(axis=0).astype(np.float64)
+        self.target = totals / totals.sum() if totals.sum() else totals
+        return self
+
+    def quantity(self):
+        return 'genre_distance'
+
+    def violated(self, value):
+        return value > self.max_distance
+
+    def shortfall(self, value):
+        return np.maximum(value - self.max_distance, 0)
+
+    def message(self, value):
+        return f"Genre distribution off target: distance {float(value):.3f} > {self.max_distance}"
+
+def parse_constraints(constraints):
+    """
+    Constraint objects (unbound) from a constraints dict, in report order:
+    safety.no_duplicates (checked unless set falsy), popularity.max_head_in_topn,
+    popularity.min_tail_in_topn, diversity.min_unique_genres_in_topn, then
+    each entry of rules ({type: <registered type>, **params}).
+    Unset limits add no constraint.
+    """
+    constraints = constraints or {}
+    pop = constraints.get('popularity') or {}
+    div = constraints.get('diversity') or {}
+    parsed = []
+    if (constraints.get('safety') or {}).get('no_duplicates', True):
+        parsed.append(NoDuplicates())
+    if pop.get('max_head_in_topn') is not None:
+        parsed.append(BinMax('head', pop['max_head_in_topn'], reason=REASON_TOO_MANY_HEAD))
+    if pop.get('min_tail_in_topn') is not None:
+        parsed.append(BinMin('tail', pop['min_tail_in_topn'], reason=REASON_TOO_FEW_TAIL))
+    if div.get('min_unique_genres_in_topn') is not None:
+        parsed.append(MinUniqueGenres(div['min_unique_genres_in_topn']))
+    for rule in constraints.get('rules') or []:
+        rule = dict(rule)
+        kind = rule.pop('type', None)
+        if kind not in CONSTRAINT_TYPES:
+            raise ValueError(f"Unknown constraint type {kind!r}; registered: {sorted(CONSTRAINT_TYPES)}")
+        parsed.append(CONSTRAINT_TYPES[kind](**rule))
+    return parsed
+
+# --- Evaluation ---
+
+class SelectionStats:
+    """
+    Per-row quantities of a (n, k) selection array (padded with -1), computed
+    lazily from the catalog's bin-code and genre-mask arrays. Ids outside the
+    catalog count as no bin and no genres.
+    """
+
+    def __init__(self, selections, catalog, genre_targets=None):
+        self.selections = np.asarray(selections, dtype=np.int64)
+        self.catalog = catalog
+        self.genre_targets = genre_targets
+        self.valid = self.selections != PAD
+        known = self.valid & (self.selections >= 0) & (self.selections < catalog.num_items)
+        ids = np.where(known, self.selections, 0)
+        self.codes = np.where(known, catalog.bin_codes[ids], -1)
+        self.masks = np.where(known, catalog.genre_masks[ids], 0).astype(catalog.genre_masks.dtype)
+        self._measured = {}
+
+    def bin_count(self, code):
+        if code < 0:
+            return np.zeros(len(self.selections), dtype=np.int64)
+        return (self.codes == code).sum(axis=1)
+
+    @cached_property
+    def unique_genres(self):
+        if self.masks.shape[1] == 0:
+            return np.zeros(len(self.selections), dtype=np.int64)
+        return popcount(np.bitwise_or.reduce(self.masks, axis=1))
+
+    @cached_property
+    def genre_counts(self):
+        """(n, num_genres) items per genre."""
+        shifts = np.arange(len(self.catalog.genre_names), dtype=np.uint64)
+        bits = (self.masks[:, :, None].astype(np.uint64) >> shifts) & np.uint64(1)
+        return bits.sum(axis=1).astype(np.int64)
+
+    @cached_property
+    def duplicates(self):
+        """Repeated entries per row: sum over items of (count - 1)."""
+        ordered = np.sort(self.selections, axis=1)
+        return ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] != PAD)).sum(axis=1)
+
+    def measure(self, key):
+        if key not in self._measured:
+            if isinstance(key, tuple) and key[0] == 'bin':
+                value = self.bin_count(key[1])
+            elif key == 'unique_genres':
+                value = self.unique_genres
+            elif key == 'duplicates':
+                value = self.duplicates
+            elif key == 'max_genre_count':
+                counts = self.genre_counts
+                value = counts.max(axis=1) if counts.shape[1] else np.zeros(len(counts), dtype=np.int64)
+            elif key == 'genre_distance':
+                counts = self.genre_counts.astype(np.float64)
+                totals = counts.sum(axis=1, keepdims=True)
+                shares = np.divide(counts, totals, out=np.zeros_like(counts), where=totals > 0)
+                value = 0.5 * np.abs(shares - self.genre_targets).sum(axis=1)
+            else:
+                raise KeyError(f"Unknown quantity {key!r}")
+            self._measured[key] = value
+        return self._measured[key]
+
+class GreedyState:
+    """Running counts of a greedy selection (bins, genres, chosen items)."""
+
+    def __init__(self):
+        self.items = set()
+        self.bin_counts = {}
+        self.genre_counts = {}
+        self.covered = 0
+
+    def add(self, item, code, mask):
+        self.items.add(item)
+        self.bin_counts[code] = self.bin_counts.get(code, 0) + 1
+        self.covered |= mask
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            self.genre_counts[bit] = self.genre_counts.get(bit, 0) + 1
+
+class ConstraintPlan:
+    """
+    A constraints config compiled against one catalog: the constraint list
+    with bins/genres resolved to codes. Shared by verify_certificate,
+    check_feasibility, the constrained greedy solver, verify_batch and
+    SelectionState, so the config is walked once per catalog.
+    """
+
+    def __init__(self, constraints, catalog, key=None):
+        self.catalog = catalog
+        self.constraints = [c.bind(catalog) for c in constraints]
+        # Digest of the compiled config (compile_constraints), for result caches
+        self.key = key
+
+    def quantities(self):
+        return [c.quantity() for c in self.constraints]
+
+    def evaluate(self, selections, in_window=None, genre_targets=None):
+        """
+        Checks a (n, k) selection array (padded with -1).
+        in_window: optional (n, k) bool membership; a row with an item outside
+        fails with only REASON_NOT_IN_WINDOW (as verify_certificate).
+        genre_targets: optional (n, num_genres) targets for genre_calibration.
+        Returns {'pass', 'reasons', 'violated' (n, C), 'values' (n, C), 'stats'}.
+        """
+        for c in self.constraints:
+            if isinstance(c, GenreCalibration) and genre_targets is None:
+                genre_targets = c.target
+        stats = SelectionStats(selections, self.catalog, genre_targets=genre_targets)
+        n = len(stats.selections)
+        values = np.zeros((n, len(self.constraints)), dtype=np.float64)
+        violated = np.zeros((n, len(self.constraints)), dtype=bool)
+        reasons = np.zeros(n, dtype=np.int64)
+        for j, c in enumerate(self.constraints):
+            values[:, j] = stats.measure(c.quantity())
+            violated[:, j] = c.violated(values[:, j])
+            reasons |= np.where(violated[:, j], c.reason, 0)
+        if in_window is not None:
+            outside = (stats.valid & ~np.asarray(in_window, dtype=bool)).any(axis=1)
+            reasons = np.where(outside, REASON_NOT_IN_WINDOW, reasons)
+        return {'pass': reasons == 0, 'reasons': reasons, 'violated': violated, 'values': values, 'stats': stats}
+
+    def messages(self, result, i):
+        """Reason strings of row i, in constraint order (as verify_certificate)."""
+        return [
+            c.message(result['values'][i, j])
+            for j, c in enumerate(self.constraints) if result['violated'][i, j]
+        ]
+
+    def window_check(self, window_ids, top_n=10):
+        """
+        Necessary conditions for some top_n subset of window_ids to pass;
+        returns the failing reason names (e.g. 'tail_shortage').
+        """
+        stats = SelectionStats(np.asarray(window_ids, dtype=np.int64)[None, :], self.catalog)
+        reasons = []
+        for c in self.constraints:
+            reason = c.window_fail(stats, top_n)
+            if reason:
+                reasons.append(reason)
+        return reasons
+
+    def greedy(self, item_ids, top_n=10):
+        """
+        Walks item_ids in order (best first) and keeps an item unless a 'max'
+        constraint blocks it; once the remaining slots are needed by unmet
+        'min' constraints, only items that advance one of them are taken.
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        stats = SelectionStats(item_ids[None, :], self.catalog)
+        maxes = [c for c in self.constraints if c.kind == 'max']
+        mins = [c for c in self.constraints if c.kind == 'min']
+        state = GreedyState()
+        selected = []
+        for item, code, mask in zip(item_ids.tolist(), stats.codes[0].tolist(), stats.masks[0].tolist()):
+            if len(selected) >= top_n:
+                break
+            if any(c.blocks(state, item, code, mask) for c in maxes):
+                continue
+            slots_rem = top_n - len(selected)
+            needed = sum(c.need(state) for c in mins)
+            if slots_rem <= needed and not any(c.need(state) and c.contributes(state, item, code, mask) for c in mins):
+                continue
+            selected.append(item)
+            state.add(item, code, mask)
+        return selected
+
+_PLANS = weakref.WeakKeyDictionary()
+
+def compile_constraints(constraints, catalog):
+    """
+    ConstraintPlan for a constraints dict (config['constraints'] layout, or a
+    certificate's constraints) on catalog (ItemCatalog or items frame).
+    Plans are cached per catalog and config, so hot loops compile once.
+    """
+    catalog = as_catalog(catalog)
+    key = json.dumps(constraints or {}, sort_keys=True, default=str)
+    plans = _PLANS.setdefault(catalog, {})
+    if key not in plans:
+        digest = hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+        plans[key] = ConstraintPlan(parse_constraints(constraints), catalog, key=digest)
+    return plans[key]
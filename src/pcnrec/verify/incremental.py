@@ -0,0 +1,297 @@
+import numpy as np
+from pcnrec.data.catalog import as_catalog, popcount
+from pcnrec.verify.constraints import ConstraintPlan, compile_constraints, REASON_NOT_IN_WINDOW
+
+# Quantities SelectionState can maintain under swaps (see Constraint.quantity), besides bin counts
+INCREMENTAL_QUANTITIES = ('unique_genres', 'duplicates', 'max_genre_count')
+
+def _lookup_counts(counts, items, keys=None):
+    """counts[i] (0 if absent) for each i in items, via searchsorted; keys: sorted ids with count 1."""
+    if keys is None:
+        keys = np.fromiter(counts.keys(), dtype=np.int64, count=len(counts))
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        order = np.argsort(keys)
+        keys, values = keys[order], values[order]
+    else:
+        values = np.ones(len(keys), dtype=np.int64)
+    if len(keys) == 0:
+        return np.zeros(len(items), dtype=np.int64)
+    pos = np.minimum(np.searchsorted(keys, items), len(keys) - 1)
+    return np.where(keys[pos] == items, values[pos], 0)
+
+class SelectionState:
+    """
+    Running constraint state of one selection, for swap-based search.
+
+    Holds per-bin counts, per-item and per-genre multiplicities, and two
+    genre bitmasks (genres covered at least once / exactly once), so that
+    swap_status(out_item, in_item) answers "constraint status after swapping
+    out_item for in_item" with a handful of integer ops (O(genres) for
+    max_per_genre), without touching the selection. apply_swap updates the
+    state in O(genres of the two items), and swap_violations scores every
+    (selected, window) swap in one NumPy pass.
+
+    Constraints come from a compiled ConstraintPlan (or a constraints dict);
+    every type except genre_calibration is supported. Status is the REASON_*
+    bit flags of verify.constraints (0 = pass), and matches verify_certificate
+    on the same selection, constraints and window.
+    """
+
+    def __init__(self, catalog, constraints, item_ids=(), shown=None):
+        """
+        catalog:     ItemCatalog (or items frame)
+        constraints: ConstraintPlan, or constraints dict (config['constraints'] layout)
+        shown:       optional candidate-window ids; items outside it set REASON_NOT_IN_WINDOW
+        """
+        self.catalog = as_catalog(catalog)
+        self.plan = constraints if isinstance(constraints, ConstraintPlan) else compile_constraints(constraints, self.catalog)
+        for c in self.plan.constraints:
+            q = c.quantity()
+            if not (q in INCREMENTAL_QUANTITIES or (isinstance(q, tuple) and q[0] == 'bin')):
+                raise ValueError(f"{c.type} constraints cannot be evaluated incrementally")
+        self.shown = set(int(i) for i in shown) if shown is not None else None
+        self._shown_sorted = np.array(sorted(self.shown), dtype=np.int64) if shown is not None else None
+        self.num_genres = len(self.catalog.genre_names)
+        self._track_max_genre = self.num_genres > 0 and any(c.quantity() == 'max_genre_count' for c in self.plan.constraints)
+        self._attr_cache = {}
+
+        self.items = []
+        self.item_counts = {}
+        self.bin_counts = {}
+        self.genre_counts = np.zeros(self.num_genres, dtype=np.int64)
+        self.covered = 0        # genres with count >= 1
+        self.single = 0         # genres with count == 1
+        self.unique_genres = 0
+        self.duplicates = 0     # sum over items of (count - 1)
+        self.outside = 0        # items not in shown
+        for item in item_ids:
+            self.add(item)
+
+    def _attrs(self, item):
+        """(bin code, genre mask) of an item; unknown ids have none."""
+        attrs = self._attr_cache.get(item)
+        if attrs is None:
+            if 0 <= item < self.catalog.num_items:
+                attrs = (int(self.catalog.bin_codes[item]), int(self.catalog.genre_masks[item]))
+            else:
+                attrs = (-1, 0)
+            self._attr_cache[item] = attrs
+        return attrs
+
+    def _bin_count(self, code):
+        return self.bin_counts.get(code, 0) if code >= 0 else 0
+
+    def _quantities(self):
+        return {
+            'unique_genres': self.unique_genres,
+            'duplicates': self.duplicates,
+            'max_genre_count': int(self.genre_counts.max()) if self._track_max_genre else 0
+        }
+
+    def _value(self, c, quantities, bin_counts):
+        q = c.quantity()
+        return bin_counts(q[1]) if isinstance(q, tuple) else quantities[q]
+
+    def _status(self, quantities, bin_counts, outside):
+        if outside:
+            return REASON_NOT_IN_WINDOW
+        status = 0
+        for c in self.plan.constraints:
+            if c.violated(self._value(c, quantities, bin_counts)):
+                status |= c.reason
+        return status
+
+    def _violation(self, quantities, bin_counts, outside):
+        v = outside
+        for c in self.plan.constraints:
+            v = v + c.shortfall(self._value(c, quantities, bin_counts))
+        return v
+
+    def status(self):
+        return self._status(self._quantities(), self._bin_count, self.outside)
+
+    def violation(self):
+        """Total constraint shortfall (0 iff status() == 0): a search objective."""
+        return int(self._violation(self._quantities(), self._bin_count, self.outside))
+
+    @staticmethod
+    def _genre_bits(mask):
+        """(bit, genre index) for each set bit of mask."""
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            yield bit, bit.bit_length() - 1
+
+    def add(self, item):
+        item = int(item)
+        code, mask = self._attrs(item)
+        count = self.item_counts.get(item, 0)
+        self.item_counts[item] = count + 1
+        self.duplicates += count > 0
+        self.outside += self.shown is not None and item not in self.shown
+        self.bin_counts[code] = self.bin_counts.get(code, 0) + 1
+        for bit, j in self._genre_bits(mask):
+            self.genre_counts[j] += 1
+            if self.genre_counts[j] == 1:
+                self.covered |= bit
+                self.single |= bit
+                self.unique_genres += 1
+            elif self.genre_counts[j] == 2:
+                self.single &= ~bit
+        self.items.append(item)
+
+    def remove(self, item):
+        item = int(item)
+        count = self.item_counts.get(item, 0)
+        if count == 0:
+            raise KeyError(f"item {item} is not in the selection")
+        code, mask = self._attrs(item)
+        if count == 1:
+            del self.item_counts[item]
+        else:
+            self.item_counts[item] = count - 1
+        self.duplicates -= count > 1
+        self.outside -= self.shown is not None and item not in self.shown
+        self.bin_counts[code] -= 1
+        for bit, j in self._genre_bits(mask):
+            self.genre_counts[j] -= 1
+            if self.genre_counts[j] == 0:
+                self.covered &= ~bit
+                self.single &= ~bit
+                self.unique_genres -= 1
+            elif self.genre_counts[j] == 1:
+                self.single |= bit
+        self.items.remove(item)
+
+    def _after_swap(self, out_item, in_item):
+        """(quantities, bin count function, outside) if out_item were replaced by in_item."""
+        out_item, in_item = int(out_item), int(in_item)
+        if out_item not in self.item_counts:
+            raise KeyError(f"item {out_item} is not in the selection")
+        if out_item == in_item:
+            return self._quantities(), self._bin_count, self.outside
+        out_code, out_mask = self._attrs(out_item)
+        in_code, in_mask = self._attrs(in_item)
+
+        # Genres only out_item covers are lost; genres new to the selection are gained
+        lost = out_mask & ~in_mask & self.single
+        gained = in_mask & ~out_mask & ~self.covered
+        quantities = {
+            'unique_genres': self.unique_genres - bin(lost).count('1') + bin(gained).count('1'),
+            'duplicates': self.duplicates - (self.item_counts[out_item] > 1) + (self.item_counts.get(in_item, 0) > 0),
+            'max_genre_count': 0
+        }
+        if self._track_max_genre:
+            counts = self.genre_counts.copy()
+            for _, j in self._genre_bits(out_mask):
+                counts[j] -= 1
+            for _, j in self._genre_bits(in_mask):
+                counts[j] += 1
+            quantities['max_genre_count'] = int(counts.max())
+
+        def bin_counts(code):
+            return self._bin_count(code) - (out_code == code) + (in_code == code) if code >= 0 else 0
+
+        outside = self.outside
+        if self.shown is not None:
+            outside += (in_item not in self.shown) - (out_item not in self.shown)
+        return quantities, bin_counts, outside
+
+    def swap_status(self, out_item, in_item):
+        """status() after replacing one occurrence of out_item by in_item (state unchanged)."""
+        return self._status(*self._after_swap(out_item, in_item))
+
+    def swap_violation(self, out_item, in_item):
+        """violation() after replacing out_item by in_item (state unchanged)."""
+        return int(self._violation(*self._after_swap(out_item, in_item)))
+
+    def _item_arrays(self, items):
+        """(bin codes, uint64 genre masks) for an id array; unknown ids have none."""
+        known = (items >= 0) & (items < self.catalog.num_items)
+        ids = np.where(known, items, 0)
+        codes = np.where(known, self.catalog.bin_codes[ids], -1)
+        masks = np.where(known, self.catalog.genre_masks[ids], 0).astype(np.uint64)
+        return codes, masks
+
+    def swap_violations(self, out_items, in_items):
+        """
+        swap_violation(o, i) for every o in out_items and i in in_items, as one
+        broadcasted pass over the catalog arrays. Returns an int64 array of
+        shape (len(in_items),) for a single out item, else (len(out_items), len(in_items)).
+        """
+        scalar = np.ndim(out_items) == 0
+        out_items = np.atleast_1d(np.asarray(out_items, dtype=np.int64))
+        in_items = np.asarray(in_items, dtype=np.int64)
+        out_counts = _lookup_counts(self.item_counts, out_items)
+        if (out_counts == 0).any():
+            raise KeyError(f"items {out_items[out_counts == 0].tolist()} are not in the selection")
+        shape = (len(out_items), len(in_items))
+
+        out_code, out_mask = (a[:, None] for a in self._item_arrays(out_items))
+        in_code, in_mask = (a[None, :] for a in self._item_arrays(in_items))
+        # Genres only the out item covers are lost; genres new to the selection are gained
+        lost = out_mask & ~in_mask & np.uint64(self.single)
+        gained = in_mask & ~out_mask & ~np.uint64(self.covered)
+        quantities = {'unique_genres': self.unique_genres - popcount(lost) + popcount(gained)}
+
+        # Multiplicity of each in-item once the out item is removed
+        same = out_items[:, None] == in_items[None, :]
+        present = _lookup_counts(self.item_counts, in_items)[None, :] - same
+        quantities['duplicates'] = self.duplicates - (out_counts > 1)[:, None] + (present > 0)
+
+        if self._track_max_genre:
+            shifts = np.arange(self.num_genres, dtype=np.uint64)
+            out_bits = ((out_mask[:, :, None] >> shifts) & np.uint64(1)).astype(np.int64)
+            in_bits = ((in_mask[:, :, None] >> shifts) & np.uint64(1)).astype(np.int64)
+            quantities['max_genre_count'] = (self.genre_counts - out_bits + in_bits).max(axis=2)
+        else:
+            quantities['max_genre_count'] = np.zeros(shape, dtype=np.int64)
+
+        def bin_counts(code):
+            if code < 0:
+                return np.zeros(shape, dtype=np.int64)
+            return self._bin_count(code) - (out_code == code) + (in_code == code)
+
+        outside = np.full(shape, self.outside, dtype=np.int64)
+        if self.shown is not None:
+            in_out = _lookup_counts(None, in_items, keys=self._shown_sorted) == 0
+            out_out = _lookup_counts(None, out_items, keys=self._shown_sorted) == 0
+            outside += in_out[None, :].astype(np.int64) - out_out[:, None]
+
+        v = np.broadcast_to(self._violation(quantities, bin_counts, outside), shape).astype(np.int64)
+        return v[0] if scalar else v
+
+    def apply_swap(self, out_item, in_item):
+        """Replaces out_item by in_item in place (keeps its position); returns the new status."""
+        position = self.items.index(int(out_item))
+        self.remove(out_item)
+        self.add(in_item)
+        self.items.insert(position, self.items.pop())
+        return self.status()
+
+def minimal_edit_repair(selection, window, catalog, constraints, max_swaps=None):
+    """
+    Repairs a selection with as few swaps as the greedy search finds: each step
+    applies the swap (selected item out, unselected window item in) that most
+    reduces the total violation, preferring to drop low-ranked selected items
+    and take high-ranked window items. window: candidate ids, best first.
+    Returns (repaired item list, number of swaps); the list keeps its order.
+    """
+    window = np.asarray(window, dtype=np.int64)
+    state = SelectionState(catalog, constraints, selection, shown=window)
+    max_swaps = len(state.items) if max_swaps is None else max_swaps
+    swaps = 0
+    while swaps < max_swaps and state.violation() > 0:
+        current = state.violation()
+        unselected = window[[int(i) not in state.item_counts for i in window]]
+        if len(unselected) == 0:
+            break
+        # Rows: selected items, lowest-ranked first; first minimum = preferred swap
+        out_items = np.array(state.items[::-1], dtype=np.int64)
+        v = state.swap_violations(out_items, unselected)
+        r, j = np.unravel_index(int(np.argmin(v)), v.shape)
+        if v[r, j] >= current:
+            break
+        state.apply_swap(int(out_items[r]), int(unselected[j]))
+        swaps += 1
+    return list(state.items), swaps
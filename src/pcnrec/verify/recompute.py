@@ -1,10 +1,19 @@
 from typing import List, Dict
+from pcnrec.data.catalog import ItemCatalog
 
 def compute_head_tail_counts(selected_ids: List[int], items_df):
     """
     Computes count of head, torso, tail items in selection.
-    items_df index should be internal_id.
+    items_df index should be internal_id, or items_df is an ItemCatalog.
     """
+    if isinstance(items_df, ItemCatalog):
+        counts = items_df.bin_counts(selected_ids)
+        return {
+            'head': counts.get('head', 0),
+            'torso': counts.get('torso', 0),
+            'tail': counts.get('tail', 0)
+        }
+
     # Create valid subset
     subset = items_df.loc[selected_ids]
     
@@ -20,6 +29,9 @@ def compute_unique_genres(selected_ids: List[int], items_df):
     """
     Computes number of unique genres in selection.
     """
+    if isinstance(items_df, ItemCatalog):
+        return items_df.unique_genres(selected_ids)
+
     subset = items_df.loc[selected_ids]
     
     unique_genres = set()
@@ -1,21 +1,32 @@
-from pcnrec.verify.recompute import compute_head_tail_counts, compute_unique_genres
-from pcnrec.verify.constraints import check_no_duplicates, check_max_head, check_min_tail, check_min_unique_genres
+import numpy as np
+from pcnrec.data.catalog import as_catalog
+from pcnrec.verify.constraints import compile_constraints
+from pcnrec.verify.cache import VerificationCache, get_cache
 from pcnrec.llm.schemas import ProofCertificate
 
-def verify_certificate(certificate: ProofCertificate, items_df, candidates_shown_ids: set):
+def verify_certificate(certificate: ProofCertificate, items_df, candidates_shown_ids: set, cache=None, constraints=None):
     """
-    Verifies the certificate against constraints using trusted items_df.
+    Verifies the certificate against constraints using trusted items_df
+    (the items frame indexed by internal_id, or an ItemCatalog).
     Also checks that selected items are a subset of candidates_shown.
+    constraints: the configured constraints dict (config['constraints'],
+    including rules) to enforce; without it the constraints written into the
+    certificate are used. They are compiled once per catalog
+    (verify.constraints.compile_constraints) and evaluated on its catalog arrays.
+    Results are memoized in cache (default: the shared verify.cache.get_cache()).
     """
     selected_ids = certificate.selected_item_ids
-    config_constraints = certificate.constraints.model_dump()
+    if constraints is not None:
+        config_constraints = constraints
+    else:
+        config_constraints = certificate.constraints.model_dump()
+        if certificate.constraints.rules:
+            config_constraints['rules'] = [r.model_dump(exclude_none=True) for r in certificate.constraints.rules]
     
     reasons = []
-    passed = True
     
     # 0. Subset Check
     if not set(selected_ids).issubset(candidates_shown_ids):
-        passed = False
         reasons.append(f"Selection contains items not in candidate window: {set(selected_ids) - candidates_shown_ids}")
         # Fail hard on this? Yes.
         return {
@@ -24,47 +35,28 @@ def verify_certificate(certificate: ProofCertificate, items_df, candidates_shown
             "recomputed": {}
         }
 
-    # 1. Recompute Stats
-    pop_counts = compute_head_tail_counts(selected_ids, items_df)
-    unique_genres = compute_unique_genres(selected_ids, items_df)
+    # 1. Recompute Stats and 2. Check Constraints, in one plan evaluation
+    catalog = as_catalog(items_df)
+    plan = compile_constraints(config_constraints, catalog)
+    cache = cache if cache is not None else get_cache()
+    key = VerificationCache.key(selected_ids, plan.key, catalog.version())
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    result = plan.evaluate(np.asarray([selected_ids], dtype=np.int64).reshape(1, -1))
+    stats = result['stats']
     
     recomputed = {
-        "head_count": pop_counts['head'],
-        "tail_count": pop_counts['tail'],
-        "unique_genres": unique_genres
+        "head_count": int(stats.bin_count(catalog.bin_code('head'))[0]),
+        "tail_count": int(stats.bin_count(catalog.bin_code('tail'))[0]),
+        "unique_genres": int(stats.unique_genres[0])
     }
+    reasons = plan.messages(result, 0)
 
-    # 2. Check Constraints
-    
-    # Safety: No Duplicates
-    if config_constraints.get('safety', {}).get('no_duplicates', True):
-        if not check_no_duplicates(selected_ids):
-            passed = False
-            reasons.append("Duplicate items found.")
-
-    # Popularity: Max Head
-    max_head = config_constraints.get('popularity', {}).get('max_head_in_topn')
-    if max_head is not None:
-        if not check_max_head(pop_counts['head'], max_head):
-            passed = False
-            reasons.append(f"Too many head items: {pop_counts['head']} > {max_head}")
-
-    # Popularity: Min Tail
-    min_tail = config_constraints.get('popularity', {}).get('min_tail_in_topn')
-    if min_tail is not None:
-        if not check_min_tail(pop_counts['tail'], min_tail):
-            passed = False
-            reasons.append(f"Too few tail items: {pop_counts['tail']} < {min_tail}")
-
-    # Diversity: Min Unique Genres
-    min_genres = config_constraints.get('diversity', {}).get('min_unique_genres_in_topn')
-    if min_genres is not None:
-        if not check_min_unique_genres(unique_genres, min_genres):
-            passed = False
-            reasons.append(f"Low diversity: {unique_genres} < {min_genres} unique genres")
-
-    return {
-        "pass": passed,
+    verification = {
+        "pass": bool(result['pass'][0]),
         "reasons": reasons,
         "recomputed": recomputed
     }
+    cache.put(key, verification)
+    return verification